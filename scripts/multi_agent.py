@@ -7,16 +7,50 @@
 - 5个专业Agent各司其职
 - Ultrawork模式：并行执行
 - Ralph Loop：死磕到底（自动重试）
+- Workflow：按 DAG 依赖编排多代理步骤，上游输出传给下游，独立分支并发
 - 真正启动OpenClaw子代理会话
 - 轮询检查会话状态
+- 异步引擎：并行模式下所有代理同时启动、同时监控
+- 任务存储：追加写日志 + 定期压缩快照，支持多进程并发
+- 可选 SQLite 存储：按状态/代理/时间索引查询（MULTI_AGENT_STORE=sqlite）
+- 自适应轮询：指数退避 + 抖动，按代理历史耗时预测下次检查时机
+- 调度器：按代理优先级排队，全局/按模型限制并发会话数
+- 守护进程：serve 常驻运行所有编排循环，CLI 通过 Unix socket 提交任务
+- Ralph 检查点：失败后提取上次会话的进展和障碍，下次尝试接着做
+- Ralph 对冲：尝试超过历史耗时 p90 仍未结束时并行启动备份尝试，先完成者胜出
+- 崩溃恢复：所属进程已退出的 running 任务自动对账，续等存活会话、清理僵尸任务
+- 输出协议：优先解析 openclaw --json 结构化输出，文本输出用预编译正则一次扫描
+- 指标：启动/运行/发现延迟直方图和 fork/重试/超时计数，metrics 汇总 p50/p95，支持 Prometheus 导出
+- 结果缓存：--cache-ttl 开启，相同代理/模型/提示词的已完成结果在 TTL 内直接复用
+- 取消与截止时间：--deadline / --fail-fast / Ctrl-C / cancel 命令立即终止任务的所有在途会话
 """
 
+import argparse
+import asyncio
+import fcntl
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import os
+import random
+import re
+import signal
+import socket
+import sqlite3
 import time
-import subprocess
 import sys
-from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 # Agent 配置
 AGENTS = {
@@ -63,144 +97,1653 @@ AGENTS = {
 }
 
 # 任务状态存储
+# 快照文件保存完整状态，日志文件逐行追加每次变更，超过阈值后合并进快照
 TASK_STATE_FILE = Path("~/.openclaw/workspace/.multi_agent_tasks.json").expanduser()
+TASK_JOURNAL_FILE = TASK_STATE_FILE.with_suffix(".journal")
+TASK_LOCK_FILE = TASK_STATE_FILE.with_suffix(".lock")
+JOURNAL_COMPACT_THRESHOLD = 200
+
+# 可选 SQLite 存储引擎：export MULTI_AGENT_STORE=sqlite
+TASK_DB_FILE = TASK_STATE_FILE.with_suffix(".db")
+TASK_STORE_BACKEND = os.environ.get("MULTI_AGENT_STORE", "journal")
+
+def _subtask_items(task):
+    """按代理执行的子任务记录：ultrawork 的 subtasks 和 workflow 的 steps，产出 (代理, 记录)"""
+    yield from task.get("subtasks", {}).items()
+    for step in task.get("steps", {}).values():
+        yield step.get("agent"), step
+
+def _task_agents(task):
+    """任务涉及的代理列表"""
+    if task.get("agent"):
+        return [task["agent"]]
+    return list(dict.fromkeys(agent for agent, _ in _subtask_items(task))) or list(task.get("agents") or [])
+
+def _elapsed_seconds(started_at, completed_at):
+    """两个 ISO 时间之间的秒数，缺失时返回 None"""
+    if not started_at or not completed_at:
+        return None
+    return (datetime.fromisoformat(completed_at) - datetime.fromisoformat(started_at)).total_seconds()
+
+def _collect_durations(tasks, agent):
+    """从任务记录中收集某代理已完成工作的耗时（秒）"""
+    durations = []
+    for task in tasks:
+        if task.get("agent") == agent:
+            for att in task.get("attempts", []):
+                if att.get("status") == "completed" and att.get("duration") is not None:
+                    durations.append(att["duration"])
+        for info_agent, info in _subtask_items(task):
+            if info_agent == agent and info.get("status") == "completed":
+                seconds = _elapsed_seconds(info.get("started_at"), info.get("completed_at"))
+                if seconds is not None:
+                    durations.append(seconds)
+    return durations
+
+def _task_matches(task, status=None, agent=None, since=None):
+    """判断任务是否满足查询条件"""
+    if status and task.get("status") != status:
+        return False
+    if agent and agent not in _task_agents(task):
+        return False
+    if since and (task.get("started_at") or "") < since:
+        return False
+    return True
+
+class TaskStore:
+    """
+    追加写任务存储
+    
+    - 每次写入只追加一行 JSONL（task_id + 该任务最新记录），与历史任务数量无关
+    - 读取时从快照 + 日志尾部重建，内存索引按 task_id 存放
+    - flock 文件锁保证多个 CLI 进程并发写入安全
+    """
+    
+    def __init__(self, snapshot_file, journal_file, lock_file, compact_threshold=JOURNAL_COMPACT_THRESHOLD):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.lock_file = lock_file
+        self.compact_threshold = compact_threshold
+        self._index = {}
+        self._snapshot_sig = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+    
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """加文件锁（写入用排他锁，读取用共享锁）"""
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _snapshot_signature(self):
+        try:
+            st = self.snapshot_file.stat()
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def _refresh(self):
+        """同步内存索引：快照变化（被其他进程压缩）则全量重建，否则只读日志新增部分"""
+        sig = self._snapshot_signature()
+        if sig != self._snapshot_sig:
+            self._index = {}
+            if sig is not None:
+                with open(self.snapshot_file, 'r') as f:
+                    self._index = json.load(f)
+            self._snapshot_sig = sig
+            self._journal_offset = 0
+            self._journal_entries = 0
+        
+        if not self.journal_file.exists():
+            self._journal_offset = 0
+            self._journal_entries = 0
+            return
+        
+        if self.journal_file.stat().st_size < self._journal_offset:
+            # 日志被截断但快照未变（异常情况），全量重建
+            self._snapshot_sig = None
+            return self._refresh()
+        
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self._journal_offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # 写入中断留下的半行，等待下次读取
+                    break
+                self._journal_offset += len(raw)
+                try:
+                    entry = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                self._index[entry["task_id"]] = entry["task"]
+                self._journal_entries += 1
+    
+    def load(self):
+        """返回所有任务（task_id -> 任务记录）"""
+        with self._locked(exclusive=False):
+            self._refresh()
+        return dict(self._index)
+    
+    def get(self, task_id):
+        """按 task_id 读取单个任务"""
+        with self._locked(exclusive=False):
+            self._refresh()
+        return self._index.get(task_id)
+    
+    def put(self, task_id, task):
+        """追加一条任务记录，O(1) 写入"""
+        line = json.dumps({"task_id": task_id, "task": task}, default=str) + "\n"
+        with self._locked():
+            with open(self.journal_file, 'a') as f:
+                f.write(line)
+            self._refresh()
+            if self._journal_entries >= self.compact_threshold:
+                self._write_snapshot()
+    
+    def query(self, status=None, agent=None, since=None, limit=None, offset=0):
+        """
+        按条件查询任务，按开始时间倒序
+        返回: (total, [(task_id, task), ...])
+        """
+        matched = [
+            (tid, task) for tid, task in self.load().items()
+            if _task_matches(task, status, agent, since)
+        ]
+        matched.sort(key=lambda item: item[1].get("started_at") or "", reverse=True)
+        end = offset + limit if limit else None
+        return len(matched), matched[offset:end]
+    
+    def durations(self, agent, limit=50):
+        """代理最近完成工作的耗时（秒）"""
+        return _collect_durations(self.load().values(), agent)[-limit:]
+    
+    def replace_all(self, tasks):
+        """用完整任务集合覆盖存储"""
+        with self._locked():
+            self._index = dict(tasks)
+            self._write_snapshot()
+    
+    def compact(self):
+        """把日志合并进快照"""
+        with self._locked():
+            self._refresh()
+            self._write_snapshot()
+    
+    def _write_snapshot(self):
+        # 先写临时文件再原子替换，避免中途崩溃损坏快照
+        tmp = self.snapshot_file.with_suffix(".json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self._index, f, indent=2, default=str)
+        os.replace(tmp, self.snapshot_file)
+        with open(self.journal_file, 'w'):
+            pass
+        self._snapshot_sig = self._snapshot_signature()
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+class SQLiteTaskStore:
+    """
+    SQLite 任务存储
+    
+    tasks / subtasks / attempts 三张表，按 status、type、agent、started_at 建索引，
+    status 查询只读取命中的行。每个任务的完整记录另存一份 JSON，读取时原样还原。
+    """
+    
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id TEXT PRIMARY KEY,
+        type TEXT,
+        status TEXT,
+        agent TEXT,
+        description TEXT,
+        started_at TEXT,
+        completed_at TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS subtasks (
+        task_id TEXT NOT NULL,
+        agent TEXT NOT NULL,
+        session TEXT,
+        status TEXT,
+        started_at TEXT,
+        completed_at TEXT,
+        PRIMARY KEY (task_id, agent)
+    );
+    CREATE TABLE IF NOT EXISTS attempts (
+        task_id TEXT NOT NULL,
+        attempt INTEGER NOT NULL,
+        session TEXT,
+        status TEXT,
+        duration INTEGER,
+        completed_at TEXT,
+        PRIMARY KEY (task_id, attempt)
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+    CREATE INDEX IF NOT EXISTS idx_tasks_type ON tasks (type);
+    CREATE INDEX IF NOT EXISTS idx_tasks_agent ON tasks (agent);
+    CREATE INDEX IF NOT EXISTS idx_tasks_started_at ON tasks (started_at);
+    CREATE INDEX IF NOT EXISTS idx_subtasks_agent ON subtasks (agent);
+    CREATE INDEX IF NOT EXISTS idx_subtasks_status ON subtasks (status);
+    CREATE INDEX IF NOT EXISTS idx_attempts_status ON attempts (status);
+    """
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+    
+    @property
+    def conn(self):
+        if self._conn is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_file), timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+    
+    def load(self):
+        rows = self.conn.execute("SELECT task_id, data FROM tasks ORDER BY started_at")
+        return {tid: json.loads(data) for tid, data in rows}
+    
+    def get(self, task_id):
+        row = self.conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put(self, task_id, task):
+        with self.conn:
+            self._write(task_id, task)
+    
+    def _write(self, task_id, task):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, task.get("type"), task.get("status"), task.get("agent"),
+             task.get("description"), task.get("started_at"), task.get("completed_at"),
+             json.dumps(task, default=str))
+        )
+        self.conn.execute("DELETE FROM subtasks WHERE task_id = ?", (task_id,))
+        # workflow 中同一代理可能有多个步骤，索引表每个代理只保留最后一个
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO subtasks VALUES (?, ?, ?, ?, ?, ?)",
+            [(task_id, agent, info.get("session"), info.get("status"),
+              info.get("started_at"), info.get("completed_at"))
+             for agent, info in _subtask_items(task)]
+        )
+        self.conn.execute("DELETE FROM attempts WHERE task_id = ?", (task_id,))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO attempts VALUES (?, ?, ?, ?, ?, ?)",
+            [(task_id, att.get("attempt"), att.get("session"), att.get("status"),
+              att.get("duration"), att.get("completed_at"))
+             for att in task.get("attempts", [])]
+        )
+    
+    def query(self, status=None, agent=None, since=None, limit=None, offset=0):
+        """按条件查询任务，按开始时间倒序，返回: (total, [(task_id, task), ...])"""
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if agent:
+            where.append("(agent = ? OR task_id IN (SELECT task_id FROM subtasks WHERE agent = ?))")
+            params += [agent, agent]
+        if since:
+            where.append("started_at >= ?")
+            params.append(since)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        
+        total = self.conn.execute(f"SELECT COUNT(*) FROM tasks{clause}", params).fetchone()[0]
+        sql = f"SELECT task_id, data FROM tasks{clause} ORDER BY started_at DESC"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        rows = self.conn.execute(sql, params)
+        return total, [(tid, json.loads(data)) for tid, data in rows]
+    
+    def durations(self, agent, limit=50):
+        """代理最近完成工作的耗时（秒）"""
+        rows = self.conn.execute(
+            """
+            SELECT duration FROM (
+                SELECT a.duration AS duration, a.completed_at AS completed_at
+                FROM attempts a JOIN tasks t ON t.task_id = a.task_id
+                WHERE t.agent = ? AND a.status = 'completed' AND a.duration IS NOT NULL
+                UNION ALL
+                SELECT (julianday(completed_at) - julianday(started_at)) * 86400, completed_at FROM subtasks
+                WHERE agent = ? AND status = 'completed' AND completed_at IS NOT NULL
+            )
+            ORDER BY completed_at DESC
+            LIMIT ?
+            """,
+            (agent, agent, limit)
+        )
+        return [row[0] for row in rows]
+    
+    def replace_all(self, tasks):
+        with self.conn:
+            for table in ("tasks", "subtasks", "attempts"):
+                self.conn.execute(f"DELETE FROM {table}")
+            for task_id, task in tasks.items():
+                self._write(task_id, task)
+
+def _open_task_store(backend=TASK_STORE_BACKEND):
+    """按配置选择存储引擎"""
+    if backend == "sqlite":
+        return SQLiteTaskStore(TASK_DB_FILE)
+    return TaskStore(TASK_STATE_FILE, TASK_JOURNAL_FILE, TASK_LOCK_FILE)
+
+_task_store = _open_task_store()
 
 def load_tasks():
     """加载任务状态"""
-    if TASK_STATE_FILE.exists():
-        with open(TASK_STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return _task_store.load()
+
+def save_task(task_id, task):
+    """保存单个任务状态（追加写）"""
+    _task_store.put(task_id, task)
 
 def save_tasks(tasks):
-    """保存任务状态"""
-    with open(TASK_STATE_FILE, 'w') as f:
-        json.dump(tasks, f, indent=2, default=str)
+    """保存完整任务状态（重写快照）"""
+    _task_store.replace_all(tasks)
 
-def get_session_status(session_key):
-    """获取会话状态"""
+def migrate_tasks():
+    """一次性把 JSON 任务存储（快照 + 日志）导入 SQLite"""
+    source = _open_task_store("journal")
+    target = SQLiteTaskStore(TASK_DB_FILE)
+    tasks = source.load()
+    with target.conn:
+        for task_id, task in tasks.items():
+            target._write(task_id, task)
+    print(f"✅ 已迁移 {len(tasks)} 个任务到 {TASK_DB_FILE}")
+    print("   启用 SQLite 存储: export MULTI_AGENT_STORE=sqlite")
+    return len(tasks)
+
+# 当前这一秒内已发出、可能还没写入存储的任务 ID；ID 带秒数，换秒即清空，常驻进程里不累积
+_issued_task_ids = set()
+_issued_second = None
+
+def new_task_id(prefix):
+    """生成任务 ID，同一秒内并发启动的任务追加进程号（及序号）避免冲突"""
+    global _issued_second
+    second = int(time.time())
+    if second != _issued_second:
+        _issued_second = second
+        _issued_task_ids.clear()
+    base = f"{prefix}_{second}"
+    task_id = base
+    n = 1
+    while task_id in _issued_task_ids or _task_store.get(task_id) is not None:
+        task_id = f"{base}_{os.getpid()}" if n == 1 else f"{base}_{os.getpid()}_{n}"
+        n += 1
+    _issued_task_ids.add(task_id)
+    return task_id
+
+# ==================== 指标 ====================
+
+# 直方图分桶（秒）：覆盖秒级的启动耗时到半小时的长任务
+METRICS_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+# 守护进程的 HTTP 指标端口（0 表示不开启）和定期写入的 Prometheus textfile（空表示不写）
+METRICS_PORT = int(os.environ.get("MULTI_AGENT_METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.environ.get("MULTI_AGENT_METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = 15
+
+# 指标名 → (类型, 说明)，导出顺序即此顺序
+METRIC_HELP = {
+    "multi_agent_spawn_seconds": ("histogram", "openclaw sessions spawn 耗时"),
+    "multi_agent_run_seconds": ("histogram", "会话从启动到结束的耗时"),
+    "multi_agent_detect_lag_seconds": ("histogram", "会话结束到被轮询发现的延迟（上界）"),
+    "multi_agent_sessions_total": ("counter", "已结束的会话数（按结果）"),
+    "multi_agent_polls_total": ("counter", "状态轮询次数"),
+    "multi_agent_retries_total": ("counter", "Ralph 重试次数"),
+    "multi_agent_timeouts_total": ("counter", "超时的会话数"),
+    "multi_agent_rejected_total": ("counter", "排队已满、未获准启动的会话数"),
+    "multi_agent_openclaw_forks_total": ("counter", "fork openclaw 子进程次数"),
+    "multi_agent_cache_hits_total": ("counter", "结果缓存命中次数"),
+    "multi_agent_cache_misses_total": ("counter", "结果缓存未命中次数"),
+}
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+class MetricsRegistry:
+    """
+    进程内指标：计数器 + 直方图，按 Prometheus 文本格式导出
+    每个序列以 (指标名, 排序后的标签) 为键
+    """
+    
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+    
+    def render(self):
+        """导出 Prometheus 文本格式"""
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            series = self.histograms if kind == "histogram" else self.counters
+            keys = sorted(key for key in series if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = key[1]
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(series[key])}")
+                    continue
+                hist = series[key]
+                for bound, count in zip(self.buckets, hist["buckets"]):
+                    le = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(le)} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+_metrics = MetricsRegistry()
+
+def _count_fork(args):
+    """记录一次 openclaw 调用，按子命令（spawn/status/history/kill）分类"""
+    _metrics.inc("multi_agent_openclaw_forks_total", command=args[2] if len(args) > 2 else args[-1])
+
+def _record_run_seconds(record):
+    if record.get("duration") is not None:
+        return record["duration"]
+    return _elapsed_seconds(record.get("started_at"), record.get("completed_at"))
+
+def _observe_record(registry, agent, record, retry=False):
+    """把一条已结束的子任务/尝试记录计入指标"""
+    model = AGENTS.get(agent, {}).get("model", "")
+    status = record.get("status", "unknown")
+    stats = record.get("stats") or {}
+    registry.inc("multi_agent_sessions_total", agent=agent, model=model, status=status)
+    if stats.get("spawn_seconds") is not None:
+        registry.observe("multi_agent_spawn_seconds", stats["spawn_seconds"], agent=agent, model=model)
+    run_seconds = _record_run_seconds(record)
+    if record.get("session") and run_seconds is not None:
+        registry.observe("multi_agent_run_seconds", run_seconds, agent=agent, model=model, status=status)
+    if stats.get("detect_lag") is not None:
+        registry.observe("multi_agent_detect_lag_seconds", stats["detect_lag"], agent=agent)
+    if stats.get("polls"):
+        registry.inc("multi_agent_polls_total", stats["polls"], agent=agent)
+    if retry:
+        registry.inc("multi_agent_retries_total", agent=agent)
+    if status == "timeout":
+        registry.inc("multi_agent_timeouts_total", agent=agent)
+    if record.get("rejected"):
+        registry.inc("multi_agent_rejected_total", agent=agent)
+
+def _finished_records(task):
+    """遍历任务中已结束的子任务/尝试，产出 (代理, 记录, 是否为重试)"""
+    # 命中缓存的记录没有真正运行会话，不计入
+    if task.get("type") == "ralph_loop":
+        for att in task.get("attempts", []):
+            if not att.get("cached"):
+                yield task.get("agent"), att, att.get("attempt", 1) > 1
+    else:
+        for agent, info in _subtask_items(task):
+            if info.get("status") not in ("running", "pending", "skipped") and not info.get("cached"):
+                yield agent, info, False
+
+def metrics_from_store(agent=None, since=None):
+    """用任务存储里持久化的记录重建指标（没有守护进程时导出用，不含 fork 计数）"""
+    registry = MetricsRegistry()
+    _, rows = _task_store.query(agent=agent, since=since)
+    for _, task in rows:
+        for agent_key, record, retry in _finished_records(task):
+            if agent is None or agent_key == agent:
+                _observe_record(registry, agent_key, record, retry)
+    return registry
+
+def collect_metrics(agent=None, since=None):
+    """
+    按代理汇总任务存储中的记录
+    返回: {agent: {runs, success_rate, retries, timeouts, rejected, polls, spawn/run/lag 的 p50/p95}}
+    """
+    samples = {}
+    _, rows = _task_store.query(agent=agent, since=since)
+    for _, task in rows:
+        for agent_key, record, retry in _finished_records(task):
+            if agent is not None and agent_key != agent:
+                continue
+            s = samples.setdefault(agent_key, {
+                "runs": 0, "completed": 0, "retries": 0, "timeouts": 0, "rejected": 0, "polls": 0,
+                "spawn": [], "run": [], "lag": [],
+            })
+            stats = record.get("stats") or {}
+            s["runs"] += 1
+            s["retries"] += retry
+            s["rejected"] += bool(record.get("rejected"))
+            s["polls"] += stats.get("polls", 0)
+            if record.get("status") == "completed":
+                s["completed"] += 1
+                run_seconds = _record_run_seconds(record)
+                if run_seconds is not None:
+                    s["run"].append(run_seconds)
+            elif record.get("status") == "timeout":
+                s["timeouts"] += 1
+            if stats.get("spawn_seconds") is not None:
+                s["spawn"].append(stats["spawn_seconds"])
+            if stats.get("detect_lag") is not None:
+                s["lag"].append(stats["detect_lag"])
+    
+    summary = {}
+    for agent_key, s in sorted(samples.items()):
+        summary[agent_key] = {
+            "model": AGENTS.get(agent_key, {}).get("model", ""),
+            "runs": s["runs"],
+            "success_rate": s["completed"] / s["runs"],
+            "retries": s["retries"],
+            "timeouts": s["timeouts"],
+            "rejected": s["rejected"],
+            "polls": s["polls"],
+        }
+        for name in ("spawn", "run", "lag"):
+            summary[agent_key][f"{name}_p50"] = _percentile(s[name], 50)
+            summary[agent_key][f"{name}_p95"] = _percentile(s[name], 95)
+    return summary
+
+def write_metrics_textfile(path, text):
+    """原子写入 Prometheus textfile（供 node_exporter textfile collector 采集）"""
+    path = Path(path).expanduser()
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+# ==================== openclaw 输出协议 ====================
+
+# 优先请求 --json 结构化输出；openclaw 不支持该参数时自动降级为文本解析
+_openclaw_json = True
+
+_JSON_UNSUPPORTED_RE = re.compile(
+    r"(?:unknown|unrecognized|unexpected|no such|invalid)\s+(?:option|argument|flag)s?\b.*json"
+    r"|--json.*(?:not supported|unknown|unrecognized)",
+    re.IGNORECASE
+)
+
+# 状态词 → 规范状态（completed / running / error / not_found）
+_STATUS_RE = re.compile(
+    r"\b(?:(?P<not_found>not[\s_-]?found|no\s+such\s+session|unknown\s+session)"
+    r"|(?P<completed>completed?|done|finished|succeeded|success)"
+    r"|(?P<running>running|active|pending|queued|in[\s_-]progress|starting)"
+    r"|(?P<error>errored|error|failed|failure|killed|cancell?ed))\b",
+    re.IGNORECASE
+)
+
+# 显式状态字段：status: running / "state": "completed" / status=done，取值到行尾或分隔符为止
+_STATUS_FIELD_RE = re.compile(
+    r"""\b(?:status|state)["']?\s*[:=]\s*["']?(?P<value>[^"'\n,;(){}\[\]]+)""",
+    re.IGNORECASE
+)
+
+# 紧挨在状态词前面的否定词："not completed"、"no error"、"never started"
+_NEGATION_RE = re.compile(r"\b(?:not|no|never|without)\s+$", re.IGNORECASE)
+
+# 自由文本中出现多个状态词时的取舍顺序：终态优先于运行中，出错优先于完成
+_STATUS_PRIORITY = ("not_found", "error", "completed", "running")
+
+# 文本输出中的 session key："sessionKey": "..." / session_key=... / Session: ...
+# key 本身可能含冒号（如 agent:kaifa:subagent:xxx），只以空白、引号、逗号、括号结尾
+_SESSION_KEY_RE = re.compile(
+    r"""(?:session[\s_-]?key|\bsession(?:\s+id)?)["']?\s*[:=]\s*["']?(?P<key>[^\s"',{}\[\]]+)""",
+    re.IGNORECASE
+)
+
+@dataclass
+class SpawnResult:
+    """sessions spawn 的解析结果；session_key 为空表示启动失败"""
+    session_key: Optional[str]
+    status: str = "running"
+    error: str = ""
+    
+    @property
+    def ok(self):
+        return bool(self.session_key)
+
+@dataclass
+class SessionStatus:
+    """sessions status 中单个会话的解析结果"""
+    session_key: str
+    status: str
+    detail: str = ""
+
+def _json_flag():
+    return ["--json"] if _openclaw_json else []
+
+def _disable_json_on(args, stderr):
+    """
+    带 --json 的调用被 openclaw 拒绝时降级为文本协议，返回是否需要去掉 --json 重试
+    以实际发出的参数判断，并发调用中后返回的那一个同样会重试
+    """
+    global _openclaw_json
+    if "--json" not in args or not stderr or not _JSON_UNSUPPORTED_RE.search(stderr):
+        return False
+    if _openclaw_json:
+        _openclaw_json = False
+        print("  ℹ️  openclaw 不支持 --json，改用文本输出解析")
+    return True
+
+def _load_json(output):
+    """解析 JSON 输出；整体解析失败时取最后一行 JSON（前面可能夹带日志）"""
     try:
-        result = subprocess.run(
-            ["openclaw", "sessions", "status", session_key],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        if result.returncode == 0:
-            # 解析状态输出
-            output = result.stdout
-            if "completed" in output.lower() or "done" in output.lower():
-                return "completed"
-            elif "running" in output.lower() or "active" in output.lower():
-                return "running"
-            elif "error" in output.lower() or "failed" in output.lower():
-                return "error"
-        return "unknown"
-    except Exception as e:
-        print(f"  ⚠️  检查状态失败: {e}")
-        return "unknown"
+        return json.loads(output)
+    except (json.JSONDecodeError, ValueError):
+        pass
+    for line in reversed(output.strip().splitlines()):
+        line = line.strip()
+        if line[:1] in ("{", "["):
+            try:
+                return json.loads(line)
+            except (json.JSONDecodeError, ValueError):
+                return None
+    return None
+
+def _status_words(text):
+    """文本中出现的、未被否定的规范状态集合"""
+    found = set()
+    for match in _STATUS_RE.finditer(text):
+        if not _NEGATION_RE.search(text, max(0, match.start() - 12), match.start()):
+            found.add(match.lastgroup)
+    return found
+
+def parse_status_text(text):
+    """
+    把一段状态文本归一为规范状态，无法识别时返回 unknown
+    有 status/state 字段时只看字段值；否则按优先级取自由文本中未被否定的状态词
+    """
+    text = text or ""
+    field = _STATUS_FIELD_RE.search(text)
+    words = _status_words(field.group("value") if field else text)
+    return next((status for status in _STATUS_PRIORITY if status in words), "unknown")
+
+def _item_key(item):
+    session = item.get("session")
+    if isinstance(session, dict):
+        return _item_key(session)
+    if isinstance(session, str):
+        return session
+    return item.get("sessionKey") or item.get("session_key") or item.get("key")
+
+def _item_status(key, item):
+    if isinstance(item, dict):
+        if item.get("found") is False or item.get("exists") is False:
+            return SessionStatus(key, "not_found", str(item.get("error", "")))
+        text = item.get("status") or item.get("state") or item.get("error") or ""
+        return SessionStatus(key, parse_status_text(str(text)), str(item.get("error", "")))
+    return SessionStatus(key, parse_status_text(str(item)))
+
+def parse_spawn_output(stdout, stderr=""):
+    """
+    解析 sessions spawn 输出
+    JSON（{"sessionKey": ..., "status": ...} / {"session": {...}}）优先，其次文本中的 session key。
+    解析不到 key 时返回失败结果，不再伪造 key 去轮询一个不存在的会话。
+    """
+    data = _load_json(stdout)
+    if isinstance(data, dict):
+        key = _item_key(data)
+        if key:
+            status = parse_status_text(str(data.get("status", "")))
+            return SpawnResult(str(key), status if status != "unknown" else "running")
+        return SpawnResult(None, "error", str(data.get("error") or "输出中缺少 sessionKey"))
+    
+    match = _SESSION_KEY_RE.search(f"{stdout}\n{stderr}")
+    if match:
+        return SpawnResult(match.group("key"))
+    return SpawnResult(None, "error", "无法从 spawn 输出中解析 session key")
+
+def parse_status_output(output, session_keys):
+    """
+    解析 sessions status 输出，返回 {key: SessionStatus}
+    支持 JSON（{"sessions": [...]} / [...] / {key: status}）和逐行文本 "key: status"
+    """
+    data = _load_json(output)
+    results = {}
+    if isinstance(data, dict) and "sessions" in data:
+        data = data["sessions"]
+    elif isinstance(data, dict) and len(session_keys) == 1 and _item_key(data) == session_keys[0]:
+        data = [data]
+    
+    if isinstance(data, list):
+        for item in data:
+            key = _item_key(item) if isinstance(item, dict) else None
+            if key:
+                results[key] = _item_status(key, item)
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            results[key] = _item_status(key, value)
+    elif session_keys:
+        # 所有 key 编进一个正则，整段输出只扫描一遍；长 key 优先避免前缀误配
+        key_re = re.compile("|".join(map(re.escape, sorted(session_keys, key=len, reverse=True))))
+        for line in output.splitlines():
+            match = key_re.search(line)
+            if match and match.group(0) not in results:
+                rest = line[:match.start()] + line[match.end():]
+                results[match.group(0)] = SessionStatus(match.group(0), parse_status_text(rest), line.strip())
+        if len(session_keys) == 1 and session_keys[0] not in results:
+            results[session_keys[0]] = SessionStatus(session_keys[0], parse_status_text(output))
+    return results
+
+def _failed_status(session_keys, stdout, stderr):
+    """status 命令返回非零：单个会话且输出表明不存在时判定为 not_found"""
+    text = f"{stderr}\n{stdout}"
+    if len(session_keys) == 1 and "not_found" in _status_words(text):
+        return {session_keys[0]: SessionStatus(session_keys[0], "not_found", stderr.strip())}
+    return {}
+
+# ==================== 会话操作 ====================
+
+def _spawn_args(agent_id, task, timeout):
+    """构建 openclaw sessions spawn 命令"""
+    return ["openclaw", "sessions", "spawn",
+            "--agent", agent_id,
+            "--mode", "run",
+            "--timeout", str(timeout),
+            *_json_flag(),
+            "--task", task]
+
+def get_session_status(session_key):
+    """获取会话状态（同步接口）"""
+    return asyncio.run(_status_probe.refresh([session_key]))[session_key]
 
 def get_session_history(session_key, limit=10):
-    """获取会话历史消息"""
-    try:
-        result = subprocess.run(
-            ["openclaw", "sessions", "history", session_key, "--limit", str(limit)],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        if result.returncode == 0:
-            return result.stdout
+    """获取会话历史消息（同步接口）"""
+    return asyncio.run(get_session_history_async(session_key, limit))
+
+def spawn_agent(agent_id, task, timeout=300):
+    """
+    启动子代理执行任务（同步接口）
+    返回: (session_key, success)
+    """
+    return asyncio.run(spawn_agent_async(agent_id, task, timeout))
+
+# ==================== 轮询调度 ====================
+
+# 轮询策略：fixed（固定间隔）/ backoff（指数退避）/ adaptive（按历史耗时预测，默认）
+POLL_SCHEDULE = os.environ.get("MULTI_AGENT_POLL", "adaptive")
+POLL_INITIAL_INTERVAL = 2
+POLL_MAX_INTERVAL = 30
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.2
+# 历史样本少于该数量时不做预测，退回指数退避
+POLL_HISTORY_MIN_SAMPLES = 3
+# 连续几次查询到会话不存在即判定失败（容忍刚 spawn 的会话尚未登记）
+NOT_FOUND_TOLERANCE = 2
+
+def _percentile(values, q):
+    """线性插值百分位数，q 取 0-100"""
+    if not values:
         return None
-    except Exception as e:
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+class FixedPollSchedule:
+    """固定间隔轮询"""
+    
+    def __init__(self, interval=10):
+        self.interval = interval
+    
+    def next_delay(self, elapsed):
+        return self.interval
+
+class BackoffPollSchedule:
+    """指数退避轮询：前几次快速检查，之后间隔按倍数增长到上限，叠加随机抖动避免多个循环同步"""
+    
+    def __init__(self, initial=POLL_INITIAL_INTERVAL, maximum=POLL_MAX_INTERVAL,
+                 factor=POLL_BACKOFF_FACTOR, jitter=POLL_JITTER):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._polls = 0
+    
+    def _jittered(self, delay):
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+    
+    def next_delay(self, elapsed):
+        delay = min(self.maximum, self.initial * self.factor ** self._polls)
+        self._polls += 1
+        return self._jittered(delay)
+
+class HistoricalPollSchedule(BackoffPollSchedule):
+    """
+    按代理历史耗时预测轮询时机
+    
+    在历史最快的一批任务（p25）完成之前只做稀疏检查，
+    临近预测完成时间后从快速间隔重新开始指数退避。
+    """
+    
+    def __init__(self, durations, **kwargs):
+        super().__init__(**kwargs)
+        self.expected_start = _percentile(durations, 25) * 0.8
+    
+    def next_delay(self, elapsed):
+        if elapsed < self.expected_start:
+            remaining = self.expected_start - elapsed
+            return self._jittered(max(self.initial, min(self.maximum, remaining)))
+        return super().next_delay(elapsed)
+
+def make_poll_schedule(agent=None, poll_interval=None):
+    """按配置创建轮询策略；显式指定 poll_interval 时使用固定间隔"""
+    if poll_interval is not None or POLL_SCHEDULE == "fixed":
+        return FixedPollSchedule(poll_interval or 10)
+    if POLL_SCHEDULE == "adaptive" and agent:
+        durations = _task_store.durations(agent)
+        if len(durations) >= POLL_HISTORY_MIN_SAMPLES:
+            return HistoricalPollSchedule(durations)
+    return BackoffPollSchedule()
+
+def wait_for_completion(session_key, timeout=300, poll_interval=None, agent=None):
+    """
+    轮询等待任务完成（同步接口）
+    返回: (status, duration)
+    """
+    return asyncio.run(wait_for_completion_async(session_key, timeout, poll_interval, agent=agent))
+
+# ==================== 异步执行引擎 ====================
+
+async def _run_openclaw_async(args, timeout):
+    """
+    异步执行 openclaw 命令
+    返回: (returncode, stdout, stderr)
+    """
+    _count_fork(args)
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # 超时或任务被取消：不留下孤儿 openclaw 进程
+        proc.kill()
+        await proc.wait()
+        raise
+    return (proc.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"))
+
+async def get_session_status_async(session_key):
+    """异步获取会话状态（经批量探测器，与其他会话合并查询）"""
+    return await _status_probe.get(session_key)
+
+# ==================== 批量状态探测 ====================
+
+# 状态缓存有效期（秒）：有效期内的查询直接读缓存，不再 fork openclaw
+# 不超过最短轮询间隔，避免缓存拖慢完成检测
+STATUS_CACHE_TTL = 2
+# 同一批次的合并窗口（秒）：窗口内到达的查询合并为一次 openclaw 调用
+STATUS_BATCH_WINDOW = 0.2
+# 批量查询整体失败且找不到不存在的会话时，暂停批量的时长（秒）；期间逐个查询，到期再试一次批量
+STATUS_BATCH_RETRY_INTERVAL = 60
+
+class SessionStatusProbe:
+    """
+    会话状态多路复用器
+    
+    所有等待中的会话登记在 watched 集合里；任何一次刷新都用一条
+    `openclaw sessions status --json k1 k2 ...` 查询全部登记的会话，结果按 TTL 缓存。
+    N 个并发会话每个轮询周期大约只消耗一次 fork。
+    
+    批量查询失败时退回逐个查询一次：查出不存在的会话之后单独查询，其余继续批量；
+    找不到原因则认为 openclaw 不支持批量，暂停批量 retry_interval 秒后再试。
+    """
+    
+    def __init__(self, ttl=STATUS_CACHE_TTL, window=STATUS_BATCH_WINDOW,
+                 retry_interval=STATUS_BATCH_RETRY_INTERVAL):
+        self.ttl = ttl
+        self.window = window
+        self.retry_interval = retry_interval
+        self.watched = set()
+        self._cache = {}
+        self._batch = None
+        # 会拖垮整批查询的会话（已确认不存在），单独查询
+        self._solo = set()
+        # 在此时间点（monotonic）之前不发批量查询
+        self._batch_retry_at = 0.0
+    
+    def watch(self, session_key):
+        self.watched.add(session_key)
+    
+    def unwatch(self, session_key):
+        self.watched.discard(session_key)
+        self._solo.discard(session_key)
+        self._cache.pop(session_key, None)
+    
+    def _cached(self, session_key):
+        entry = self._cache.get(session_key)
+        # not_found 不走缓存：每次判定都要基于一次新的查询
+        if entry and entry[0] != "not_found" and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
         return None
+    
+    async def get(self, session_key):
+        """获取单个会话状态：命中缓存直接返回，否则加入当前批次"""
+        status = self._cached(session_key)
+        if status is not None:
+            return status
+        
+        self.watched.add(session_key)
+        if self._batch is None:
+            self._batch = asyncio.ensure_future(self._flush())
+        await asyncio.shield(self._batch)
+        
+        entry = self._cache.get(session_key)
+        return entry[0] if entry else "unknown"
+    
+    async def refresh(self, keys):
+        """立即批量查询一组会话并写入缓存，返回 {key: status}"""
+        results = await self._query(sorted(keys))
+        now = time.monotonic()
+        for key in keys:
+            self._cache[key] = (results.get(key, "unknown"), now)
+        self._solo -= set(keys) - self.watched
+        return {key: self._cache[key][0] for key in keys}
+    
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        # 取快照后立刻清空批次，之后到达的查询进入下一批
+        keys = sorted(self.watched)
+        self._batch = None
+        
+        results = await self._query(keys)
+        now = time.monotonic()
+        for key in keys:
+            self._cache[key] = (results.get(key, "unknown"), now)
+    
+    async def _query(self, keys):
+        """查询一组会话：可批量的合并为一次调用，其余逐个查询"""
+        batch = []
+        if time.monotonic() >= self._batch_retry_at:
+            batch = [key for key in keys if key not in self._solo]
+        if len(batch) < 2:
+            batch = []
+        singles = [key for key in keys if key not in batch]
+        
+        jobs = [self._query_batch(batch)] if batch else []
+        jobs += [self._query_one(key) for key in singles]
+        return await self._merge(jobs)
+    
+    async def _merge(self, jobs):
+        results = {}
+        for partial in await asyncio.gather(*jobs):
+            results.update(partial)
+        return results
+    
+    async def _query_one(self, key):
+        _, results = await self._run([key])
+        return results
+    
+    async def _query_batch(self, keys):
+        returncode, results = await self._run(keys)
+        if returncode in (0, None):
+            return results
+        
+        # 批量查询整体失败，退回逐个查询并找出原因
+        results = await self._merge([self._query_one(key) for key in keys])
+        gone = {key for key, status in results.items() if status == "not_found"}
+        if gone:
+            self._solo |= gone
+        else:
+            self._batch_retry_at = time.monotonic() + self.retry_interval
+            print(f"  ℹ️  批量状态查询失败，{self.retry_interval}s 内改为逐个查询")
+        return results
+    
+    async def _run(self, keys):
+        """执行一次 sessions status，返回 (returncode, {key: status})；调用本身出错时 returncode 为 None"""
+        try:
+            args = ["openclaw", "sessions", "status", *_json_flag(), *keys]
+            returncode, stdout, stderr = await _run_openclaw_async(args, timeout=10)
+            if returncode != 0 and _disable_json_on(args, stderr):
+                return await self._run(keys)
+        except Exception as e:
+            print(f"  ⚠️  批量检查状态失败: {e}")
+            return None, {}
+        
+        if returncode == 0:
+            parsed = parse_status_output(stdout, keys)
+        else:
+            parsed = _failed_status(keys, stdout, stderr)
+        return returncode, {key: state.status for key, state in parsed.items()}
 
-def spawn_agent(agent_id, task, timeout=300):
+_status_probe = SessionStatusProbe()
+
+async def spawn_agent_async(agent_id, task, timeout=300, stats=None):
     """
-    真正启动子代理执行任务
+    异步启动子代理，多个代理可同时启动
+    stats 不为空时写入启动耗时 spawn_seconds
     返回: (session_key, success)
     """
     agent_info = AGENTS.get(agent_id, {})
     agent_name = agent_info.get('name', agent_id)
     
     print(f"  🚀 正在启动 {agent_name}...")
+    started = time.monotonic()
     
     try:
-        # 使用 openclaw sessions spawn 启动子代理
-        result = subprocess.run(
-            ["openclaw", "sessions", "spawn",
-             "--agent", agent_id,
-             "--mode", "run",
-             "--timeout", str(timeout),
-             "--task", task],
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
+        args = _spawn_args(agent_id, task, timeout)
+        returncode, stdout, stderr = await _run_openclaw_async(args, timeout=15)
+        if returncode != 0 and _disable_json_on(args, stderr):
+            returncode, stdout, stderr = await _run_openclaw_async(
+                _spawn_args(agent_id, task, timeout), timeout=15
+            )
         
-        if result.returncode != 0:
-            print(f"  ❌ 启动失败: {result.stderr}")
+        if returncode != 0:
+            print(f"  ❌ {agent_name} 启动失败: {stderr}")
             return None, False
         
-        # 解析输出获取 session_key
-        output = result.stdout + result.stderr
-        session_key = None
-        
-        for line in output.split('\n'):
-            if 'sessionKey' in line or 'session_key' in line or 'spawned' in line.lower():
-                # 尝试提取 session key
-                parts = line.replace(':', ' ').replace('"', ' ').split()
-                for i, part in enumerate(parts):
-                    if 'session' in part.lower() and i + 1 < len(parts):
-                        session_key = parts[i + 1].strip()
-                        break
-        
-        # 如果无法解析，使用默认格式
-        if not session_key:
-            session_key = f"agent:{agent_id}:{int(time.time())}"
+        spawned = parse_spawn_output(stdout, stderr)
+        if not spawned.ok:
+            print(f"  ❌ {agent_name} 启动失败: {spawned.error}")
+            return None, False
+        if stats is not None:
+            stats["spawn_seconds"] = round(time.monotonic() - started, 3)
         
         print(f"  ✅ {agent_name} 已启动")
-        print(f"  📍 Session: {session_key[:50]}...")
+        print(f"  📍 Session: {spawned.session_key[:50]}...")
         
-        return session_key, True
+        return spawned.session_key, True
         
-    except subprocess.TimeoutExpired:
-        print(f"  ⏱️ 启动超时")
+    except asyncio.TimeoutError:
+        print(f"  ⏱️ {agent_name} 启动超时")
         return None, False
     except Exception as e:
-        print(f"  ❌ 启动异常: {e}")
+        print(f"  ❌ {agent_name} 启动异常: {e}")
         return None, False
 
-def wait_for_completion(session_key, timeout=300, poll_interval=10):
+async def cancel_session_async(session_key):
+    """终止一个 openclaw 会话，释放模型容量"""
+    try:
+        returncode, _, stderr = await _run_openclaw_async(
+            ["openclaw", "sessions", "kill", session_key], timeout=10
+        )
+        if returncode != 0:
+            print(f"  ⚠️  终止会话失败: {stderr.strip()}")
+        return returncode == 0
+    except Exception as e:
+        print(f"  ⚠️  终止会话失败: {e}")
+        return False
+
+async def get_session_history_async(session_key, limit=10):
+    """异步获取会话历史消息"""
+    try:
+        returncode, stdout, _ = await _run_openclaw_async(
+            ["openclaw", "sessions", "history", session_key, "--limit", str(limit)], timeout=10
+        )
+        if returncode == 0:
+            return stdout
+        return None
+    except Exception:
+        return None
+
+async def wait_for_completion_async(session_key, timeout=300, poll_interval=None, label="", agent=None,
+                                    stats=None):
+    """
+    异步轮询等待任务完成，多个会话的等待互不阻塞
+    stats 不为空时写入轮询次数 polls 和发现延迟 detect_lag（距最后一次看到 running 的时间）
+    返回: (status, duration)
+    """
+    schedule = make_poll_schedule(agent, poll_interval)
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    last_running = start_time
+    _status_probe.watch(session_key)
+    missing = 0
+    polls = 0
+    
+    try:
+        while loop.time() - start_time < timeout:
+            status = await get_session_status_async(session_key)
+            polls += 1
+            
+            if status in ("completed", "error"):
+                if stats is not None:
+                    stats["detect_lag"] = round(loop.time() - last_running, 3)
+                return status, int(loop.time() - start_time)
+            if status == "running":
+                last_running = loop.time()
+            missing = missing + 1 if status == "not_found" else 0
+            if missing >= NOT_FOUND_TOLERANCE:
+                print(f"  ❌ {label}会话不存在: {session_key}")
+                return "not_found", int(loop.time() - start_time)
+            
+            elapsed = loop.time() - start_time
+            print(f"  ⏳ {label}等待中... ({int(elapsed)}s)")
+            await asyncio.sleep(min(schedule.next_delay(elapsed), max(0, timeout - elapsed)))
+        
+        return "timeout", int(loop.time() - start_time)
+    finally:
+        _status_probe.unwatch(session_key)
+        if stats is not None:
+            stats["polls"] = stats.get("polls", 0) + polls
+
+# ==================== 调度器 ====================
+
+# 并发会话上限：全局 + 按模型，超出时按代理优先级（数字越小越先）排队
+MAX_CONCURRENT_SESSIONS = int(os.environ.get("MULTI_AGENT_MAX_SESSIONS", "5"))
+MODEL_CONCURRENCY = {
+    "kimi-coding/k2p5": int(os.environ.get("MULTI_AGENT_MAX_SESSIONS_K2P5", "5")),
+}
+# 排队上限：超出后拒绝新的子任务，避免无限堆积
+MAX_PENDING_SPAWNS = 50
+
+class SchedulerFull(Exception):
+    """排队已满，拒绝新的子任务"""
+
+class SpawnScheduler:
+    """
+    子任务优先级调度器
+    
+    每个子任务从启动到会话结束占用一个槽位。同一时刻提交的一批子任务先全部入队，
+    再按 (priority, 提交顺序) 放行；某个模型满载时跳过它，先放行其他模型的任务。
+    """
+    
+    def __init__(self, max_sessions=MAX_CONCURRENT_SESSIONS, model_limits=None,
+                 max_pending=MAX_PENDING_SPAWNS):
+        self.max_sessions = max_sessions
+        self.model_limits = MODEL_CONCURRENCY if model_limits is None else model_limits
+        self.max_pending = max_pending
+        self.running = {}
+        self._total = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._announced = set()
+        self._dispatch_scheduled = False
+    
+    @property
+    def pending(self):
+        return sum(1 for *_, fut in self._queue if not fut.done())
+    
+    def _can_admit(self, model):
+        if self._total >= self.max_sessions:
+            return False
+        limit = self.model_limits.get(model)
+        return limit is None or self.running.get(model, 0) < limit
+    
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        blocked = []
+        while self._queue and self._total < self.max_sessions:
+            entry = heapq.heappop(self._queue)
+            _, _, model, _, fut = entry
+            if fut.done():
+                continue
+            if not self._can_admit(model):
+                blocked.append(entry)
+                continue
+            self.running[model] = self.running.get(model, 0) + 1
+            self._total += 1
+            fut.set_result(None)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+        
+        for _, seq, _, name, fut in self._queue:
+            if not fut.done() and seq not in self._announced:
+                self._announced.add(seq)
+                print(f"  ⏸️  {name} 排队中（运行 {self._total}/{self.max_sessions}）")
+    
+    def _schedule_dispatch(self):
+        # 推迟到下一轮事件循环，让同一批提交全部入队后再按优先级放行
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            asyncio.get_running_loop().call_soon(self._dispatch)
+    
+    async def acquire(self, agent_info):
+        """等待一个会话槽位"""
+        if self.pending >= self.max_pending:
+            raise SchedulerFull(f"排队已满 ({self.max_pending})")
+        fut = asyncio.get_running_loop().create_future()
+        seq = next(self._seq)
+        heapq.heappush(self._queue, (
+            agent_info.get("priority", 99), seq,
+            agent_info.get("model"), agent_info.get("name"), fut
+        ))
+        self._schedule_dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已获得槽位后才被取消，归还槽位
+                self.release(agent_info)
+            raise
+        finally:
+            # 出队后不再需要"已提示排队"的记录，常驻守护进程里不累积
+            self._announced.discard(seq)
+    
+    def release(self, agent_info):
+        """归还会话槽位"""
+        model = agent_info.get("model")
+        self.running[model] = max(0, self.running.get(model, 0) - 1)
+        self._total = max(0, self._total - 1)
+        self._schedule_dispatch()
+    
+    def slot(self, agent_info):
+        """async with scheduler.slot(agent_info): 占用一个会话槽位"""
+        return _SchedulerSlot(self, agent_info)
+
+class _SchedulerSlot:
+    def __init__(self, scheduler, agent_info):
+        self.scheduler = scheduler
+        self.agent_info = agent_info
+    
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.agent_info)
+    
+    async def __aexit__(self, *exc):
+        self.scheduler.release(self.agent_info)
+
+_scheduler = SpawnScheduler()
+
+# ==================== 结果缓存 ====================
+
+# 相同代理 + 模型 + 提示词的已完成结果，在 TTL 内直接复用，不再启动会话（--cache-ttl 开启）
+RESULT_CACHE_FILE = TASK_STATE_FILE.with_name(".multi_agent_cache.json")
+RESULT_CACHE_LOCK_FILE = TASK_STATE_FILE.with_name(".multi_agent_cache.lock")
+RESULT_CACHE_MAX_ENTRIES = 200
+RESULT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+# 缓存的输出：取会话历史末尾的若干字符
+RESULT_CACHE_OUTPUT_CHARS = 4000
+RESULT_CACHE_HISTORY_LIMIT = 20
+
+def parse_ttl(value):
+    """解析时长：秒数，或 90s / 30m / 12h / 7d"""
+    match = re.fullmatch(r"(\d+)([smhd]?)", str(value).strip())
+    if not match:
+        raise ValueError(f"无法解析的时长: {value}")
+    return int(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+def normalize_prompt(prompt):
+    """规范化提示词：折叠空白，首尾去空"""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+def result_cache_key(agent_id, model, prompt):
+    """缓存键：(代理 id, 模型, 规范化提示词) 的 SHA-256"""
+    raw = "\0".join((agent_id, model or "", normalize_prompt(prompt)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    代理结果缓存
+    
+    条目在写入时按 TTL 设定过期时间；读取时还要求条目年龄不超过调用方给的 TTL。
+    超出条数或字节上限时淘汰最久未使用的条目。文件锁保证守护进程和 CLI 并发读写安全。
+    """
+    
+    def __init__(self, cache_file=RESULT_CACHE_FILE, lock_file=RESULT_CACHE_LOCK_FILE,
+                 max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.cache_file = cache_file
+        self.lock_file = lock_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+    
+    @contextmanager
+    def _locked(self):
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def _save(self, entries):
+        tmp = self.cache_file.with_suffix(".json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp, self.cache_file)
+    
+    def _evict(self, entries, now):
+        """丢弃过期条目，再按最近使用时间保留到条数/字节上限以内"""
+        live = sorted(
+            ((key, entry) for key, entry in entries.items() if entry["expires_at"] > now),
+            key=lambda item: item[1]["last_used"], reverse=True
+        )
+        kept, size = {}, 0
+        for key, entry in live:
+            size += len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+            if len(kept) >= self.max_entries or size > self.max_bytes:
+                break
+            kept[key] = entry
+        return kept
+    
+    def get(self, key, ttl):
+        """查找不超过 ttl 秒的条目，命中时刷新最近使用时间"""
+        with self._locked():
+            entries = self._load()
+            entry = entries.get(key)
+            now = time.time()
+            if not entry or entry["expires_at"] <= now or now - entry["created_at"] > ttl:
+                return None
+            entry["last_used"] = now
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._save(entries)
+            return entry
+    
+    def put(self, key, ttl, **result):
+        with self._locked():
+            entries = self._load()
+            now = time.time()
+            entries[key] = {**result, "created_at": now, "expires_at": now + ttl, "last_used": now}
+            self._save(self._evict(entries, now))
+
+_result_cache = ResultCache()
+
+def _cache_lookup(agent_key, prompt, ttl):
+    """
+    查结果缓存，命中时返回可直接写入任务的记录（标记 cached）
+    """
+    agent_info = AGENTS[agent_key]
+    entry = _result_cache.get(result_cache_key(agent_info["id"], agent_info.get("model"), prompt), ttl)
+    if entry is None:
+        _metrics.inc("multi_agent_cache_misses_total", agent=agent_key)
+        return None
+    _metrics.inc("multi_agent_cache_hits_total", agent=agent_key)
+    return {
+        "status": entry["status"],
+        "cached": True,
+        "cached_from": entry.get("task_id"),
+        "session": entry.get("session"),
+        "output": entry.get("output", ""),
+        "completed_at": datetime.now().isoformat(),
+        "cache_age": int(time.time() - entry["created_at"]),
+    }
+
+async def _cache_store(agent_key, prompt, ttl, session, task_id):
+    """会话完成后把输出写入结果缓存，返回缓存的输出"""
+    history = await get_session_history_async(session, limit=RESULT_CACHE_HISTORY_LIMIT)
+    output = (history or "").strip()[-RESULT_CACHE_OUTPUT_CHARS:]
+    agent_info = AGENTS[agent_key]
+    _result_cache.put(
+        result_cache_key(agent_info["id"], agent_info.get("model"), prompt), ttl,
+        agent=agent_key, model=agent_info.get("model"), status="completed",
+        session=session, task_id=task_id, output=output
+    )
+    return output
+
+# ==================== 取消与截止时间 ====================
+
+# 守护进程正常停止时不终止会话，留给下次启动时的对账接管
+_detach_on_cancel = False
+
+async def _cancel_task_sessions(task_id, task, reason):
+    """终止任务所有在途会话，未结束的记录和任务本身记为 cancelled"""
+    now = datetime.now().isoformat()
+    records = [info for _, info in _subtask_items(task)] + task.get("attempts", [])
+    open_records = [r for r in records if r.get("status") in (None, "running", "pending")]
+    sessions = [r["session"] for r in open_records if r.get("session")]
+    killed = await asyncio.gather(*(cancel_session_async(session) for session in sessions))
+    
+    for record in open_records:
+        record.update(status="cancelled", error=reason, completed_at=now)
+    if task.get("type") == "ultrawork":
+        # 还在排队、尚未启动的代理
+        for agent_key in task.get("agents") or []:
+            if agent_key in AGENTS and agent_key not in task["subtasks"]:
+                task["subtasks"][agent_key] = {"status": "cancelled", "error": reason}
+    task.update(status="cancelled", cancel_reason=reason, completed_at=now)
+    save_task(task_id, task)
+    print(f"\n🛑 {task_id} 已取消（{reason}），终止会话 {sum(killed)}/{len(sessions)}")
+
+class TaskGuard:
+    """
+    任务级取消控制
+    
+    - deadline：整个任务的截止时间（秒），到期后取消任务主体并终止所有在途会话
+    - abort(reason)：fail-fast 等策略主动取消
+    - 外部取消（Ctrl-C、守护进程 cancel 请求）同样终止会话，然后继续向上抛出
+    会话的 --timeout 不超过截止时间的剩余量，编排进程崩溃时会话也会按时结束。
+    """
+    
+    def __init__(self, task_id, task, deadline=None):
+        self.task_id = task_id
+        self.task = task
+        self.deadline = deadline
+        self.loop = asyncio.get_running_loop()
+        self.deadline_at = self.loop.time() + deadline if deadline else None
+        self.reason = None
+        self._job = None
+    
+    def budget(self, timeout):
+        """会话超时：不超过截止时间的剩余量（多留 1s，让截止计时先触发、统一终止会话）"""
+        if self.deadline_at is None:
+            return timeout
+        return max(1, min(timeout, math.ceil(self.deadline_at - self.loop.time()) + 1))
+    
+    def abort(self, reason):
+        if self.reason is None and self._job is not None and not self._job.done():
+            self.reason = reason
+            self._job.cancel()
+    
+    async def run(self, coro):
+        """运行任务主体，返回是否正常结束（被截止时间或 abort 取消时返回 False）"""
+        self._job = asyncio.ensure_future(coro)
+        timer = None
+        if self.deadline_at is not None:
+            timer = self.loop.call_at(self.deadline_at, self.abort, f"超过截止时间 {self.deadline}s")
+        try:
+            await self._job
+            return True
+        except asyncio.CancelledError:
+            external = self.reason is None
+            if external:
+                self._job.cancel()
+                if _detach_on_cancel:
+                    raise
+                self.reason = "手动取消"
+            await asyncio.gather(self._job, return_exceptions=True)
+            await _cancel_task_sessions(self.task_id, self.task, self.reason)
+            if external:
+                raise
+            return False
+        finally:
+            if timer:
+                timer.cancel()
+
+def _run_interruptible(coro):
+    """
+    同步入口：Ctrl-C 取消任务（终止在途会话并记录 cancelled）后抛出 KeyboardInterrupt
+    清理过程中再按一次 Ctrl-C 立即退出
+    """
+    async def runner():
+        job = asyncio.ensure_future(coro)
+        loop = asyncio.get_running_loop()
+        
+        def interrupt():
+            loop.remove_signal_handler(signal.SIGINT)
+            print("\n🛑 收到中断，正在终止在途会话...（再按 Ctrl-C 强制退出）")
+            job.cancel()
+        
+        loop.add_signal_handler(signal.SIGINT, interrupt)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            raise KeyboardInterrupt from None
+    
+    return asyncio.run(runner())
+
+def cancel_task(task_id):
     """
-    轮询等待任务完成
-    返回: (status, duration)
+    取消一个运行中的任务
+    优先交给守护进程；任务属于本机另一个 CLI 进程时向它发送 SIGINT；
+    所属进程已退出时直接终止遗留会话。
     """
-    start_time = time.time()
+    result = daemon_request("cancel", task_id=task_id)
+    if result and result.get("cancelled"):
+        print(f"🛑 已取消: {task_id}")
+        return True
     
-    while time.time() - start_time < timeout:
-        status = get_session_status(session_key)
-        
-        if status == "completed":
-            duration = int(time.time() - start_time)
-            return "completed", duration
-        elif status == "error":
-            duration = int(time.time() - start_time)
-            return "error", duration
-        
-        print(f"  ⏳ 等待中... ({int(time.time() - start_time)}s)")
-        time.sleep(poll_interval)
+    task = _task_store.get(task_id)
+    if task is None:
+        print(f"❌ 任务 {task_id} 不存在")
+        return False
+    if task.get("status") != "running":
+        print(f"任务已结束: {task_id} ({task.get('status')})")
+        return False
     
-    return "timeout", int(time.time() - start_time)
+    owner = task.get("owner") or {}
+    daemon_pid = result.get("pid") if result else None
+    if _owner_alive(task) and owner.get("pid") not in (os.getpid(), daemon_pid):
+        if owner.get("host") != socket.gethostname():
+            print(f"⚠️  任务由 {owner.get('host')} 上的进程 {owner.get('pid')} 执行，请在该主机上取消")
+            return False
+        os.kill(owner["pid"], signal.SIGINT)
+        print(f"🛑 已通知进程 {owner['pid']} 取消 {task_id}")
+        return True
+    
+    asyncio.run(_cancel_task_sessions(task_id, task, "手动取消"))
+    return True
 
 # ==================== Ultrawork 模式 ====================
 
-def ultrawork(task_description, agent_roles=None, parallel=True, wait=True):
+def _build_subtask(agent_info, task_description):
+    """构建发给单个代理的子任务描述"""
+    return f"【{agent_info['role']} - {agent_info['name']}】\n\n任务: {task_description}\n\n请独立完成你的职责范围内的工作。完成后报告：\n1. 执行结果\n2. 完成状态 (成功/失败)\n3. 关键输出或交付物"
+
+def _record_spawn(task_id, task, agent_key, session, success, stats=None):
+    """记录子任务启动结果"""
+    if success:
+        task["subtasks"][agent_key] = {
+            "session": session,
+            "status": "running",
+            "started_at": datetime.now().isoformat(),
+            "stats": stats if stats is not None else {}
+        }
+    else:
+        task["subtasks"][agent_key] = {
+            "status": "failed",
+            "error": "Failed to spawn"
+        }
+        _observe_record(_metrics, agent_key, task["subtasks"][agent_key])
+    save_task(task_id, task)
+
+def _record_result(task_id, task, agent_key, status):
+    """记录子任务最终状态"""
+    task["subtasks"][agent_key]["status"] = status
+    task["subtasks"][agent_key]["completed_at"] = datetime.now().isoformat()
+    _observe_record(_metrics, agent_key, task["subtasks"][agent_key])
+    save_task(task_id, task)
+
+def _finalize_task(task):
+    """根据子任务/尝试结果确定任务最终状态"""
+    if task.get("type") == "ralph_loop":
+        completed = any(att.get("status") == "completed" for att in task.get("attempts", []))
+        task["status"] = "completed" if completed else "failed"
+    elif task.get("type") == "workflow":
+        # 编排进程中途退出时，尚未启动的步骤不会再执行
+        for step in task["steps"].values():
+            if step.get("status") == "pending":
+                step.update(status="skipped", error="工作流未执行到该步骤")
+        completed = [s.get("status") == "completed" for s in task["steps"].values()]
+        task["status"] = "completed" if all(completed) else "partial" if any(completed) else "failed"
+    else:
+        all_completed = all(
+            s.get("status") in ["completed", "error", "failed", "not_found"] 
+            for s in task["subtasks"].values()
+        )
+        task["status"] = "completed" if all_completed else "partial"
+    task["completed_at"] = datetime.now().isoformat()
+
+async def _ultrawork_run(task_id, task, selected_agents, task_description, parallel, wait, guard,
+                         cache_ttl=None, fail_fast=False):
+    """
+    执行所有子任务
+    并行模式：同时启动所有代理，并发监控每个会话，最慢的代理完成即结束
+    串行模式：逐个启动代理，等待当前代理完成后再启动下一个
+    cache_ttl 不为空时先查结果缓存，命中的代理不再启动会话
+    fail_fast 时任一代理失败即取消整个任务
     """
-    Ultrawork 模式：一个词激活并行执行
     
-    示例:
-    ultrawork("部署凡人修仙并写公众号文章", ["kaifa", "gongzhonghao"])
+    async def run_agent(agent_key, agent_info):
+        await run_cached_or_spawn(agent_key, agent_info)
+        status = task["subtasks"].get(agent_key, {}).get("status")
+        if fail_fast and status not in ("completed", "running"):
+            guard.abort(f"fail-fast: {agent_info['name']} {status}")
+    
+    async def run_cached_or_spawn(agent_key, agent_info):
+        if cache_ttl:
+            cached = _cache_lookup(agent_key, _build_subtask(agent_info, task_description), cache_ttl)
+            if cached:
+                print(f"\n♻️  {agent_info['name']} 命中缓存（{cached['cache_age']}s 前的结果）")
+                task["subtasks"][agent_key] = cached
+                save_task(task_id, task)
+                return
+        try:
+            async with _scheduler.slot(agent_info):
+                await spawn_and_wait(agent_key, agent_info)
+        except SchedulerFull as e:
+            print(f"  ❌ {agent_info['name']} 未启动: {e}")
+            task["subtasks"][agent_key] = {"status": "failed", "error": str(e), "rejected": True}
+            _observe_record(_metrics, agent_key, task["subtasks"][agent_key])
+            save_task(task_id, task)
+    
+    async def spawn_and_wait(agent_key, agent_info):
+        print(f"\n👉 启动 [{agent_info['role']}] {agent_info['name']}")
+        stats = {}
+        prompt = _build_subtask(agent_info, task_description)
+        session, success = await spawn_agent_async(agent_info['id'], prompt, timeout=guard.budget(600), stats=stats)
+        _record_spawn(task_id, task, agent_key, session, success, stats)
+        
+        if success and (wait or not parallel):
+            status, duration = await wait_for_completion_async(
+                session, timeout=guard.budget(600), label=f"{agent_info['name']} ", agent=agent_key, stats=stats
+            )
+            print(f"  {'✅' if status == 'completed' else '❌'} {agent_info['name']} {status} ({duration}s)")
+            if status == "completed" and cache_ttl:
+                task["subtasks"][agent_key]["output"] = await _cache_store(
+                    agent_key, prompt, cache_ttl, session, task_id
+                )
+            _record_result(task_id, task, agent_key, status)
+    
+    if parallel:
+        await asyncio.gather(*(
+            run_agent(agent_key, agent_info)
+            for agent_key, agent_info in selected_agents.items()
+        ))
+    else:
+        for agent_key, agent_info in selected_agents.items():
+            await run_agent(agent_key, agent_info)
+
+async def ultrawork_async(task_description, agent_roles=None, parallel=True, wait=True, task_id=None,
+                          cache_ttl=None, deadline=None, fail_fast=False):
+    """
+    Ultrawork 模式（异步版本，可在守护进程的事件循环中并发运行多个）
+    deadline 为整个任务的截止时间（秒），fail_fast 时任一代理失败即取消其余会话
     """
     print("=" * 60)
     print("⚡ Ultrawork 模式 - 并行执行")
@@ -219,99 +1762,123 @@ def ultrawork(task_description, agent_roles=None, parallel=True, wait=True):
     print()
     
     # 创建任务记录
-    task_id = f"ultrawork_{int(time.time())}"
-    tasks = load_tasks()
-    tasks[task_id] = {
+    task_id = task_id or new_task_id("ultrawork")
+    task = {
         "type": "ultrawork",
         "description": task_description,
         "agents": agent_roles,
         "parallel": parallel,
         "started_at": datetime.now().isoformat(),
         "status": "running",
+        "owner": _task_owner(),
         "subtasks": {}
     }
-    save_tasks(tasks)
+    save_task(task_id, task)
     
-    # 启动所有代理
-    active_sessions = {}
+    guard = TaskGuard(task_id, task, deadline)
+    finished = await guard.run(_ultrawork_run(
+        task_id, task, selected_agents, task_description, parallel, wait, guard, cache_ttl, fail_fast
+    ))
     
-    for agent_key, agent_info in selected_agents.items():
-        subtask = f"【{agent_info['role']} - {agent_info['name']}】\n\n任务: {task_description}\n\n请独立完成你的职责范围内的工作。完成后报告：\n1. 执行结果\n2. 完成状态 (成功/失败)\n3. 关键输出或交付物"
-        
-        print(f"\n👉 启动 [{agent_info['role']}] {agent_info['name']}")
-        session, success = spawn_agent(agent_info['id'], subtask, timeout=600)
-        
-        if success:
-            active_sessions[agent_key] = {
-                "session": session,
-                "agent_name": agent_info['name'],
-                "status": "running"
-            }
-            tasks[task_id]["subtasks"][agent_key] = {
-                "session": session,
-                "status": "running",
-                "started_at": datetime.now().isoformat()
-            }
-        else:
-            tasks[task_id]["subtasks"][agent_key] = {
-                "status": "failed",
-                "error": "Failed to spawn"
-            }
-        
-        save_tasks(tasks)
-        
-        if not parallel:
-            # 串行模式：等待当前代理完成
-            if session:
-                print(f"  ⏳ 等待 {agent_info['name']} 完成...")
-                status, duration = wait_for_completion(session, timeout=600)
-                print(f"  {'✅' if status == 'completed' else '❌'} {agent_info['name']} {status} ({duration}s)")
-                
-                active_sessions[agent_key]["status"] = status
-                tasks[task_id]["subtasks"][agent_key]["status"] = status
-                tasks[task_id]["subtasks"][agent_key]["completed_at"] = datetime.now().isoformat()
-                save_tasks(tasks)
-    
-    # 并行模式：等待所有代理完成
-    if parallel and wait and active_sessions:
-        print(f"\n⏳ 等待所有代理完成...")
-        print("-" * 40)
-        
-        for agent_key, info in active_sessions.items():
-            if info["status"] == "running":
-                print(f"\n📍 检查 {info['agent_name']}...")
-                status, duration = wait_for_completion(info["session"], timeout=600)
-                print(f"  {'✅' if status == 'completed' else '❌'} {status} ({duration}s)")
-                
-                active_sessions[agent_key]["status"] = status
-                tasks[task_id]["subtasks"][agent_key]["status"] = status
-                tasks[task_id]["subtasks"][agent_key]["completed_at"] = datetime.now().isoformat()
-                save_tasks(tasks)
-    
-    # 更新任务状态
-    all_completed = all(
-        s.get("status") in ["completed", "error", "failed"] 
-        for s in tasks[task_id]["subtasks"].values()
-    )
-    tasks[task_id]["status"] = "completed" if all_completed else "partial"
-    tasks[task_id]["completed_at"] = datetime.now().isoformat()
-    save_tasks(tasks)
+    # 更新任务状态（被取消时已记为 cancelled）
+    if finished:
+        _finalize_task(task)
+        save_task(task_id, task)
     
     print()
     print("=" * 60)
-    print(f"✅ Ultrawork 任务完成: {task_id}")
+    if finished:
+        print(f"✅ Ultrawork 任务完成: {task_id}")
+    else:
+        print(f"🛑 Ultrawork 任务已取消: {task_id}（{guard.reason}）")
     print("=" * 60)
     
     return task_id
 
+def ultrawork(task_description, agent_roles=None, parallel=True, wait=True, cache_ttl=None,
+              deadline=None, fail_fast=False):
+    """
+    Ultrawork 模式：一个词激活并行执行
+    
+    示例:
+    ultrawork("部署凡人修仙并写公众号文章", ["kaifa", "gongzhonghao"])
+    """
+    return _run_interruptible(ultrawork_async(task_description, agent_roles, parallel, wait, cache_ttl=cache_ttl,
+                                              deadline=deadline, fail_fast=fail_fast))
+
 # ==================== Ralph Loop 模式 ====================
 
-def ralph_loop(task_description, agent_role, max_retries=5, timeout_per_attempt=600):
+# 检查点提取：匹配代理按提示词格式报告的进展 / 障碍 / 下一步（取最后一次出现）
+CHECKPOINT_PATTERNS = {
+    "progress": re.compile(r"(?:当前进展|已有进展|执行结果摘要|进展|progress)\s*[:：]\s*(.+)", re.IGNORECASE),
+    "blocker": re.compile(r"(?:遇到的障碍|障碍|阻塞|blocker)\s*[:：]\s*(.+)", re.IGNORECASE),
+    "next_step": re.compile(r"(?:建议下一步行动|建议下一步|下一步|next step)\s*[:：]\s*(.+)", re.IGNORECASE),
+}
+CHECKPOINT_HISTORY_LIMIT = 20
+CHECKPOINT_TAIL_CHARS = 800
+
+def _extract_checkpoint(history):
+    """从会话历史尾部提取检查点"""
+    checkpoint = {}
+    for field, pattern in CHECKPOINT_PATTERNS.items():
+        matches = pattern.findall(history)
+        if matches:
+            checkpoint[field] = matches[-1].strip()
+    checkpoint["tail"] = history.strip()[-CHECKPOINT_TAIL_CHARS:]
+    return checkpoint
+
+async def _capture_checkpoint(session):
+    """读取失败会话的历史并提取检查点，读取失败返回 None"""
+    history = await get_session_history_async(session, limit=CHECKPOINT_HISTORY_LIMIT)
+    if not history or not history.strip():
+        return None
+    return _extract_checkpoint(history)
+
+def _build_ralph_task(task_description, attempt, max_retries, checkpoint=None):
+    """构建带检查点的任务"""
+    resume = ""
+    if checkpoint:
+        lines = [f"📌 上次尝试（第 {checkpoint['attempt']} 次，{checkpoint['status']}）的检查点："]
+        for field, label in (("progress", "已有进展"), ("blocker", "遇到的障碍"), ("next_step", "建议下一步")):
+            if checkpoint.get(field):
+                lines.append(f"- {label}: {checkpoint[field]}")
+        if len(lines) == 1:
+            lines.append(f"上次会话最后输出：\n{checkpoint['tail']}")
+        lines.append("请在此基础上继续，不要重复已完成的工作，优先解决上述障碍。")
+        resume = "\n".join(lines) + "\n\n"
+    
+    return f"""【Ralph Loop - 尝试 {attempt}/{max_retries}】
+
+任务: {task_description}
+
+{resume}⚠️ 重要：完成后必须明确报告：
+1. 执行结果摘要
+2. 完成状态: ✅ 完成 / ❌ 未完成
+3. 如果未完成，说明当前进展和遇到的障碍
+4. 建议下一步行动
+
+当前尝试 {attempt}/{max_retries}，如果未完成我会继续尝试。
+"""
+
+# 对冲尝试：当前尝试超过代理历史耗时该百分位仍未结束时，启动下一个并行尝试
+HEDGE_PERCENTILE = 90
+
+def _hedge_delay(agent, timeout):
+    """对冲间隔：历史耗时 p90，样本不足时取单次超时的一半"""
+    durations = _task_store.durations(agent)
+    if len(durations) >= POLL_HISTORY_MIN_SAMPLES:
+        return min(timeout, _percentile(durations, HEDGE_PERCENTILE))
+    return timeout / 2
+
+async def ralph_loop_async(task_description, agent_role, max_retries=5, timeout_per_attempt=600,
+                           task_id=None, hedge=1, cache_ttl=None, deadline=None):
     """
-    Ralph Loop 模式：任务没完成就不停，死磕到底
+    Ralph Loop 模式（异步版本）
     
-    示例:
-    ralph_loop("修复凡人修仙登录bug", "kaifa", max_retries=5)
+    hedge > 1 时每一轮最多并行 hedge 个尝试：第一个尝试超过历史耗时 p90 仍未结束，
+    就再启动一个，先完成者胜出，其余会话被终止。所有尝试共用 max_retries 额度。
+    cache_ttl 不为空时，TTL 内完成过的相同任务直接复用结果。
+    deadline 为所有尝试合计的截止时间（秒），到期后终止在途尝试。
     """
     if agent_role not in AGENTS:
         print(f"❌ 未知代理: {agent_role}")
@@ -325,160 +1892,993 @@ def ralph_loop(task_description, agent_role, max_retries=5, timeout_per_attempt=
     print(f"📝 任务: {task_description}")
     print(f"🤖 代理: {agent_info['name']} ({agent_info['role']})")
     print(f"🔁 最大重试: {max_retries}")
+    if hedge > 1:
+        print(f"🪁 对冲: 每轮最多 {hedge} 个并行尝试")
     print()
     
-    task_id = f"ralph_{int(time.time())}"
-    tasks = load_tasks()
-    tasks[task_id] = {
+    task_id = task_id or new_task_id("ralph")
+    task = {
         "type": "ralph_loop",
         "description": task_description,
         "agent": agent_role,
         "max_retries": max_retries,
         "started_at": datetime.now().isoformat(),
         "status": "running",
+        "owner": _task_owner(),
         "attempts": []
     }
-    save_tasks(tasks)
+    if hedge > 1:
+        task["hedge"] = hedge
+    # Ralph 的提示词随尝试次数和检查点变化，缓存按原始任务描述命中
+    cache_prompt = f"ralph\n{task_description}"
+    cached = _cache_lookup(agent_role, cache_prompt, cache_ttl) if cache_ttl else None
+    if cached:
+        print(f"♻️  命中缓存（{cached['cache_age']}s 前的结果），跳过执行")
+        task["attempts"].append({"attempt": 1, **cached})
+        _finalize_task(task)
+        save_task(task_id, task)
+        print(f"🏁 Ralph Loop 结束: {task_id} (completed，来自缓存)")
+        return task_id
+    save_task(task_id, task)
+    checkpoint = None
+    loop = asyncio.get_running_loop()
+    guard = TaskGuard(task_id, task, deadline)
     
-    for attempt in range(1, max_retries + 1):
-        print(f"\n🔄 第 {attempt}/{max_retries} 次尝试")
-        print("-" * 40)
-        
+    async def run_attempt(record):
+        """执行一次尝试，结果写回 record"""
+        nonlocal checkpoint
+        attempt = record["attempt"]
         # 构建带检查点的任务
-        checkpoint_task = f"""【Ralph Loop - 尝试 {attempt}/{max_retries}】
-
-任务: {task_description}
-
-⚠️ 重要：完成后必须明确报告：
-1. 执行结果摘要
-2. 完成状态: ✅ 完成 / ❌ 未完成
-3. 如果未完成，说明当前进展和遇到的障碍
-4. 建议下一步行动
-
-当前尝试 {attempt}/{max_retries}，如果未完成我会继续尝试。
-"""
+        checkpoint_task = _build_ralph_task(task_description, attempt, max_retries, checkpoint)
+        
+        stats = record.setdefault("stats", {})
+        try:
+            async with _scheduler.slot(agent_info):
+                timeout = guard.budget(timeout_per_attempt)
+                session, success = await spawn_agent_async(agent_info['id'], checkpoint_task,
+                                                           timeout=timeout, stats=stats)
+                
+                if not success:
+                    print(f"  ❌ 尝试 {attempt} 启动失败")
+                    record.update(status="failed", error="Spawn failed")
+                    return record
+                
+                record.update(session=session, status="running")
+                save_task(task_id, task)
+                # 等待任务完成
+                print(f"  ⏳ 等待尝试 {attempt} 完成...")
+                status, duration = await wait_for_completion_async(
+                    session, timeout=timeout, agent=agent_role, stats=stats
+                )
+        except SchedulerFull as e:
+            print(f"  ❌ 尝试 {attempt} 未启动: {e}")
+            record.update(status="failed", error=str(e), rejected=True)
+            return record
         
-        session, success = spawn_agent(agent_info['id'], checkpoint_task, timeout=timeout_per_attempt)
+        record.update(status=status, duration=duration, completed_at=datetime.now().isoformat())
+        if status != "completed":
+            # 保存本次进展，下一次尝试从这里继续
+            captured = await _capture_checkpoint(session)
+            if captured:
+                record["checkpoint"] = captured
+                checkpoint = {"attempt": attempt, "status": status, **captured}
+                if captured.get("blocker"):
+                    print(f"  📌 检查点: {captured['blocker'][:60]}")
+        return record
+    
+    def finish(record):
+        _observe_record(_metrics, agent_role, record, retry=record["attempt"] > 1)
+        save_task(task_id, task)
+    
+    async def run_round(round_no, first_attempt, budget):
+        """
+        执行一轮（1 个主尝试 + 最多 budget-1 个对冲尝试）
+        返回: (胜出的尝试记录或 None, 本轮启动的尝试数)
+        """
+        round_start = loop.time()
+        delay = _hedge_delay(agent_role, timeout_per_attempt) if budget > 1 else None
+        jobs = {}
         
-        if not success:
-            print(f"  ❌ 启动失败，准备重试...")
-            tasks[task_id]["attempts"].append({
-                "attempt": attempt,
-                "status": "failed",
-                "error": "Spawn failed"
-            })
-            save_tasks(tasks)
-            time.sleep(5)
-            continue
+        def launch():
+            attempt = first_attempt + len(jobs)
+            record = {"attempt": attempt, "started_at": datetime.now().isoformat()}
+            if budget > 1:
+                record["hedge"] = {
+                    "round": round_no,
+                    "role": "hedge" if jobs else "primary",
+                    "launched_after": int(loop.time() - round_start),
+                }
+            # 启动时就登记到任务里，取消和崩溃对账都能找到在途尝试
+            task["attempts"].append(record)
+            job = asyncio.ensure_future(run_attempt(record))
+            jobs[job] = record
+            return job
         
-        # 等待任务完成
-        print(f"  ⏳ 等待任务完成...")
-        status, duration = wait_for_completion(session, timeout=timeout_per_attempt)
+        pending = {launch()}
+        winner = None
+        try:
+            while pending and winner is None:
+                wait_timeout = None
+                if len(jobs) < budget:
+                    wait_timeout = max(0, round_start + delay * len(jobs) - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                for job in done:
+                    record = job.result()
+                    if record.get("status") == "completed" and winner is None:
+                        winner = record
+                        if "hedge" in record:
+                            record["hedge"]["outcome"] = "won"
+                    elif "hedge" in record:
+                        record["hedge"]["outcome"] = record.get("status")
+                    finish(record)
+                
+                if not done and len(jobs) < budget:
+                    print(f"  🪁 尝试超过预期耗时 ({int(delay)}s)，启动对冲尝试 {first_attempt + len(jobs)}")
+                    pending.add(launch())
+        except asyncio.CancelledError:
+            # 任务被取消：停止本轮所有尝试，会话由 TaskGuard 统一终止
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            raise
         
-        attempt_record = {
-            "attempt": attempt,
-            "session": session,
-            "status": status,
-            "duration": duration,
-            "completed_at": datetime.now().isoformat()
-        }
-        tasks[task_id]["attempts"].append(attempt_record)
-        save_tasks(tasks)
+        # 胜出后终止其余尝试
+        for job in pending:
+            job.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for job in pending:
+            record = jobs[job]
+            if record.get("session"):
+                await cancel_session_async(record["session"])
+            record.update(status="cancelled", completed_at=datetime.now().isoformat(),
+                          duration=int(loop.time() - round_start) - record["hedge"]["launched_after"])
+            record["hedge"]["outcome"] = "cancelled"
+            print(f"  🛑 尝试 {record['attempt']} 已取消")
+            finish(record)
         
-        if status == "completed":
-            print(f"  ✅ 任务完成！({duration}s)")
-            tasks[task_id]["status"] = "completed"
-            tasks[task_id]["completed_at"] = datetime.now().isoformat()
-            save_tasks(tasks)
-            break
+        return winner, len(jobs)
+    
+    async def rounds():
+        attempt = 0
+        round_no = 0
+        while attempt < max_retries:
+            round_no += 1
+            print(f"\n🔄 第 {attempt + 1}/{max_retries} 次尝试")
+            print("-" * 40)
+            
+            winner, launched = await run_round(round_no, attempt + 1, min(hedge, max_retries - attempt))
+            attempt += launched
+            
+            if winner:
+                print(f"  ✅ 任务完成！({winner['duration']}s)")
+                if cache_ttl:
+                    winner["output"] = await _cache_store(agent_role, cache_prompt, cache_ttl,
+                                                          winner["session"], task_id)
+                task["status"] = "completed"
+                task["completed_at"] = datetime.now().isoformat()
+                save_task(task_id, task)
+                break
+            elif attempt < max_retries:
+                print(f"  ⚠️  未完成，准备重试...")
+                await asyncio.sleep(10)
         else:
-            print(f"  ⚠️  未完成 ({status})，准备重试...")
-            time.sleep(10)
-    else:
-        print(f"\n❌ 达到最大重试次数 ({max_retries})，任务失败")
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["completed_at"] = datetime.now().isoformat()
-        save_tasks(tasks)
+            print(f"\n❌ 达到最大重试次数 ({max_retries})，任务失败")
+            task["status"] = "failed"
+            task["completed_at"] = datetime.now().isoformat()
+            save_task(task_id, task)
+    
+    await guard.run(rounds())
     
     print()
     print("=" * 60)
     print(f"🏁 Ralph Loop 结束: {task_id}")
-    print(f"   状态: {tasks[task_id]['status']}")
-    print(f"   尝试: {len(tasks[task_id]['attempts'])}/{max_retries}")
+    print(f"   状态: {task['status']}")
+    if task.get("cancel_reason"):
+        print(f"   原因: {task['cancel_reason']}")
+    print(f"   尝试: {len(task['attempts'])}/{max_retries}")
+    print("=" * 60)
+    
+    return task_id
+
+def ralph_loop(task_description, agent_role, max_retries=5, timeout_per_attempt=600, hedge=1, cache_ttl=None,
+               deadline=None):
+    """
+    Ralph Loop 模式：任务没完成就不停，死磕到底
+    
+    示例:
+    ralph_loop("修复凡人修仙登录bug", "kaifa", max_retries=5)
+    """
+    return _run_interruptible(ralph_loop_async(task_description, agent_role, max_retries, timeout_per_attempt,
+                                               hedge=hedge, cache_ttl=cache_ttl, deadline=deadline))
+
+# ==================== Workflow 模式 ====================
+
+# 传给下游步骤的上游输出：取会话历史末尾的若干字符
+WORKFLOW_OUTPUT_CHARS = 4000
+WORKFLOW_HISTORY_LIMIT = 20
+WORKFLOW_STEP_TIMEOUT = 600
+# 模板占位符：{{变量}}、{{步骤ID}}（等同 {{步骤ID.output}}）、{{步骤ID.status}}
+_TEMPLATE_RE = re.compile(r"\{\{\s*([\w-]+)(?:\.(output|status))?\s*\}\}")
+
+def validate_workflow(spec):
+    """
+    校验工作流定义并按拓扑序整理步骤
+    
+    格式: {"name": ..., "vars": {...}, "steps": [{"id", "agent", "prompt", "depends_on", "timeout"}]}
+    steps 也可以写成 {步骤ID: {...}}。返回整理后的定义，步骤已按依赖排序。
+    """
+    if not isinstance(spec, dict) or not spec.get("steps"):
+        raise ValueError("工作流定义缺少 steps")
+    raw_steps = spec["steps"]
+    if isinstance(raw_steps, dict):
+        raw_steps = [{"id": step_id, **step} for step_id, step in raw_steps.items()]
+    variables = spec.get("vars") or {}
+    
+    steps = {}
+    for raw in raw_steps:
+        step_id = str(raw.get("id", ""))
+        if not step_id:
+            raise ValueError("每个步骤都需要 id")
+        if step_id in steps:
+            raise ValueError(f"步骤 id 重复: {step_id}")
+        if raw.get("agent") not in AGENTS:
+            raise ValueError(f"步骤 {step_id} 的代理未知: {raw.get('agent')}")
+        if not raw.get("prompt"):
+            raise ValueError(f"步骤 {step_id} 缺少 prompt")
+        depends_on = raw.get("depends_on") or []
+        steps[step_id] = {
+            "id": step_id,
+            "agent": raw["agent"],
+            "prompt": raw["prompt"],
+            "depends_on": [depends_on] if isinstance(depends_on, str) else list(depends_on),
+            "timeout": int(raw.get("timeout", WORKFLOW_STEP_TIMEOUT)),
+        }
+    
+    for step in steps.values():
+        for dep in step["depends_on"]:
+            if dep not in steps:
+                raise ValueError(f"步骤 {step['id']} 依赖的步骤不存在: {dep}")
+        for match in _TEMPLATE_RE.finditer(step["prompt"]):
+            name, field = match.groups()
+            if name in step["depends_on"] or (not field and name in variables):
+                continue
+            raise ValueError(f"步骤 {step['id']} 引用了 {match.group(0)}，它既不是变量也不是声明的依赖")
+    
+    # Kahn 拓扑排序，同层保持定义顺序
+    indegree = {step_id: len(step["depends_on"]) for step_id, step in steps.items()}
+    ready = [step_id for step_id, n in indegree.items() if n == 0]
+    order = []
+    while ready:
+        step_id = ready.pop(0)
+        order.append(steps[step_id])
+        for other in steps.values():
+            if step_id in other["depends_on"]:
+                indegree[other["id"]] -= 1
+                if indegree[other["id"]] == 0:
+                    ready.append(other["id"])
+    if len(order) < len(steps):
+        cycle = sorted(step_id for step_id, n in indegree.items() if n > 0)
+        raise ValueError(f"工作流存在循环依赖: {', '.join(cycle)}")
+    
+    return {"name": spec.get("name") or "workflow", "vars": variables, "steps": order}
+
+def load_workflow(path):
+    """读取工作流文件（JSON；安装了 PyYAML 时也支持 YAML）并校验"""
+    path = Path(path).expanduser()
+    text = path.read_text(encoding="utf-8")
+    if path.suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise ValueError("读取 YAML 工作流需要 PyYAML（pip install pyyaml），或改用 JSON")
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+    return validate_workflow(spec)
+
+def _render_prompt(step, variables, records):
+    """填充步骤模板；模板没有引用任何上游输出时，把上游输出附在末尾"""
+    referenced = set()
+    
+    def substitute(match):
+        name, field = match.groups()
+        if name in step["depends_on"]:
+            referenced.add(name)
+            return str(records[name].get(field or "output") or "")
+        return str(variables[name])
+    
+    prompt = _TEMPLATE_RE.sub(substitute, step["prompt"])
+    missing = [dep for dep in step["depends_on"] if dep not in referenced]
+    if missing:
+        context = "\n\n".join(f"### {dep}\n{records[dep].get('output') or '(无输出)'}" for dep in missing)
+        prompt += f"\n\n上游步骤输出：\n\n{context}"
+    return prompt
+
+async def workflow_async(spec, task_id=None, deadline=None, fail_fast=False):
+    """
+    Workflow 模式：按依赖关系执行多代理步骤（DAG）
+    
+    每个步骤在全部依赖完成后立即启动，互不依赖的分支并发执行，
+    总耗时只取决于关键路径。上游会话的输出经会话历史传给下游。
+    deadline 为整个工作流的截止时间（秒），fail_fast 时任一步骤失败即取消其余步骤。
+    """
+    spec = validate_workflow(spec)
+    
+    print("=" * 60)
+    print("🕸️  Workflow 模式 - 依赖编排")
+    print("=" * 60)
+    print(f"📝 工作流: {spec['name']}")
+    for step in spec["steps"]:
+        after = f" ← {', '.join(step['depends_on'])}" if step["depends_on"] else ""
+        print(f"   • {step['id']} [{AGENTS[step['agent']]['name']}]{after}")
+    print()
+    
+    task_id = task_id or new_task_id("workflow")
+    task = {
+        "type": "workflow",
+        "description": spec["name"],
+        "agents": list(dict.fromkeys(step["agent"] for step in spec["steps"])),
+        "started_at": datetime.now().isoformat(),
+        "status": "running",
+        "owner": _task_owner(),
+        "steps": {
+            step["id"]: {"agent": step["agent"], "depends_on": step["depends_on"], "status": "pending"}
+            for step in spec["steps"]
+        }
+    }
+    save_task(task_id, task)
+    records = task["steps"]
+    jobs = {}
+    guard = TaskGuard(task_id, task, deadline)
+    
+    async def run_step(step):
+        record = records[step["id"]]
+        await asyncio.gather(*(jobs[dep] for dep in step["depends_on"]), return_exceptions=True)
+        
+        blocked = [dep for dep in step["depends_on"] if records[dep].get("status") != "completed"]
+        if blocked:
+            record.update(status="skipped", error=f"上游未完成: {', '.join(blocked)}")
+            print(f"  ⏭️  {step['id']} 跳过（上游未完成: {', '.join(blocked)}）")
+            save_task(task_id, task)
+            return
+        
+        agent_info = AGENTS[step["agent"]]
+        prompt = _render_prompt(step, spec["vars"], records)
+        stats = {}
+        try:
+            async with _scheduler.slot(agent_info):
+                print(f"\n👉 步骤 {step['id']} [{agent_info['role']}] {agent_info['name']}")
+                timeout = guard.budget(step["timeout"])
+                session, success = await spawn_agent_async(
+                    agent_info["id"], prompt, timeout=timeout, stats=stats
+                )
+                if not success:
+                    record.update(status="failed", error="Failed to spawn")
+                    _observe_record(_metrics, step["agent"], record)
+                    save_task(task_id, task)
+                    return
+                
+                record.update(session=session, status="running",
+                              started_at=datetime.now().isoformat(), stats=stats)
+                save_task(task_id, task)
+                status, duration = await wait_for_completion_async(
+                    session, timeout=timeout, label=f"{step['id']} ",
+                    agent=step["agent"], stats=stats
+                )
+        except SchedulerFull as e:
+            print(f"  ❌ {step['id']} 未启动: {e}")
+            record.update(status="failed", error=str(e), rejected=True)
+            _observe_record(_metrics, step["agent"], record)
+            save_task(task_id, task)
+            return
+        
+        record.update(status=status, completed_at=datetime.now().isoformat())
+        if status == "completed":
+            history = await get_session_history_async(session, limit=WORKFLOW_HISTORY_LIMIT)
+            record["output"] = (history or "").strip()[-WORKFLOW_OUTPUT_CHARS:]
+        _observe_record(_metrics, step["agent"], record)
+        print(f"  {'✅' if status == 'completed' else '❌'} {step['id']} {status} ({duration}s)")
+        save_task(task_id, task)
+    
+    async def run_guarded(step):
+        await run_step(step)
+        status = records[step["id"]].get("status")
+        if fail_fast and status not in ("completed", "skipped"):
+            guard.abort(f"fail-fast: 步骤 {step['id']} {status}")
+    
+    async def run_all():
+        # 按拓扑序创建，每个步骤创建时它的依赖都已有对应的 job
+        for step in spec["steps"]:
+            jobs[step["id"]] = asyncio.ensure_future(run_guarded(step))
+        await asyncio.gather(*jobs.values(), return_exceptions=True)
+    
+    if await guard.run(run_all()):
+        _finalize_task(task)
+        save_task(task_id, task)
+    
+    print()
+    print("=" * 60)
+    icon = "✅" if task["status"] == "completed" else "🛑" if task["status"] == "cancelled" else "⚠️ "
+    print(f"{icon} Workflow 结束: {task_id} ({task['status']})")
     print("=" * 60)
     
     return task_id
 
+def workflow(spec, deadline=None, fail_fast=False):
+    """Workflow 模式（同步入口）"""
+    return _run_interruptible(workflow_async(spec, deadline=deadline, fail_fast=fail_fast))
+
+# ==================== 崩溃恢复 ====================
+
+def _task_owner():
+    """当前进程作为任务所属进程"""
+    return {"pid": os.getpid(), "host": socket.gethostname()}
+
+def _owner_alive(task):
+    """任务的所属进程是否仍在运行（没有记录所属进程的旧任务视为已退出）"""
+    owner = task.get("owner")
+    if not owner:
+        return False
+    if owner.get("host") != socket.gethostname():
+        # 其他机器上的进程无法检查，交给它自己处理
+        return True
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _running_records(task):
+    """任务中仍标记为 running 的子任务/尝试记录"""
+    records = [info for _, info in _subtask_items(task)] + task.get("attempts", [])
+    return [r for r in records if r.get("status") == "running"]
+
+async def reconcile_async(wait=True, timeout=600):
+    """
+    对账：找出所属进程已退出的 running 任务，批量查询它们的会话
+    - 会话已结束：记录 completed / error
+    - 会话仍在运行：wait=True 时接管并继续等待，否则保持 running
+    - 无会话 / openclaw 明确报告会话不存在：超过 timeout 记为 timeout，否则记为 failed
+    - 状态未知（openclaw 不可用、输出无法解析）：保持 running，留待下次对账
+    返回: 处理过的任务 ID 列表
+    """
+    _, rows = _task_store.query(status="running")
+    orphans = [(tid, task) for tid, task in rows if not _owner_alive(task)]
+    if not orphans:
+        return []
+    
+    keys = {r["session"] for _, task in orphans for r in _running_records(task) if r.get("session")}
+    statuses = await _status_probe.refresh(keys) if keys else {}
+    now = datetime.now().isoformat()
+    resumed = []
+    unknown = 0
+    
+    for task_id, task in orphans:
+        for record in _running_records(task):
+            session = record.get("session")
+            state = statuses.get(session, "unknown") if session else "not_found"
+            if state in ("completed", "error"):
+                record.update(status=state, completed_at=now)
+            elif state == "running":
+                if wait:
+                    resumed.append((task_id, task, record))
+            elif state == "unknown":
+                # 查不到状态不等于会话丢失，不能据此关闭记录
+                unknown += 1
+            else:
+                elapsed = _elapsed_seconds(record.get("started_at") or task.get("started_at"), now)
+                record.update(
+                    status="timeout" if elapsed is not None and elapsed >= timeout else "failed",
+                    error="会话丢失（所属进程已退出）",
+                    completed_at=now
+                )
+        
+        task["reconciled_at"] = now
+        if wait:
+            task["owner"] = _task_owner()
+        if not _running_records(task):
+            _finalize_task(task)
+            print(f"  🧹 {task_id}: {task['status']}")
+        save_task(task_id, task)
+    
+    if unknown:
+        print(f"  ⚠️  {unknown} 个会话状态未知，保持 running，稍后可再次对账")
+    
+    async def resume(task_id, task, record):
+        elapsed = _elapsed_seconds(record.get("started_at") or task.get("started_at"), now) or 0
+        status, _ = await wait_for_completion_async(record["session"], timeout=max(0, timeout - elapsed))
+        record.update(status=status, completed_at=datetime.now().isoformat())
+        if not _running_records(task):
+            _finalize_task(task)
+        save_task(task_id, task)
+        print(f"  🧹 {task_id}: 会话 {record['session'][:30]} {status}")
+    
+    if resumed:
+        print(f"  ⏳ 接管 {len(resumed)} 个仍在运行的会话...")
+        await asyncio.gather(*(resume(*item) for item in resumed))
+    
+    return [task_id for task_id, _ in orphans]
+
+def reconcile(wait=True):
+    """对账入口（同步）"""
+    print("\n🧹 对账遗留任务")
+    print("=" * 60)
+    reconciled = asyncio.run(reconcile_async(wait=wait))
+    if not reconciled:
+        print("没有遗留任务")
+    return reconciled
+
 # ==================== 状态查询 ====================
 
-def status(task_id=None):
-    """查询任务状态"""
-    tasks = load_tasks()
+def _status_icon(status):
+    return "✅" if status == 'completed' else "🟡" if status == 'running' else "🛑" if status == 'cancelled' else "❌"
+
+def _parse_since(value):
+    """解析 --since：ISO 日期/时间，或相对时间如 30m、12h、7d"""
+    if not value:
+        return None
+    match = re.fullmatch(r"(\d+)([mhd])", value)
+    if match:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        return (datetime.now() - timedelta(**{unit: int(match.group(1))})).isoformat()
+    return datetime.fromisoformat(value).isoformat()
+
+def _print_task(task_id, task):
+    """打印单个任务详情"""
+    if task is None:
+        print(f"❌ 任务 {task_id} 不存在")
+        return
+    print(f"\n📋 任务详情: {task_id}")
+    print("=" * 60)
+    print(f"类型: {task.get('type', 'unknown')}")
+    print(f"状态: {task.get('status', 'unknown')}")
+    print(f"开始: {task.get('started_at', 'N/A')}")
+    print(f"描述: {task.get('description', 'N/A')}")
     
+    if 'subtasks' in task:
+        print(f"\n子任务:")
+        for agent, info in task['subtasks'].items():
+            cached = " ♻️ 缓存" if info.get('cached') else ""
+            print(f"  {_status_icon(info.get('status'))} {AGENTS.get(agent, {}).get('name', agent)}: {info.get('status', 'unknown')}{cached}")
+    
+    if 'steps' in task:
+        print(f"\n步骤:")
+        for step_id, step in task['steps'].items():
+            name = AGENTS.get(step.get('agent'), {}).get('name', step.get('agent'))
+            after = f" ← {', '.join(step['depends_on'])}" if step.get('depends_on') else ""
+            print(f"  {_status_icon(step.get('status'))} {step_id} [{name}]: {step.get('status', 'unknown')}{after}")
+            if step.get('error'):
+                print(f"      {step['error']}")
+    
+    if 'attempts' in task:
+        print(f"\n尝试记录:")
+        for att in task['attempts']:
+            status_icon = "✅" if att.get('status') == 'completed' else "⚠️"
+            hedge = f" [{att['hedge']['role']}]" if att.get('hedge') else " [♻️ 缓存]" if att.get('cached') else ""
+            took = f"来自 {att.get('cached_from')}" if att.get('cached') else f"{att.get('duration', 'N/A')}s"
+            print(f"  {status_icon} 尝试 {att.get('attempt')}{hedge}: {att.get('status')} ({took})")
+            if att.get('checkpoint', {}).get('blocker'):
+                print(f"      📌 障碍: {att['checkpoint']['blocker']}")
+
+def _print_task_list(total, rows, offset, page):
+    """打印任务列表（一页）"""
+    print("\n📊 所有任务:")
+    print("=" * 60)
+    if not rows:
+        print("暂无任务")
+        return
+    for tid, task in rows:
+        print(f"  {_status_icon(task.get('status'))} {tid}: {task.get('type', 'unknown')} | {task.get('status', 'unknown')}")
+    print("-" * 60)
+    print(f"显示 {offset + 1}-{offset + len(rows)} / 共 {total} 个任务")
+    if offset + len(rows) < total:
+        print(f"下一页: --page {page + 1}")
+
+def query_status(task_id=None, status_filter=None, agent=None, since=None, limit=20, page=1):
+    """
+    查询任务状态（不打印）
+    返回: {"task": ...} 或 {"total": ..., "rows": [...], "offset": ...}
+    """
     if task_id:
-        if task_id in tasks:
-            task = tasks[task_id]
-            print(f"\n📋 任务详情: {task_id}")
-            print("=" * 60)
-            print(f"类型: {task.get('type', 'unknown')}")
-            print(f"状态: {task.get('status', 'unknown')}")
-            print(f"开始: {task.get('started_at', 'N/A')}")
-            print(f"描述: {task.get('description', 'N/A')}")
-            
-            if 'subtasks' in task:
-                print(f"\n子任务:")
-                for agent, info in task['subtasks'].items():
-                    status_icon = "✅" if info.get('status') == 'completed' else "🟡" if info.get('status') == 'running' else "❌"
-                    print(f"  {status_icon} {AGENTS.get(agent, {}).get('name', agent)}: {info.get('status', 'unknown')}")
-            
-            if 'attempts' in task:
-                print(f"\n尝试记录:")
-                for att in task['attempts']:
-                    status_icon = "✅" if att.get('status') == 'completed' else "⚠️"
-                    print(f"  {status_icon} 尝试 {att.get('attempt')}: {att.get('status')} ({att.get('duration', 'N/A')}s)")
-        else:
-            print(f"❌ 任务 {task_id} 不存在")
+        return {"task": _task_store.get(task_id)}
+    offset = (page - 1) * limit if limit else 0
+    total, rows = _task_store.query(
+        status=status_filter, agent=agent, since=_parse_since(since),
+        limit=limit, offset=offset
+    )
+    return {"total": total, "rows": rows, "offset": offset}
+
+def _print_status(result, task_id=None, page=1):
+    if task_id:
+        _print_task(task_id, result["task"])
     else:
-        print("\n📊 所有任务:")
-        print("=" * 60)
-        if not tasks:
-            print("暂无任务")
+        _print_task_list(result["total"], result["rows"], result["offset"], page)
+
+def status(task_id=None, status_filter=None, agent=None, since=None, limit=20, page=1):
+    """查询任务状态"""
+    result = query_status(task_id, status_filter, agent, since, limit, page)
+    _print_status(result, task_id, page)
+
+def _fmt_seconds(value):
+    return "-" if value is None else f"{value:.1f}s"
+
+def metrics_report(agent=None, since=None):
+    """打印每个代理的延迟与成功率汇总（p50/p95）"""
+    summary = collect_metrics(agent, _parse_since(since))
+    
+    print(f"\n📈 代理指标{f'（最近 {since}）' if since else ''}")
+    print("=" * 60)
+    if not summary:
+        print("暂无已结束的会话记录")
+        return summary
+    
+    for agent_key, m in summary.items():
+        name = AGENTS.get(agent_key, {}).get("name", agent_key)
+        print(f"{name} ({agent_key}, {m['model']})")
+        print(f"   会话: {m['runs']}  成功率: {m['success_rate']:.0%}  "
+              f"重试: {m['retries']}  超时: {m['timeouts']}  拒绝: {m['rejected']}  轮询: {m['polls']}")
+        print(f"   启动     p50 {_fmt_seconds(m['spawn_p50'])}  p95 {_fmt_seconds(m['spawn_p95'])}")
+        print(f"   运行     p50 {_fmt_seconds(m['run_p50'])}  p95 {_fmt_seconds(m['run_p95'])}")
+        print(f"   发现延迟 p50 {_fmt_seconds(m['lag_p50'])}  p95 {_fmt_seconds(m['lag_p95'])}")
+    return summary
+
+# ==================== 守护进程 ====================
+
+# serve 模式：一个常驻进程持有任务存储、调度器和状态探测器，
+# 所有 ultrawork/ralph 循环跑在同一个事件循环上；CLI 命令通过 Unix socket 提交请求
+DAEMON_SOCKET = Path("~/.openclaw/workspace/.multi_agent.sock").expanduser()
+
+_daemon_jobs = {}
+
+class DaemonError(RuntimeError):
+    """守护进程返回错误，或连接后没有给出完整响应"""
+
+def daemon_request(command, **args):
+    """
+    向守护进程发送一条 JSON 请求
+    守护进程未运行时返回 None，调用方退回本地执行
+    已连上但没有收到完整响应（如处理中途崩溃）时抛出 DaemonError：
+    请求可能已被执行，不能静默退回本地再执行一遍
+    """
+    if not DAEMON_SOCKET.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(DAEMON_SOCKET))
+            sock.sendall((json.dumps({"command": command, "args": args}, default=str) + "\n").encode("utf-8"))
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+    except OSError as e:
+        raise DaemonError(f"与守护进程的连接中断: {e}") from e
+    
+    try:
+        response = json.loads(data)
+    except ValueError:
+        response = None
+    if not isinstance(response, dict):
+        raise DaemonError("守护进程未返回有效响应（可能已崩溃），请检查守护进程后重试")
+    if not response.get("ok"):
+        raise DaemonError(response.get("error", "守护进程返回错误"))
+    return response["result"]
+
+def _start_job(task_id, coro):
+    job = asyncio.ensure_future(coro)
+    _daemon_jobs[task_id] = job
+    job.add_done_callback(lambda _: _daemon_jobs.pop(task_id, None))
+    return job
+
+async def _handle_request(command, args):
+    """处理一条守护进程请求"""
+    if command == "ping":
+        return {"pid": os.getpid(), "jobs": sorted(_daemon_jobs)}
+    
+    if command in ("ultrawork", "ralph", "workflow"):
+        if command == "ultrawork":
+            task_id = new_task_id("ultrawork")
+            coro = ultrawork_async(args["task"], args.get("agents"), task_id=task_id,
+                                   cache_ttl=args.get("cache_ttl"), deadline=args.get("deadline"),
+                                   fail_fast=args.get("fail_fast", False))
+        elif command == "workflow":
+            task_id = new_task_id("workflow")
+            coro = workflow_async(validate_workflow(args["spec"]), task_id=task_id,
+                                  deadline=args.get("deadline"), fail_fast=args.get("fail_fast", False))
+        else:
+            task_id = new_task_id("ralph")
+            coro = ralph_loop_async(args["task"], args["agent"], task_id=task_id,
+                                    hedge=args.get("hedge", 1), cache_ttl=args.get("cache_ttl"),
+                                    deadline=args.get("deadline"))
+        job = _start_job(task_id, coro)
+        if args.get("follow"):
+            await asyncio.shield(job)
+            return {"task_id": task_id, "task": _task_store.get(task_id)}
+        return {"task_id": task_id}
+    
+    if command == "status":
+        return query_status(**args)
+    
+    if command == "cancel":
+        job = _daemon_jobs.get(args["task_id"])
+        if job is None:
+            return {"task_id": args["task_id"], "cancelled": False, "pid": os.getpid()}
+        job.cancel()
+        # 等待任务终止会话、写入 cancelled 后再答复
+        await asyncio.gather(job, return_exceptions=True)
+        return {"task_id": args["task_id"], "cancelled": True, "task": _task_store.get(args["task_id"])}
+    
+    if command == "metrics":
+        return {"text": _metrics.render()}
+    
+    if command == "shutdown":
+        asyncio.get_running_loop().call_soon(_daemon_stop.set)
+        return {"pid": os.getpid()}
+    
+    raise ValueError(f"未知命令: {command}")
+
+async def _handle_client(reader, writer):
+    try:
+        request = json.loads(await reader.readline())
+        result = await _handle_request(request.get("command"), request.get("args", {}))
+        response = {"ok": True, "result": result}
+    except Exception as e:
+        response = {"ok": False, "error": str(e)}
+    try:
+        writer.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def _handle_metrics_http(reader, writer):
+    """极简 HTTP 端点：GET /metrics 返回 Prometheus 文本格式"""
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line[1].split("?")[0] if len(request_line) > 1 else "/"
+        if path == "/metrics":
+            status_line, body = "200 OK", _metrics.render().encode("utf-8")
         else:
-            for tid, task in tasks.items():
-                status_icon = "✅" if task.get('status') == 'completed' else "🟡" if task.get('status') == 'running' else "❌"
-                print(f"  {status_icon} {tid}: {task.get('type', 'unknown')} | {task.get('status', 'unknown')}")
+            status_line, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status_line}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def _write_textfile_loop(path):
+    """定期把指标写入 Prometheus textfile"""
+    while True:
+        write_metrics_textfile(path, _metrics.render())
+        await asyncio.sleep(METRICS_TEXTFILE_INTERVAL)
+
+_daemon_stop = None
+
+async def serve(metrics_port=METRICS_PORT, metrics_textfile=METRICS_TEXTFILE):
+    """运行守护进程，直到收到 SIGINT/SIGTERM 或 shutdown 请求"""
+    global _daemon_stop, _detach_on_cancel
+    
+    if DAEMON_SOCKET.exists():
+        if daemon_request("ping") is not None:
+            print(f"⚠️  守护进程已在运行: {DAEMON_SOCKET}")
+            return
+        DAEMON_SOCKET.unlink()
+    
+    _daemon_stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, _daemon_stop.set)
+    
+    server = await asyncio.start_unix_server(_handle_client, path=str(DAEMON_SOCKET))
+    os.chmod(DAEMON_SOCKET, 0o600)
+    print(f"🛰️  多 Agent 守护进程已启动 (pid {os.getpid()})")
+    print(f"   Socket: {DAEMON_SOCKET}")
+    # 接管上次崩溃遗留的任务
+    _start_job("reconcile", reconcile_async(wait=True))
+    
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await asyncio.start_server(_handle_metrics_http, "127.0.0.1", metrics_port)
+        print(f"   指标: http://127.0.0.1:{metrics_port}/metrics")
+    if metrics_textfile:
+        textfile_job = asyncio.ensure_future(_write_textfile_loop(metrics_textfile))
+        print(f"   指标文件: {metrics_textfile}")
+    
+    try:
+        async with server:
+            await _daemon_stop.wait()
+    finally:
+        # 停止守护进程只放下在途任务，不终止会话，下次启动时对账接管
+        _detach_on_cancel = True
+        for job in list(_daemon_jobs.values()):
+            job.cancel()
+        if metrics_server:
+            metrics_server.close()
+        if metrics_textfile:
+            textfile_job.cancel()
+            write_metrics_textfile(metrics_textfile, _metrics.render())
+        DAEMON_SOCKET.unlink(missing_ok=True)
+        print("🛑 守护进程已停止")
 
 # ==================== CLI 入口 ====================
 
-if __name__ == "__main__":
+def print_usage():
+    print("🤖 多 Agent 协作系统 (生产版本)")
+    print()
+    print("用法:")
+    print("  python multi_agent.py ultrawork '任务描述' [代理列表] [--deadline 30m] [--fail-fast] [--cache-ttl 1h] [--follow] [--local]")
+    print("  python multi_agent.py ralph '任务描述' [代理] [--hedge N] [--deadline 2h] [--cache-ttl 1h] [--follow] [--local]")
+    print("  python multi_agent.py workflow 工作流.json|yaml [--deadline 1h] [--fail-fast] [--follow] [--local]  # 按依赖编排多代理步骤")
+    print("  python multi_agent.py cancel 任务ID  # 取消运行中的任务并终止其会话")
+    print("  python multi_agent.py status [任务ID] [--status running] [--agent kaifa] [--since 7d] [--limit 20] [--page 1]")
+    print("  python multi_agent.py reconcile [--no-wait]  # 对账所属进程已退出的 running 任务")
+    print("  python multi_agent.py metrics [--agent kaifa] [--since 7d] [--prom] [--textfile 路径]")
+    print("  python multi_agent.py migrate    # JSON 任务存储一次性导入 SQLite")
+    print("  python multi_agent.py serve [--metrics-port 9464]  # 启动守护进程（之后的命令自动提交给它）")
+    print("  python multi_agent.py stop       # 停止守护进程")
+    print()
+    print("可用代理:")
+    for k, v in AGENTS.items():
+        print(f"  {k}: {v['name']} - {v['role']}")
+
+def _submit(command, args, **request):
+    """命令优先提交给守护进程；返回 False 表示需要本地执行"""
+    if args.local:
+        return False
+    result = daemon_request(command, follow=args.follow, **request)
+    if result is None:
+        return False
+    if args.follow:
+        _print_task(result["task_id"], result["task"])
+    else:
+        print(f"🛰️  已提交到守护进程: {result['task_id']}")
+        print(f"   查看进度: python multi_agent.py status {result['task_id']}")
+    return True
+
+def main():
     if len(sys.argv) < 2:
-        print("🤖 多 Agent 协作系统 (生产版本)")
-        print()
-        print("用法:")
-        print("  python multi_agent.py ultrawork '任务描述' [代理列表]")
-        print("  python multi_agent.py ralph '任务描述' [代理]")
-        print("  python multi_agent.py status [任务ID]")
-        print()
-        print("可用代理:")
-        for k, v in AGENTS.items():
-            print(f"  {k}: {v['name']} - {v['role']}")
+        print_usage()
         sys.exit(0)
     
-    command = sys.argv[1]
+    parser = argparse.ArgumentParser(description="多 Agent 协作系统")
+    subparsers = parser.add_subparsers(dest="command")
     
-    if command == "ultrawork":
-        task = sys.argv[2] if len(sys.argv) > 2 else "默认任务"
-        agents = sys.argv[3].split(",") if len(sys.argv) > 3 else None
-        ultrawork(task, agents)
+    p_ultra = subparsers.add_parser("ultrawork", help="Ultrawork 并行模式")
+    p_ultra.add_argument("task", nargs="?", default="默认任务")
+    p_ultra.add_argument("agents", nargs="?", help="代理列表，逗号分隔")
     
-    elif command == "ralph":
-        task = sys.argv[2] if len(sys.argv) > 2 else "默认任务"
-        agent = sys.argv[3] if len(sys.argv) > 3 else "kaifa"
-        ralph_loop(task, agent)
+    p_ralph = subparsers.add_parser("ralph", help="Ralph Loop 死磕模式")
+    p_ralph.add_argument("task", nargs="?", default="默认任务")
+    p_ralph.add_argument("agent", nargs="?", default="kaifa")
+    p_ralph.add_argument("--hedge", type=int, default=1, help="每轮最多并行尝试数（超过历史耗时 p90 时启动对冲）")
     
-    elif command == "status":
-        task_id = sys.argv[2] if len(sys.argv) > 2 else None
-        status(task_id)
+    p_workflow = subparsers.add_parser("workflow", help="Workflow 依赖编排模式")
+    p_workflow.add_argument("file", help="工作流定义文件（JSON/YAML）")
     
-    else:
-        print(f"❌ 未知命令: {command}")
+    for p in (p_ultra, p_ralph):
+        p.add_argument("--cache-ttl", type=parse_ttl, help="复用该时长内相同任务的结果（秒，或 30m/12h/1d）")
+    
+    for p in (p_ultra, p_ralph, p_workflow):
+        p.add_argument("--deadline", type=parse_ttl, help="整个任务的截止时间（秒，或 30m/2h），到期终止所有会话")
+    for p in (p_ultra, p_workflow):
+        p.add_argument("--fail-fast", action="store_true", help="任一代理/步骤失败即取消其余会话")
+    
+    for p in (p_ultra, p_ralph, p_workflow):
+        p.add_argument("--follow", action="store_true", help="提交给守护进程后等待任务结束")
+        p.add_argument("--local", action="store_true", help="不使用守护进程，在当前进程执行")
+    
+    p_status = subparsers.add_parser("status", help="查询任务状态")
+    p_status.add_argument("task_id", nargs="?")
+    p_status.add_argument("--status", dest="status_filter", help="按状态过滤 (running/completed/failed/partial)")
+    p_status.add_argument("--agent", help="按代理过滤")
+    p_status.add_argument("--since", help="开始时间下限：ISO 日期或相对时间 (30m/12h/7d)")
+    p_status.add_argument("--limit", type=int, default=20, help="每页条数 (0 表示全部)")
+    p_status.add_argument("--page", type=int, default=1)
+    
+    p_cancel = subparsers.add_parser("cancel", help="取消运行中的任务并终止其会话")
+    p_cancel.add_argument("task_id")
+    
+    p_reconcile = subparsers.add_parser("reconcile", help="对账所属进程已退出的 running 任务")
+    p_reconcile.add_argument("--no-wait", action="store_true", help="不接管仍在运行的会话")
+    
+    p_metrics = subparsers.add_parser("metrics", help="每个代理的延迟与成功率指标")
+    p_metrics.add_argument("--agent", help="只看某个代理")
+    p_metrics.add_argument("--since", help="时间范围下限：ISO 日期或相对时间 (30m/12h/7d)")
+    p_metrics.add_argument("--prom", action="store_true", help="输出 Prometheus 文本格式")
+    p_metrics.add_argument("--textfile", help="把 Prometheus 文本格式写入文件（node_exporter textfile）")
+    
+    subparsers.add_parser("migrate", help="JSON 任务存储一次性导入 SQLite")
+    p_serve = subparsers.add_parser("serve", help="启动守护进程")
+    p_serve.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="HTTP 指标端口（0 表示不开启）")
+    p_serve.add_argument("--metrics-textfile", default=METRICS_TEXTFILE, help="定期写入的 Prometheus textfile 路径")
+    subparsers.add_parser("stop", help="停止守护进程")
+    
+    if sys.argv[1] not in subparsers.choices:
+        print(f"❌ 未知命令: {sys.argv[1]}")
+        sys.exit(1)
+    
+    args = parser.parse_args()
+    
+    if args.command == "ultrawork":
+        agents = args.agents.split(",") if args.agents else None
+        if not _submit("ultrawork", args, task=args.task, agents=agents, cache_ttl=args.cache_ttl,
+                       deadline=args.deadline, fail_fast=args.fail_fast):
+            ultrawork(args.task, agents, cache_ttl=args.cache_ttl, deadline=args.deadline, fail_fast=args.fail_fast)
+    
+    elif args.command == "ralph":
+        if not _submit("ralph", args, task=args.task, agent=args.agent, hedge=args.hedge,
+                       cache_ttl=args.cache_ttl, deadline=args.deadline):
+            ralph_loop(args.task, args.agent, hedge=args.hedge, cache_ttl=args.cache_ttl, deadline=args.deadline)
+    
+    elif args.command == "workflow":
+        try:
+            spec = load_workflow(args.file)
+        except (OSError, ValueError) as e:
+            print(f"❌ 工作流无效: {e}")
+            sys.exit(1)
+        if not _submit("workflow", args, spec=spec, deadline=args.deadline, fail_fast=args.fail_fast):
+            workflow(spec, deadline=args.deadline, fail_fast=args.fail_fast)
+    
+    elif args.command == "status":
+        query = dict(task_id=args.task_id, status_filter=args.status_filter, agent=args.agent,
+                     since=args.since, limit=args.limit, page=args.page)
+        result = daemon_request("status", **query)
+        if result is None:
+            # 没有守护进程时先快速对账，避免把僵尸任务显示为 running
+            asyncio.run(reconcile_async(wait=False))
+            result = query_status(**query)
+        _print_status(result, args.task_id, args.page)
+    
+    elif args.command == "cancel":
+        if not cancel_task(args.task_id):
+            sys.exit(1)
+    
+    elif args.command == "reconcile":
+        reconcile(wait=not args.no_wait)
+    
+    elif args.command == "metrics":
+        if args.prom or args.textfile:
+            # 守护进程在运行时导出它的实时指标（含 fork 计数），否则从任务存储重建
+            live = daemon_request("metrics") if not (args.agent or args.since) else None
+            text = live["text"] if live else metrics_from_store(args.agent, _parse_since(args.since)).render()
+            if args.textfile:
+                write_metrics_textfile(args.textfile, text)
+                print(f"📝 指标已写入: {args.textfile}")
+            else:
+                print(text, end="")
+        else:
+            metrics_report(args.agent, args.since)
+    
+    elif args.command == "migrate":
+        migrate_tasks()
+    
+    elif args.command == "serve":
+        asyncio.run(serve(args.metrics_port, args.metrics_textfile))
+    
+    elif args.command == "stop":
+        if daemon_request("shutdown") is None:
+            print("守护进程未运行")
+        else:
+            print("🛑 已通知守护进程停止")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except DaemonError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
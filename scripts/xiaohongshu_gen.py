@@ -2,11 +2,18 @@
 """
 图文排版工具 - 生成小红书风格的图文卡片
 Usage: python3 xiaohongshu_gen.py --text "你的文字内容" --output card.png
+       python3 xiaohongshu_gen.py --batch posts.jsonl --out-dir cards/ [--workers 8]
 """
 
 import argparse
+import json
 import os
 import re
+import sys
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from multiprocessing import Pool
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import textwrap
 
@@ -23,6 +30,84 @@ COLORS = {
     'border': '#BDBDBD',       # 边框灰
 }
 
+
+class GlyphCache:
+    """字宽缓存：按 (字体文件, 字号, 字符) 记录步进宽度，每个字符只测量一次
+
+    所有测量共用一个 1x1 画布的绘制上下文，不再每次调用都新建 Image/ImageDraw。
+    整段文字的包围盒按文本缓存，条目数有上限，批量渲染的长驻进程里不会无限增长。
+    """
+
+    def __init__(self, max_sizes=1024):
+        self._advances = {}
+        self._sizes = OrderedDict()
+        self.max_sizes = max_sizes
+        self._draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+    @staticmethod
+    def _font_key(font):
+        return (getattr(font, 'path', None) or id(font), getattr(font, 'size', None))
+
+    def advance(self, font, char):
+        """单个字符的步进宽度"""
+        key = (self._font_key(font), char)
+        width = self._advances.get(key)
+        if width is None:
+            if hasattr(font, 'getlength'):
+                width = font.getlength(char)
+            else:
+                bbox = self._draw.textbbox((0, 0), char, font=font)
+                width = bbox[2] - bbox[0]
+            self._advances[key] = width
+        return width
+
+    def width(self, font, text):
+        """整段文字宽度（逐字步进宽度之和）"""
+        return sum(self.advance(font, char) for char in text)
+
+    def size(self, font, text):
+        """文字包围盒尺寸 (宽, 高)，用于高亮底色等需要真实高度的地方"""
+        key = (self._font_key(font), text)
+        size = self._sizes.get(key)
+        if size is not None:
+            self._sizes.move_to_end(key)
+            return size
+        bbox = self._draw.textbbox((0, 0), text, font=font)
+        size = self._sizes[key] = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+        if len(self._sizes) > self.max_sizes:
+            # 淘汰最久未用的条目
+            self._sizes.popitem(last=False)
+        return size
+
+
+# 进程内共享：同一字体在多次生成之间复用测量结果
+_glyphs = GlyphCache()
+
+# 字体候选路径，按顺序使用第一个能加载的
+FONT_PATHS = (
+    # macOS 中文字体
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Light.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    # Linux
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    # 通用
+    "/System/Library/Fonts/Helvetica.ttc",
+)
+
+
+@lru_cache(maxsize=None)
+def load_font(font_paths, size):
+    """按 (候选路径, 字号) 缓存字体：每个进程只探测路径、加载 TrueType 一次"""
+    for path in font_paths:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except:
+                pass
+    return ImageFont.load_default()
+
 class CardGenerator:
     def __init__(self, width=800, bg_color='bg_blue'):
         self.width = width
@@ -31,17 +116,7 @@ class CardGenerator:
         self.bg_color = COLORS.get(bg_color, COLORS['bg_blue'])
         
         # 尝试加载字体
-        self.font_paths = [
-            # macOS 中文字体
-            "/System/Library/Fonts/PingFang.ttc",
-            "/System/Library/Fonts/STHeiti Light.ttc",
-            "/Library/Fonts/Arial Unicode.ttf",
-            # Linux
-            "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-            "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-            # 通用
-            "/System/Library/Fonts/Helvetica.ttc",
-        ]
+        self.font_paths = list(FONT_PATHS)
         
         self.title_font = self._load_font(48, bold=True)
         self.body_font = self._load_font(36)
@@ -49,40 +124,45 @@ class CardGenerator:
         
     def _load_font(self, size, bold=False):
         """尝试加载字体，失败则用默认字体"""
-        for path in self.font_paths:
-            if os.path.exists(path):
-                try:
-                    return ImageFont.truetype(path, size)
-                except:
-                    pass
-        return ImageFont.load_default()
+        return load_font(tuple(self.font_paths), size)
     
     def get_text_size(self, text, font):
         """获取文字尺寸"""
-        img = Image.new('RGB', (1, 1))
-        draw = ImageDraw.Draw(img)
-        bbox = draw.textbbox((0, 0), text, font=font)
-        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+        return _glyphs.size(font, text)
     
     def wrap_text(self, text, font, max_width):
         """自动换行"""
-        words = text
-        lines = []
-        current_line = ""
+        return [''.join(seg[1] for seg in line) for line in self.layout_text([('normal', text)], font, max_width)]
+    
+    def layout_text(self, parts, font, max_width):
+        """单遍断行：按字宽缓存逐字累加，超宽即换行
         
-        for char in words:
-            test_line = current_line + char
-            w, h = self.get_text_size(test_line, font)
-            if w <= max_width:
-                current_line = test_line
+        返回行列表，每行是 (x, 文本, 类型, 宽度) 片段；连续的普通文字合并成一个片段，
+        高亮片段整体换行。测量结果直接用于绘制，不再重复测量。
+        """
+        lines = [[]]
+        x = 0
+        for part_type, part_text in parts:
+            if part_type == 'normal':
+                run_start, run = x, []
+                for char in part_text:
+                    char_w = _glyphs.advance(font, char)
+                    if x + char_w > max_width and x > 0:
+                        if run:
+                            lines[-1].append((run_start, ''.join(run), part_type, x - run_start))
+                        lines.append([])
+                        x, run_start, run = 0, 0, []
+                    run.append(char)
+                    x += char_w
+                if run:
+                    lines[-1].append((run_start, ''.join(run), part_type, x - run_start))
             else:
-                if current_line:
-                    lines.append(current_line)
-                current_line = char
-        
-        if current_line:
-            lines.append(current_line)
-        
+                text_w = _glyphs.width(font, part_text)
+                if x + text_w > max_width and x > 0:
+                    lines.append([])
+                    x = 0
+                lines[-1].append((x, part_text, part_type, text_w))
+                x += text_w
         return lines
     
     def parse_highlights(self, text):
@@ -118,66 +198,47 @@ class CardGenerator:
         x1, y1, x2, y2 = xy
         draw.rounded_rectangle(xy, radius=radius, fill=fill)
     
+    def draw_layout(self, draw, x, y, lines, font, line_height, padding=6, radius=8, offsets=(2, 4), center=False):
+        """按 layout_text 的结果绘制，返回绘制后的 y 坐标"""
+        for line in lines:
+            line_x = x
+            if center and line:
+                last_x, _, _, last_w = line[-1]
+                line_x = (self.width - int(last_x + last_w)) // 2
+            for seg_x, seg_text, seg_type, seg_w in line:
+                left = line_x + seg_x
+                if seg_type != 'normal':
+                    # 绘制高亮背景
+                    _, text_h = self.get_text_size(seg_text, font)
+                    self.draw_rounded_rect(
+                        draw,
+                        (left - padding, y - offsets[0], left + seg_w + padding, y + text_h + offsets[1]),
+                        radius=radius,
+                        fill=COLORS.get(seg_type, COLORS['highlight_yellow'])
+                    )
+                draw.text((left, y), seg_text, font=font, fill=COLORS['text_dark'])
+            y += line_height
+        return y
+    
     def draw_text_with_highlights(self, draw, x, y, text, font, max_width, line_height):
         """绘制带高亮的文字，返回绘制后的 y 坐标"""
-        parts = self.parse_highlights(text)
-        current_x = x
-        current_y = y
-        
-        for part_type, part_text in parts:
-            if part_type == 'normal':
-                # 普通文字 - 需要按字符处理换行
-                for char in part_text:
-                    char_w, char_h = self.get_text_size(char, font)
-                    
-                    # 检查是否需要换行
-                    if current_x + char_w > x + max_width:
-                        current_x = x
-                        current_y += line_height
-                    
-                    # 绘制字符
-                    draw.text((current_x, current_y), char, font=font, fill=COLORS['text_dark'])
-                    current_x += char_w
-                    
-            else:
-                # 高亮文字
-                highlight_color = COLORS.get(part_type, COLORS['highlight_yellow'])
-                text_w, text_h = self.get_text_size(part_text, font)
-                
-                # 检查是否需要换行
-                if current_x + text_w > x + max_width:
-                    current_x = x
-                    current_y += line_height
-                
-                # 绘制高亮背景
-                padding = 6
-                self.draw_rounded_rect(
-                    draw, 
-                    (current_x - padding, current_y - 2, current_x + text_w + padding, current_y + text_h + 4),
-                    radius=8,
-                    fill=highlight_color
-                )
-                
-                # 绘制文字
-                draw.text((current_x, current_y), part_text, font=font, fill=COLORS['text_dark'])
-                current_x += text_w
-        
-        return current_y + line_height
+        lines = self.layout_text(self.parse_highlights(text), font, max_width)
+        return self.draw_layout(draw, x, y, lines, font, line_height)
     
-    def generate(self, title, body_text, output_path, emoji=None):
+    def generate(self, title, body_text, output_path, emoji=None, quiet=False):
         """生成图文卡片"""
         # 计算高度
         max_text_width = self.width - (self.padding * 2)
         
-        # 估算标题高度
-        title_lines = self.wrap_text(title, self.title_font, max_text_width)
+        # 先排版再建画布：标题和正文的实际行数决定高度，绘制时复用同一份排版结果
+        title_lines = self.layout_text(self.parse_highlights(title), self.title_font, max_text_width) if title else []
         title_height = len(title_lines) * 70
         
-        # 估算正文高度（大致计算）
-        body_height = 0
-        for line in body_text.split('\n'):
-            if line.strip():
-                body_height += 60
+        body_layouts = [
+            self.layout_text(self.parse_highlights(line.strip()), self.body_font, max_text_width - 40)
+            for line in body_text.split('\n') if line.strip()
+        ]
+        body_height = sum(len(lines) for lines in body_layouts) * 60
         
         # 总高度
         total_height = (self.padding * 2) + title_height + 40 + body_height + 100
@@ -197,61 +258,16 @@ class CardGenerator:
         
         current_y = self.padding
         
-        # 绘制标题
+        # 绘制标题（每行居中，[[ ]] 高亮）
         if title:
-            # 标题高亮处理
-            title_x = self.padding + 20
-            title_y = current_y
-            
-            # 简单处理：如果有[[ ]]就居中显示
-            if '[[' in title and ']]' in title:
-                # 提取高亮部分
-                match = re.search(r'\[\[(.+?)\]\]', title)
-                if match:
-                    before = title[:match.start()]
-                    highlight = match.group(1)
-                    after = title[match.end():]
-                    
-                    # 组合绘制
-                    full_text = before + highlight + after
-                    text_w, _ = self.get_text_size(full_text, self.title_font)
-                    start_x = (self.width - text_w) // 2
-                    
-                    # 绘制普通部分
-                    if before:
-                        draw.text((start_x, title_y), before, font=self.title_font, fill=COLORS['text_dark'])
-                        start_x += self.get_text_size(before, self.title_font)[0]
-                    
-                    # 绘制高亮
-                    hl_w, hl_h = self.get_text_size(highlight, self.title_font)
-                    padding = 8
-                    self.draw_rounded_rect(
-                        draw,
-                        (start_x - padding, title_y - 4, start_x + hl_w + padding, title_y + hl_h + 4),
-                        radius=10,
-                        fill=COLORS['highlight_pink']
-                    )
-                    draw.text((start_x, title_y), highlight, font=self.title_font, fill=COLORS['text_dark'])
-                    start_x += hl_w
-                    
-                    # 绘制剩余部分
-                    if after:
-                        draw.text((start_x, title_y), after, font=self.title_font, fill=COLORS['text_dark'])
-            else:
-                # 普通标题，居中
-                text_w, _ = self.get_text_size(title, self.title_font)
-                draw.text(((self.width - text_w) // 2, title_y), title, font=self.title_font, fill=COLORS['text_dark'])
-            
+            self.draw_layout(draw, 0, current_y, title_lines, self.title_font, 70,
+                             padding=8, radius=10, offsets=(4, 4), center=True)
             current_y += title_height + 40
         
         # 绘制正文
         body_x = self.padding + 20
-        for line in body_text.split('\n'):
-            if line.strip():
-                current_y = self.draw_text_with_highlights(
-                    draw, body_x, current_y, line.strip(), 
-                    self.body_font, max_text_width - 40, 60
-                )
+        for lines in body_layouts:
+            current_y = self.draw_layout(draw, body_x, current_y, lines, self.body_font, 60)
         
         # 添加装饰表情（如果提供）
         if emoji:
@@ -262,30 +278,111 @@ class CardGenerator:
         
         # 保存
         img.save(output_path, quality=95)
-        print(f"✅ 已生成: {output_path}")
+        if not quiet:
+            print(f"✅ 已生成: {output_path}")
         return output_path
 
 
+def split_title(text, title=''):
+    """没有标题时，取正文第一行作为标题"""
+    if not title and '\n' in text:
+        lines = text.split('\n')
+        return lines[0], '\n'.join(lines[1:])
+    return title, text
+
+
+# ==================== 批量模式 ====================
+
+# 每个工作进程按 (宽度, 背景) 复用 CardGenerator，字体和字宽缓存随进程常驻
+_worker_generators = {}
+
+
+def _render_job(item):
+    """工作进程：渲染一张卡片，返回 (序号, 输出路径, 错误信息)"""
+    index, job, out_dir = item
+    if '_error' in job:
+        return index, None, job['_error']
+    try:
+        key = (int(job.get('width', 800)), job.get('bg', 'bg_blue'))
+        gen = _worker_generators.get(key)
+        if gen is None:
+            gen = _worker_generators[key] = CardGenerator(width=key[0], bg_color=key[1])
+        title, body = split_title(job['text'], job.get('title', ''))
+        output = os.path.join(out_dir, job.get('output') or f"card_{index:04d}.png")
+        gen.generate(title, body, output, job.get('emoji', '🦐'), quiet=True)
+        return index, output, None
+    except Exception as e:
+        return index, None, f"{type(e).__name__}: {e}"
+
+
+def _read_jobs(path, out_dir, defaults=None):
+    """逐行读取 JSONL（不整体载入内存），每行 {"text": ..., "title"/"output"/"bg"/"emoji"/"width": 可选}"""
+    with open(path, encoding='utf-8') as f:
+        index = 0
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            index += 1
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                job = {'_error': f"第 {lineno} 行不是合法 JSON: {e}"}
+            if isinstance(job, str):
+                job = {'text': job}
+            if not isinstance(job, dict) or ('text' not in job and '_error' not in job):
+                job = {'_error': f"第 {lineno} 行缺少 text 字段"}
+            yield index, {**(defaults or {}), **job}, out_dir
+
+
+def render_batch(input_path, out_dir, workers=None, defaults=None):
+    """进程池批量渲染：每个进程只加载一次字体，卡片完成一张输出一张
+
+    defaults 是每行未指定时使用的 bg/emoji/width。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+    done = failed = 0
+
+    print(f"🚀 批量渲染: {input_path} → {out_dir}（{workers} 个进程）")
+    with Pool(processes=workers) as pool:
+        for index, output, error in pool.imap_unordered(_render_job, _read_jobs(input_path, out_dir, defaults)):
+            if error:
+                failed += 1
+                print(f"❌ #{index}: {error}", flush=True)
+            else:
+                done += 1
+                print(f"✅ #{index}: {output}", flush=True)
+
+    elapsed = time.time() - started
+    print(f"\n📊 完成 {done} 张，失败 {failed} 张，用时 {elapsed:.1f}s")
+    return failed == 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='生成小红书风格图文卡片')
-    parser.add_argument('--text', '-t', required=True, help='正文内容（支持 [[高亮]] 和 {{高亮}} 标记）')
+    parser.add_argument('--text', '-t', help='正文内容（支持 [[高亮]] 和 {{高亮}} 标记）')
     parser.add_argument('--title', '-T', default='', help='标题')
     parser.add_argument('--output', '-o', default='card.png', help='输出文件路径')
     parser.add_argument('--bg', '-b', default='bg_blue', choices=['bg_blue', 'bg_pink', 'bg_green', 'bg_purple'], 
                         help='背景颜色')
     parser.add_argument('--emoji', '-e', default='🦐', help='底部装饰表情')
     parser.add_argument('--width', '-w', type=int, default=800, help='图片宽度')
+    parser.add_argument('--batch', help='批量模式：JSONL 文件，每行 {"text": ..., "title"/"output"/"bg"/"emoji"/"width": 可选}')
+    parser.add_argument('--out-dir', default='cards', help='批量模式输出目录（默认 cards）')
+    parser.add_argument('--workers', type=int, help='批量模式进程数（默认 CPU 核数）')
     
     args = parser.parse_args()
     
-    # 如果没有标题，尝试从文本中提取第一行
-    title = args.title
-    body = args.text
+    if args.batch:
+        defaults = {'bg': args.bg, 'emoji': args.emoji, 'width': args.width}
+        sys.exit(0 if render_batch(args.batch, args.out_dir, args.workers, defaults) else 1)
+    if not args.text:
+        parser.error('需要 --text（或使用 --batch）')
     
-    if not title and '\n' in args.text:
-        lines = args.text.split('\n')
-        title = lines[0]
-        body = '\n'.join(lines[1:])
+    # 如果没有标题，尝试从文本中提取第一行
+    title, body = split_title(args.text, args.title)
     
     gen = CardGenerator(width=args.width, bg_color=args.bg)
     gen.generate(title, body, args.output, args.emoji)
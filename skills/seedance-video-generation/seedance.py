@@ -9,71 +9,488 @@ Usage:
   python3 seedance.py create --draft-task-id <task_id> [options]
   python3 seedance.py status <task_id>
   python3 seedance.py wait <task_id> [--interval 15] [--download ~/Desktop]
-  python3 seedance.py list [--status succeeded] [--page 1] [--page-size 10]
+  python3 seedance.py download <task_id> [--output-dir ~/Desktop] [--parallel 4]
+  python3 seedance.py watch [--download ~/Desktop] [--forever]
+  python3 seedance.py list [--status succeeded] [--page 1] [--page-size 10] [--local]
+  python3 seedance.py stats [--since 7d] [--json]
   python3 seedance.py delete <task_id>
+  python3 seedance.py pipeline --prompt "描述" [--variants 4] [--select first:1] [--final-resolution 720p]
+  python3 seedance.py batch jobs.jsonl [--concurrency 8] [--rps 5] [--output results.jsonl] [--download ~/Desktop]
 """
 
 import argparse
 import base64
+import hashlib
+import http.client
+import importlib
 import json
+import mmap
 import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
 import sys
+import threading
 import time
 import urllib.request
 import urllib.error
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlencode, urlsplit
 
 
 BASE_URL = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
 DEFAULT_MODEL = "doubao-seedance-1-5-pro-251215"
 
+DOWNLOAD_CHUNK = 1024 * 1024            # bytes read per streaming step
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024    # files are only split into ranges of at least this size
+DOWNLOAD_PARTS = 4                      # max parallel ranges per file
+DOWNLOAD_RETRIES = 5                    # reconnect attempts per range before giving up
+
+API_RETRIES = int(os.environ.get("SEEDANCE_API_RETRIES", "5"))  # extra attempts for transient failures
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "expired", "cancelled")
+
+BASE64_CHUNK = 3 * 256 * 1024           # image bytes encoded per body chunk (multiple of 3: no mid-stream padding)
+
+CACHE_DIR = Path(os.environ.get("SEEDANCE_CACHE_DIR", "~/.cache/seedance")).expanduser()
+IMAGE_CACHE_DIR = CACHE_DIR / "images"
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("SEEDANCE_IMAGE_CACHE_MB", "512")) * 1024 * 1024  # 0 disables the cache
+LEDGER_PATH = Path(os.environ.get("SEEDANCE_LEDGER", CACHE_DIR / "ledger.sqlite3")).expanduser()  # "0" disables
+
+
+class SeedanceError(Exception):
+    """Error reported to the user by main() (message on stderr, exit code 1)."""
+
+
+class ApiError(SeedanceError):
+    """API or network failure. `code` is the HTTP status, or None for network errors and unreadable responses."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def transient(self):
+        """Network errors, throttling and 5xx may succeed on a later attempt."""
+        return self.code is None or self.code in RETRYABLE_STATUS
+
+
+class DownloadError(SeedanceError):
+    """Video download failed after all retries or could not be verified."""
+
 
 def get_api_key():
     key = os.environ.get("ARK_API_KEY")
     if not key:
-        print("Error: ARK_API_KEY environment variable is not set.", file=sys.stderr)
-        print("Set it with: export ARK_API_KEY='your-api-key-here'", file=sys.stderr)
-        sys.exit(1)
+        raise SeedanceError(
+            "Error: ARK_API_KEY environment variable is not set.\n"
+            "Set it with: export ARK_API_KEY='your-api-key-here'"
+        )
     return key
 
 
-def api_request(method, url, data=None):
-    """Make an API request and return parsed JSON response."""
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to a single host.
+
+    Every request reuses an idle connection when one is available, so a
+    long poll loop or a batch of creates pays for one TLS handshake per
+    connection instead of one per request.
+    """
+
+    def __init__(self, base_url, maxsize=8, timeout=30):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        # urlopen honours HTTPS_PROXY; keep that working by tunnelling through the proxy
+        proxy = urllib.request.getproxies().get(self.scheme)
+        if self.scheme == "https" and proxy and not urllib.request.proxy_bypass(self.host):
+            p = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+            conn = cls(p.hostname, p.port or 80, timeout=self.timeout)
+            conn.set_tunnel(self.host, self.port)
+            return conn
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+
+    def request(self, method, path, body=None, headers=None):
+        """Send one request and return (status, headers, body bytes)."""
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # The server dropped an idle keep-alive connection; retry once on a fresh one.
+                # Only safe for reads: a POST may already have been applied, so the caller decides.
+                if reused and method in ("GET", "HEAD"):
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, resp.headers, data
+
+
+class TokenBucket:
+    """Client-side rate limit shared by all threads.
+
+    Sustains `rate` requests per second with bursts of up to `burst`; rate 0
+    means unlimited. A 429 pauses every caller until Retry-After has passed
+    and halves the rate, which then creeps back to the configured value as
+    requests succeed again.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self.max_rate = self.rate = float(rate or 0)
+            self.burst = float(burst or max(1.0, self.rate))
+            self._tokens = self.burst
+            self._stamp = time.monotonic()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                    self._stamp = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def throttled(self, pause):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            if self.rate:
+                self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+_pool = ConnectionPool(BASE_URL)
+_rate_limiter = TokenBucket()
+
+
+def _retry_after(headers):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = (headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def api_request(method, url, data=None, idempotency_key=None, on_ambiguous=None):
+    """Make an API request and return parsed JSON response. Raises ApiError on failure.
+
+    Network errors, 429 and 5xx are retried with exponential backoff, honouring
+    Retry-After. A POST is only re-sent when it certainly had no effect
+    (connection refused, 429); if it may have reached the server, `on_ambiguous`
+    is asked to find the result first and the request is re-sent only when it
+    returns None. Without `on_ambiguous` such a POST fails immediately.
+    """
     api_key = get_api_key()
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
-
-    body = json.dumps(data).encode("utf-8") if data else None
-    req = urllib.request.Request(url, data=body, headers=headers, method=method)
-
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            resp_body = resp.read().decode("utf-8")
-            if resp_body:
-                return json.loads(resp_body)
-            return {}
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8", errors="replace")
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+        headers["X-Client-Request-Id"] = idempotency_key
+
+    body = None
+    if data:
+        json_body = JsonBody(data)
+        headers["Content-Length"] = str(json_body.length)
+        body = json_body.payload()
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+    attempt = 0
+    while True:
+        _rate_limiter.acquire()
+        retry_after = None
         try:
-            error_json = json.loads(error_body)
-            error_msg = error_json.get("error", {}).get("message", error_body)
-        except json.JSONDecodeError:
-            error_msg = error_body
-        print(f"API Error (HTTP {e.code}): {error_msg}", file=sys.stderr)
-        sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"Network Error: {e.reason}", file=sys.stderr)
-        sys.exit(1)
+            status, resp_headers, resp_body = _pool.request(method, path, body=body, headers=headers)
+        except (OSError, http.client.HTTPException) as e:
+            error = ApiError(f"Network Error: {e}")
+            delivered = not isinstance(e, (ConnectionRefusedError, socket.gaierror))
+        else:
+            text = resp_body.decode("utf-8", errors="replace")
+            if status < 400:
+                try:
+                    result = json.loads(text) if text else {}
+                except json.JSONDecodeError:
+                    # e.g. an HTML page from a gateway or proxy; the request may still have been applied
+                    error = ApiError(f"Invalid API response (HTTP {status}): {text[:200]!r}")
+                    delivered = True
+                else:
+                    _rate_limiter.succeeded()
+                    return result
+            else:
+                try:
+                    error_json = json.loads(text)
+                    error_msg = error_json.get("error", {}).get("message", text)
+                except (json.JSONDecodeError, AttributeError):
+                    error_msg = text
+                error = ApiError(f"API Error (HTTP {status}): {error_msg}", code=status)
+                retry_after = _retry_after(resp_headers)
+                delivered = status != 429
+                if status == 429:
+                    _rate_limiter.throttled(retry_after if retry_after is not None else _backoff(attempt + 1))
+
+        if not error.transient or attempt >= API_RETRIES:
+            raise error
+        if method == "POST" and delivered and on_ambiguous is None:
+            raise ApiError(f"{error} (the request may have been applied; not retrying)", code=error.code)
+
+        delay = retry_after if retry_after is not None else _backoff(attempt + 1)
+        attempt += 1
+        print(f"  {error}; retrying in {delay:.1f}s ({attempt}/{API_RETRIES})...", file=sys.stderr, flush=True)
+        time.sleep(delay)
+        if method == "POST" and delivered:
+            found = on_ambiguous()
+            if found is not None:
+                return found
+
+
+class LocalImage:
+    """A local image sent as a base64 data URL.
+
+    Nothing is read until the request body is sent: the file is mmapped and
+    encoded chunk by chunk straight into the HTTP body, so memory stays
+    constant regardless of image size or count. When `encoded_path` points to
+    an ImageCache entry, its bytes are streamed as-is with no encoding work.
+    """
+
+    def __init__(self, path, mime_ext, encoded_path=None):
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        self.prefix = f"data:image/{mime_ext};base64,".encode("ascii")
+        self.encoded_path = encoded_path
+
+    def encoded_length(self):
+        return len(self.prefix) + 4 * -(-self.size // 3)
+
+    def iter_encoded(self):
+        yield self.prefix
+        if not self.size:
+            return
+        if self.encoded_path:
+            try:
+                f = open(self.encoded_path, "rb")
+            except FileNotFoundError:
+                pass  # evicted by another process meanwhile; encode from the source instead
+            else:
+                with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+                    for offset in range(0, len(view), BASE64_CHUNK):
+                        yield view[offset:offset + BASE64_CHUNK].tobytes()
+                return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if len(m) != self.size:
+                raise SeedanceError(f"Error: Image file changed while uploading: {self.path}")
+            with memoryview(m) as view:
+                for offset in range(0, self.size, BASE64_CHUNK):
+                    yield base64.b64encode(view[offset:offset + BASE64_CHUNK])
+
+    def __str__(self):
+        return b"".join(self.iter_encoded()).decode("ascii")
+
+
+class ImageCache:
+    """On-disk LRU cache of base64-encoded local images, addressed by content hash.
+
+    `index.json` maps each source path (with its size and mtime) to the
+    SHA-256 of its content, so an unchanged file is neither re-read nor
+    re-encoded; identical files under different paths share one entry.
+    Least recently used entries are evicted beyond `max_bytes`.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _index_path(self):
+        return self.root / "index.json"
+
+    def _load(self):
+        try:
+            index = json.loads(self._index_path().read_text())
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("files", {})
+        index.setdefault("entries", {})
+        return index
+
+    def _save(self, index):
+        tmp = self._index_path().with_name(f"index.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self._index_path())
+
+    def _entry_path(self, digest):
+        return self.root / f"{digest}.b64"
+
+    def get(self, path):
+        """Return the cached encoding of path, creating it on a miss."""
+        path = Path(path).resolve()
+        st = path.stat()
+        with self._lock:
+            index = self._load()
+            known = index["files"].get(str(path))
+            if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns \
+                    and self._entry_path(known["sha256"]).exists():
+                index["entries"].setdefault(known["sha256"], {"bytes": 4 * -(-st.st_size // 3)})["used"] = time.time()
+                self._save(index)
+                return self._entry_path(known["sha256"])
+
+        digest, tmp = self._encode(path)
+        entry = self._entry_path(digest)
+        with self._lock:
+            if entry.exists():
+                tmp.unlink()
+            else:
+                os.replace(tmp, entry)
+            index = self._load()
+            index["files"][str(path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+            index["entries"][digest] = {"bytes": entry.stat().st_size, "used": time.time()}
+            self._evict(index, keep=digest)
+            self._save(index)
+        return entry
+
+    def _encode(self, path):
+        """Hash and base64-encode path into a temp file in one pass; return (sha256, temp path)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        sha = hashlib.sha256()
+        tmp = self.root / f"{uuid.uuid4().hex}.tmp"
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            while True:
+                chunk = src.read(BASE64_CHUNK)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                dst.write(base64.b64encode(chunk))
+        return sha.hexdigest(), tmp
+
+    def _evict(self, index, keep):
+        entries = index["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        for digest in sorted(entries, key=lambda d: entries[d].get("used", 0)):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            self._entry_path(digest).unlink(missing_ok=True)
+            total -= entries.pop(digest)["bytes"]
+        index["files"] = {p: f for p, f in index["files"].items() if f["sha256"] in entries}
+
+
+_image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+
+class JsonBody:
+    """JSON request body in which LocalImage values are streamed instead of inlined.
+
+    The JSON skeleton is serialized once with a placeholder per image; sending
+    re-iterates the parts, so a retried request can stream the body again.
+    """
+
+    def __init__(self, data):
+        token = f"@@seedance-image-{uuid.uuid4().hex}-"
+        images = []
+
+        def default(obj):
+            if isinstance(obj, LocalImage):
+                images.append(obj)
+                return f"{token}{len(images) - 1}@@"
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+        text = json.dumps(data, default=default)
+        self.parts = []
+        for i, piece in enumerate(re.split(re.escape(token) + r"(\d+)@@", text)):
+            self.parts.append(images[int(piece)] if i % 2 else piece.encode("utf-8"))
+        self.length = sum(p.encoded_length() if isinstance(p, LocalImage) else len(p) for p in self.parts)
+
+    def payload(self):
+        """Bytes for plain bodies, otherwise a re-iterable chunk stream."""
+        if len(self.parts) == 1:
+            return self.parts[0]
+        return self
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, LocalImage):
+                yield from part.iter_encoded()
+            elif part:
+                yield part
 
 
 def image_to_data_url(image_path):
-    """Convert a local image file to a base64 data URL."""
+    """Validate a local image file and return it as a lazily encoded base64 data URL."""
     p = Path(image_path)
     if not p.exists():
-        print(f"Error: Image file not found: {image_path}", file=sys.stderr)
-        sys.exit(1)
+        raise SeedanceError(f"Error: Image file not found: {image_path}")
 
     ext = p.suffix.lower().lstrip(".")
     mime_map = {
@@ -85,13 +502,16 @@ def image_to_data_url(image_path):
 
     file_size = p.stat().st_size
     if file_size > 30 * 1024 * 1024:
-        print(f"Error: Image file too large ({file_size / 1024 / 1024:.1f} MB). Max 30 MB.", file=sys.stderr)
-        sys.exit(1)
-
-    with open(p, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("ascii")
+        raise SeedanceError(f"Error: Image file too large ({file_size / 1024 / 1024:.1f} MB). Max 30 MB.")
 
-    return f"data:image/{mime_ext};base64,{b64}"
+    encoded = None
+    if IMAGE_CACHE_MAX_BYTES > 0:
+        try:
+            encoded = _image_cache.get(p)
+        except OSError as e:
+            # The cache is only an optimisation; fall back to encoding on the fly
+            print(f"Warning: image cache unavailable ({e})", file=sys.stderr)
+    return LocalImage(p, mime_ext, encoded)
 
 
 def resolve_image(image_input):
@@ -101,8 +521,8 @@ def resolve_image(image_input):
     return image_to_data_url(image_input)
 
 
-def cmd_create(args):
-    """Create a video generation task."""
+def build_create_body(args):
+    """Build the create-task request body from create options (argparse namespace or batch job)."""
     content = []
 
     # Draft task mode
@@ -141,8 +561,7 @@ def cmd_create(args):
                 })
 
     if not content:
-        print("Error: Must provide --prompt, --image, or --draft-task-id.", file=sys.stderr)
-        sys.exit(1)
+        raise SeedanceError("Error: Must provide --prompt, --image, or --draft-task-id.")
 
     body = {
         "model": args.model,
@@ -170,8 +589,197 @@ def cmd_create(args):
         body["return_last_frame"] = args.return_last_frame
     if args.service_tier:
         body["service_tier"] = args.service_tier
+    return body
+
+
+class Ledger:
+    """Local SQLite record of every task this tool creates or observes.
+
+    Rows are upserted on create and on every status response (status, wait,
+    batch/pipeline polls, watch, list), so `list --local` and `stats` work
+    offline. created_at/finished_at come from the server; started_at is the
+    first time a poll saw the task running, so queue/run latencies are
+    accurate to one poll interval. Ledger errors never fail an API command.
+    """
+
+    COLUMNS = ("model", "service_tier", "resolution", "ratio", "duration", "draft", "seed", "prompt",
+               "draft_task_id", "status", "created_at", "started_at", "finished_at", "video_url", "error",
+               "completion_tokens")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.enabled = str(path) != "0"
+        self._conn = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY, {", ".join(self.COLUMNS)}, updated_local REAL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created_at)")
+            self._conn = conn
+        return self._conn
+
+    def _upsert(self, task_id, fields, keep_first=()):
+        if not self.enabled or not task_id:
+            return
+        fields = {k: v for k, v in fields.items() if v is not None}
+        cols = ["task_id", *fields, "updated_local"]
+        updates = [f"{c} = COALESCE(tasks.{c}, excluded.{c})" if c in keep_first else f"{c} = excluded.{c}"
+                   for c in fields] + ["updated_local = excluded.updated_local"]
+        sql = (f"INSERT INTO tasks ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+               f"ON CONFLICT(task_id) DO UPDATE SET {', '.join(updates)}")
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute(sql, [task_id, *fields.values(), time.time()])
+        except (sqlite3.Error, OSError) as e:
+            if not self._warned:
+                self._warned = True
+                print(f"Warning: task ledger unavailable ({e})", file=sys.stderr)
+
+    def record_create(self, task_id, body):
+        content = body.get("content", [])
+        text = next((c["text"] for c in content if c.get("type") == "text"), None)
+        draft_task = next((c["draft_task"]["id"] for c in content if c.get("type") == "draft_task"), None)
+        self._upsert(task_id, {
+            "model": body.get("model"), "service_tier": body.get("service_tier", "default"),
+            "resolution": body.get("resolution"), "ratio": body.get("ratio"), "duration": body.get("duration"),
+            "draft": int(body["draft"]) if "draft" in body else None, "seed": body.get("seed"),
+            "prompt": text[:500] if text else None, "draft_task_id": draft_task,
+            "status": "queued", "created_at": time.time(),
+        }, keep_first=("status", "created_at"))
+
+    def observe(self, task):
+        """Record a task object returned by the API."""
+        status = task.get("status")
+        content = task.get("content") or {}
+        error = task.get("error") or {}
+        self._upsert(task.get("id"), {
+            "model": task.get("model"), "service_tier": task.get("service_tier"),
+            "resolution": task.get("resolution"), "ratio": task.get("ratio"), "duration": task.get("duration"),
+            "seed": task.get("seed"), "status": status, "created_at": task.get("created_at"),
+            "started_at": time.time() if status == "running" else None,
+            "finished_at": (task.get("updated_at") or time.time()) if status in FINAL_STATUSES else None,
+            "video_url": content.get("video_url"), "error": error.get("message"),
+            "completion_tokens": (task.get("usage") or {}).get("completion_tokens"),
+        }, keep_first=("started_at", "finished_at"))
+
+    def mark_cancelled(self, task_id):
+        """A deleted task that was still queued/running ends as cancelled; finished history is kept."""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("UPDATE tasks SET status = 'cancelled', finished_at = ?, updated_local = ? "
+                                 "WHERE task_id = ? AND status IN ('queued', 'running')",
+                                 (time.time(), time.time(), task_id))
+        except (sqlite3.Error, OSError):
+            pass
+
+    def query(self, sql, params=()):
+        if not self.enabled:
+            raise SeedanceError("Error: the task ledger is disabled (SEEDANCE_LEDGER=0)")
+        with self._lock:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            try:
+                return [dict(row) for row in conn.execute(sql, params)]
+            finally:
+                conn.row_factory = None
+
+
+_ledger = Ledger(LEDGER_PATH)
+
+
+def get_task(task_id):
+    """Fetch one task and record it in the ledger."""
+    result = api_request("GET", f"{BASE_URL}/{task_id}")
+    _ledger.observe(result)
+    return result
+
+
+_claimed_task_ids = set()
+_claim_lock = threading.Lock()
+
+
+def _draft_source(task):
+    """ID of the draft a listed task was promoted from, or None."""
+    draft_task = task.get("draft_task")
+    if isinstance(draft_task, dict) and draft_task.get("id"):
+        return draft_task["id"]
+    return task.get("draft_task_id")
 
-    result = api_request("POST", BASE_URL, body)
+
+def _find_created_task(matches, since):
+    """Find the task an ambiguous create produced among tasks created since `since`.
+
+    `matches(task)` tells whether a listed task has the create's fingerprint.
+    Returns None when no such task exists (safe to re-send) and raises when
+    the match is not unique.
+    """
+    found = []
+    try:
+        for n, task in enumerate(list_tasks(page_size=20)):
+            if n >= 100 or task.get("created_at", since) < since - 60:
+                break
+            if matches(task) and task["id"] not in _claimed_task_ids:
+                found.append(task)
+    except ApiError as e:
+        raise ApiError(f"{e} (could not check whether the create was applied; not retrying)", code=e.code)
+    if len(found) > 1:
+        raise ApiError("Create failed ambiguously and several matching tasks exist; check `seedance.py list`")
+    return {"id": found[0]["id"], "recovered": True} if found else None
+
+
+def create_task(body):
+    """POST a create request such that retries never produce a duplicate paid generation.
+
+    The request carries an idempotency key and a fingerprint, so that an
+    ambiguous failure is resolved by looking the task up instead of blindly
+    re-sending. A draft promotion is fingerprinted by its source draft ID.
+    Any other create gets an explicit random seed (equivalent to the server
+    picking one) and is fingerprinted by model + seed. When no task matches,
+    the request is re-sent with the same idempotency key.
+    """
+    body = dict(body)
+    draft_id = next((item["draft_task"]["id"] for item in body.get("content", [])
+                     if item.get("type") == "draft_task"), None)
+    if draft_id:
+        def matches(task):
+            return task["id"] != draft_id and _draft_source(task) == draft_id
+    else:
+        if body.get("seed") in (None, -1):
+            body["seed"] = random.randint(0, 2 ** 31 - 1)
+
+        def matches(task):
+            return task.get("model") == body["model"] and task.get("seed") == body["seed"]
+    since = time.time()
+
+    def on_ambiguous():
+        with _claim_lock:
+            found = _find_created_task(matches, since)
+            if found:
+                _claimed_task_ids.add(found["id"])
+            return found
+
+    result = api_request("POST", BASE_URL, body, idempotency_key=uuid.uuid4().hex, on_ambiguous=on_ambiguous)
+    with _claim_lock:
+        _claimed_task_ids.add(result.get("id"))
+    _ledger.record_create(result.get("id"), body)
+    return result
+
+
+def cmd_create(args):
+    """Create a video generation task."""
+    result = create_task(build_create_body(args))
     task_id = result.get("id", "")
 
     print(json.dumps({"task_id": task_id, "status": "created", "response": result}, indent=2))
@@ -185,19 +793,189 @@ def cmd_create(args):
 
 def cmd_status(args):
     """Query task status."""
-    url = f"{BASE_URL}/{args.task_id}"
-    result = api_request("GET", url)
+    result = get_task(args.task_id)
     print(json.dumps(result, indent=2, ensure_ascii=False))
     return result
 
 
+def _open_range(url, start, end=None, timeout=60):
+    """GET url with a `Range: bytes=start-end` header (end inclusive, None = to EOF)."""
+    rng = f"bytes={start}-{'' if end is None else end}"
+    return urllib.request.urlopen(urllib.request.Request(url, headers={"Range": rng}), timeout=timeout)
+
+
+def _probe_download(url):
+    """Return (total size or None, whether the server honours Range requests)."""
+    with _open_range(url, 0, 0) as resp:
+        if resp.status == 206:
+            total = resp.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            return (int(total) if total.isdigit() else None), True
+        length = resp.headers.get("Content-Length", "")
+        return (int(length) if length.isdigit() else None), False
+
+
+def _retryable(exc):
+    """Network errors and 408/429/5xx are worth another attempt; other HTTP errors are final."""
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code in (408, 429) or exc.code >= 500
+    return isinstance(exc, (OSError, http.client.HTTPException))
+
+
+class _DownloadState:
+    """Progress of a ranged download, persisted next to the .part file so a later run can resume.
+
+    `ranges` is a list of [start, next_offset, end] (end inclusive); a range is
+    done once next_offset > end.
+    """
+
+    def __init__(self, path, size, parts):
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        step = -(-size // parts)
+        self.ranges = [[start, start, min(start + step, size) - 1] for start in range(0, size, step)]
+
+    @classmethod
+    def load(cls, path, size):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if data.get("size") != size:
+            return None
+        state = cls(path, size, 1)
+        state.ranges = data["ranges"]
+        return state
+
+    def advance(self, rng, nbytes):
+        with self.lock:
+            rng[1] += nbytes
+            self.path.write_text(json.dumps({"size": self.size, "ranges": self.ranges}))
+
+    def done_bytes(self):
+        return sum(pos - start for start, pos, _ in self.ranges)
+
+
+def _fetch_range(url, part_path, state, rng):
+    """Stream one byte range into its slot of the .part file, reconnecting from the last written byte."""
+    failures = 0
+    while rng[1] <= rng[2]:
+        try:
+            with _open_range(url, rng[1], rng[2]) as resp:
+                if resp.status != 206:
+                    raise DownloadError("Download failed: server ignored the Range header on resume")
+                with open(part_path, "r+b") as f:
+                    f.seek(rng[1])
+                    while rng[1] <= rng[2]:
+                        chunk = resp.read(min(DOWNLOAD_CHUNK, rng[2] - rng[1] + 1))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        f.flush()
+                        state.advance(rng, len(chunk))
+                        failures = 0
+            if rng[1] <= rng[2]:
+                raise http.client.IncompleteRead(b"", rng[2] - rng[1] + 1)
+        except Exception as e:
+            failures += 1
+            if not _retryable(e) or failures > DOWNLOAD_RETRIES:
+                raise
+            time.sleep(min(2 ** failures, 30))
+
+
+def _fetch_stream(url, part_path):
+    """Plain sequential download for servers without Range support; a retry starts over."""
+    failures = 0
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=60) as resp, open(part_path, "wb") as f:
+                while True:
+                    chunk = resp.read(DOWNLOAD_CHUNK)
+                    if not chunk:
+                        return
+                    f.write(chunk)
+        except Exception as e:
+            failures += 1
+            if not _retryable(e) or failures > DOWNLOAD_RETRIES:
+                raise
+            time.sleep(min(2 ** failures, 30))
+
+
+def download_video(video_url, task_id, download_dir, log=sys.stdout, parts=DOWNLOAD_PARTS):
+    """Download a finished video into download_dir and return the file path.
+
+    The file is streamed into `<name>.part` in chunks. Large files are split into
+    up to `parts` parallel HTTP ranges; dropped connections resume from the last
+    written byte, and an interrupted run resumes from the `.part.json` progress
+    file. The size is verified before the file is atomically renamed into place.
+    """
+    download_path = Path(download_dir).expanduser()
+    download_path.mkdir(parents=True, exist_ok=True)
+    filepath = download_path / f"seedance_{task_id}.mp4"
+    part_path = filepath.with_name(filepath.name + ".part")
+    state_path = filepath.with_name(filepath.name + ".part.json")
+
+    try:
+        size, ranged = _probe_download(video_url)
+    except (OSError, http.client.HTTPException) as e:
+        # URLError is an OSError; timeouts and malformed responses must not escape as tracebacks either
+        raise DownloadError(f"Download failed: {getattr(e, 'reason', e)}") from e
+    if size is not None and filepath.exists() and filepath.stat().st_size == size:
+        print(f"Already downloaded: {filepath}", file=log)
+        return filepath
+
+    started = time.monotonic()
+    try:
+        if size and ranged:
+            state = _DownloadState.load(state_path, size) if part_path.exists() else None
+            if state:
+                print(f"\nResuming download of {filepath} at {state.done_bytes() * 100 // size}%...", file=log)
+            else:
+                nparts = max(1, min(parts, size // DOWNLOAD_PART_SIZE))
+                state = _DownloadState(state_path, size, nparts)
+                with open(part_path, "wb") as f:
+                    f.truncate(size)
+                print(f"\nDownloading video to {filepath}"
+                      f"{f' ({nparts} parallel ranges)' if nparts > 1 else ''}...", file=log)
+            pending = [rng for rng in state.ranges if rng[1] <= rng[2]]
+            if len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                    for fut in [executor.submit(_fetch_range, video_url, part_path, state, rng) for rng in pending]:
+                        fut.result()
+            elif pending:
+                _fetch_range(video_url, part_path, state, pending[0])
+        else:
+            print(f"\nDownloading video to {filepath}...", file=log)
+            _fetch_stream(video_url, part_path)
+    except DownloadError:
+        raise
+    except Exception as e:
+        raise DownloadError(f"Download failed: {getattr(e, 'reason', e)} (partial file kept for resume)") from e
+
+    actual = part_path.stat().st_size
+    if size is not None and actual != size:
+        raise DownloadError(f"Download failed: size mismatch ({actual} of {size} bytes)")
+    os.replace(part_path, filepath)
+    state_path.unlink(missing_ok=True)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"Saved to: {filepath} ({actual / 1024 / 1024:.1f} MB in {elapsed:.1f}s)", file=log)
+    return filepath
+
+
 def cmd_wait_logic(task_id, interval=15, download_dir=None):
     """Wait for task completion, optionally download result."""
-    url = f"{BASE_URL}/{task_id}"
     print(f"Waiting for task {task_id} to complete (polling every {interval}s)...")
 
     while True:
-        result = api_request("GET", url)
+        try:
+            result = get_task(task_id)
+        except ApiError as e:
+            if not e.transient:
+                raise
+            # Retries are exhausted but the task is still running server-side; keep waiting
+            print(f"  {e}; still waiting...", file=sys.stderr, flush=True)
+            time.sleep(interval)
+            continue
         status = result.get("status", "unknown")
 
         if status == "succeeded":
@@ -215,19 +993,14 @@ def cmd_wait_logic(task_id, interval=15, download_dir=None):
 
             # Download
             if download_dir and video_url:
-                download_path = Path(download_dir).expanduser()
-                download_path.mkdir(parents=True, exist_ok=True)
-                filename = f"seedance_{task_id}_{int(time.time())}.mp4"
-                filepath = download_path / filename
-
-                print(f"\nDownloading video to {filepath}...")
                 try:
-                    urllib.request.urlretrieve(video_url, str(filepath))
-                    print(f"Saved to: {filepath}")
+                    filepath = download_video(video_url, task_id, download_dir)
 
                     # Open on macOS
                     if sys.platform == "darwin":
                         os.system(f'open "{filepath}"')
+                except DownloadError as e:
+                    print(e, file=sys.stderr)
                 except Exception as e:
                     print(f"Download failed: {e}", file=sys.stderr)
 
@@ -256,8 +1029,29 @@ def cmd_wait(args):
     return cmd_wait_logic(args.task_id, args.interval, args.download)
 
 
+def cmd_download(args):
+    """Download the video of a finished task (resumable, optionally in parallel ranges)."""
+    result = get_task(args.task_id)
+    status = result.get("status", "unknown")
+    video_url = result.get("content", {}).get("video_url")
+    if status != "succeeded" or not video_url:
+        raise SeedanceError(f"Error: task {args.task_id} has no video to download (status: {status})")
+    download_video(video_url, args.task_id, args.output_dir, parts=args.parallel)
+
+
 def cmd_list(args):
-    """List video generation tasks."""
+    """List video generation tasks (from the API, or from the local ledger with --local)."""
+    if args.local:
+        where, params = "", []
+        if args.status:
+            where, params = "WHERE status = ?", [args.status]
+        total = _ledger.query(f"SELECT COUNT(*) AS n FROM tasks {where}", params)[0]["n"]
+        items = _ledger.query(f"SELECT * FROM tasks {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                              params + [args.page_size, (args.page - 1) * args.page_size])
+        result = {"items": items, "total": total}
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return result
+
     params = []
     if args.page:
         params.append(f"page_num={args.page}")
@@ -271,6 +1065,8 @@ def cmd_list(args):
         url += "?" + "&".join(params)
 
     result = api_request("GET", url)
+    for item in result.get("items") or []:
+        _ledger.observe(item)
     print(json.dumps(result, indent=2, ensure_ascii=False))
     return result
 
@@ -279,9 +1075,649 @@ def cmd_delete(args):
     """Cancel or delete a task."""
     url = f"{BASE_URL}/{args.task_id}"
     api_request("DELETE", url)
+    _ledger.mark_cancelled(args.task_id)
     print(f"Task {args.task_id} cancelled/deleted successfully.")
 
 
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    return values[max(0, -(-len(values) * pct // 100) - 1)]
+
+
+def _fmt_secs(value):
+    if value is None:
+        return "-"
+    return f"{value:.0f}s" if value < 120 else f"{value / 60:.1f}m"
+
+
+def parse_age(value):
+    """Parse '30m', '24h', '7d' (or plain seconds) into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    try:
+        if value[-1:] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration '{value}' (e.g. 30m, 24h, 7d)")
+
+
+def cmd_stats(args):
+    """Report p50/p95 queue, run and end-to-end latency per model / service tier / resolution from the ledger."""
+    where, params = "", []
+    if args.since:
+        where, params = "WHERE created_at >= ?", [time.time() - args.since]
+    rows = _ledger.query(f"SELECT * FROM tasks {where}", params)
+
+    groups = {}
+    for row in rows:
+        key = (row["model"] or "?", row["service_tier"] or "default", row["resolution"] or "?")
+        groups.setdefault(key, []).append(row)
+
+    report = []
+    for (model, tier, resolution), tasks in sorted(groups.items()):
+        done = [t for t in tasks if t["status"] == "succeeded"]
+        latencies = {"queue": [], "run": [], "total": []}
+        for t in done:
+            created, started, finished = t["created_at"], t["started_at"], t["finished_at"]
+            if created and started:
+                latencies["queue"].append(max(0.0, started - created))
+            if started and finished:
+                latencies["run"].append(max(0.0, finished - started))
+            if created and finished:
+                latencies["total"].append(max(0.0, finished - created))
+        entry = {
+            "model": model, "service_tier": tier, "resolution": resolution, "tasks": len(tasks),
+            "succeeded": len(done), "failed": sum(t["status"] in ("failed", "expired") for t in tasks),
+            "video_seconds": sum(t["duration"] or 0 for t in done),
+            "completion_tokens": sum(t["completion_tokens"] or 0 for t in done),
+        }
+        for name, values in latencies.items():
+            entry[f"{name}_p50"] = round(_percentile(values, 50), 1) if values else None
+            entry[f"{name}_p95"] = round(_percentile(values, 95), 1) if values else None
+        report.append(entry)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return report
+    if not report:
+        print("No tasks in the local ledger yet.")
+        return report
+
+    header = f"{'MODEL':<34} {'TIER':<8} {'RES':<6} {'TASKS':>5} {'OK':>4} {'FAIL':>4}  " \
+             f"{'QUEUE p50/p95':>14} {'RUN p50/p95':>14} {'TOTAL p50/p95':>14} {'VIDEO':>7} {'TOKENS':>10}"
+    print(header)
+    for e in report:
+        pair = lambda name: f"{_fmt_secs(e[name + '_p50'])}/{_fmt_secs(e[name + '_p95'])}"
+        print(f"{e['model']:<34} {e['service_tier']:<8} {e['resolution']:<6} {e['tasks']:>5} {e['succeeded']:>4} "
+              f"{e['failed']:>4}  {pair('queue'):>14} {pair('run'):>14} {pair('total'):>14} "
+              f"{e['video_seconds']:>6}s {e['completion_tokens']:>10}")
+    return report
+
+
+def list_tasks(status=None, task_ids=None, page_size=100):
+    """Yield tasks from the list endpoint, following pagination."""
+    page = 1
+    seen = 0
+    while True:
+        params = [("page_num", page), ("page_size", page_size)]
+        if status:
+            params.append(("filter.status", status))
+        params.extend(("filter.task_ids", task_id) for task_id in task_ids or ())
+        result = api_request("GET", f"{BASE_URL}?{urlencode(params)}")
+        items = result.get("items") or []
+        for item in items:
+            _ledger.observe(item)
+        yield from items
+        seen += len(items)
+        total = result.get("total")
+        if len(items) < page_size or (total is not None and seen >= total):
+            return
+        page += 1
+
+
+def cmd_watch(args):
+    """Follow every queued/running task in one loop, reporting and downloading results as they finish.
+
+    Each round costs one list call per page of active tasks, plus one
+    `filter.task_ids` list call per page of tasks that left the active lists;
+    per-task GETs are only a fallback for ids the list does not return.
+    """
+    get_api_key()
+    writer = JsonlWriter(args.output, mode="a") if args.output else None
+    executor = ThreadPoolExecutor(max_workers=4)
+    downloads = []
+    tracked = {}
+    counts = {status: 0 for status in FINAL_STATUSES}
+    interval = args.min_interval
+
+    def log(message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    def record(task, file=None, error=None):
+        if writer:
+            content = task.get("content") or {}
+            writer.write({
+                "task_id": task["id"],
+                "status": task.get("status"),
+                "model": task.get("model"),
+                "video_url": content.get("video_url"),
+                "last_frame_url": content.get("last_frame_url"),
+                "error": error,
+                "file": str(file) if file else None,
+            })
+
+    def download(task):
+        try:
+            record(task, file=download_video(task["content"]["video_url"], task["id"], args.download))
+        except SeedanceError as e:
+            log(f"{task['id']}: {e}")
+            record(task, error=str(e))
+
+    def finish(task):
+        status = task["status"]
+        counts[status] += 1
+        content = task.get("content") or {}
+        if status == "succeeded":
+            log(f"{task['id']}: succeeded ({task.get('duration', '?')}s, {task.get('resolution', '?')}) "
+                f"{content.get('video_url', '')}")
+            if args.download and content.get("video_url"):
+                downloads.append(executor.submit(download, task))
+                return
+            record(task)
+        else:
+            error = task.get("error") or {}
+            detail = f": {error.get('code', 'unknown')} - {error.get('message', '')}" if error else ""
+            log(f"{task['id']}: {status}{detail}")
+            record(task, error=error.get("message") if error else None)
+
+    try:
+        while True:
+            changed = False
+            try:
+                active = {}
+                for status in ACTIVE_STATUSES:
+                    for task in list_tasks(status, page_size=args.page_size):
+                        active[task["id"]] = task
+                for task_id, task in active.items():
+                    if tracked.get(task_id) != task["status"]:
+                        log(f"{task_id}: {tracked.get(task_id, 'found')} -> {task['status']}")
+                        tracked[task_id] = task["status"]
+                        changed = True
+
+                # Tasks that left the active lists have finished (or slipped between pages while moving)
+                gone = [task_id for task_id in tracked if task_id not in active]
+                for i in range(0, len(gone), args.page_size):
+                    ids = gone[i:i + args.page_size]
+                    found = {t["id"]: t for t in list_tasks(task_ids=ids, page_size=args.page_size)}
+                    for task_id in ids:
+                        task = found.get(task_id)
+                        if task is None:
+                            try:
+                                task = get_task(task_id)
+                            except ApiError as e:
+                                if e.code != 404:
+                                    raise
+                                log(f"{task_id}: deleted")
+                                del tracked[task_id]
+                                changed = True
+                                continue
+                        if task.get("status") in FINAL_STATUSES:
+                            del tracked[task_id]
+                            finish(task)
+                            changed = True
+                        else:
+                            tracked[task_id] = task.get("status")
+            except ApiError as e:
+                log(f"poll error: {e}")
+
+            if not tracked and not args.forever:
+                break
+            # Poll quickly while things are moving, back off while nothing changes
+            interval = args.min_interval if changed else min(args.max_interval, interval * 1.5)
+            time.sleep(interval)
+
+        for fut in downloads:
+            fut.result()
+    except KeyboardInterrupt:
+        print("\nStopped watching (partial downloads resume on the next run).", file=sys.stderr)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if writer:
+            writer.close()
+
+    summary = ", ".join(f"{n} {status}" for status, n in counts.items() if n)
+    print(f"No active tasks left{f' ({summary})' if summary else ''}." if not tracked
+          else f"{len(tracked)} task(s) still active.")
+
+
+# Fields a batch job line may set; anything else is rejected before any task is created
+JOB_FIELDS = (
+    "prompt", "image", "last_frame", "ref_images", "draft_task_id", "model", "ratio",
+    "duration", "resolution", "seed", "camera_fixed", "watermark", "generate_audio",
+    "draft", "return_last_frame", "service_tier",
+)
+MAX_POLL_ERRORS = 5
+
+
+def load_jobs(path, defaults):
+    """Read a JSONL job file. Each line is an object of create options (or a bare prompt string).
+
+    Options given on the command line act as defaults for every job.
+    Returns a list of (name, options namespace).
+    """
+    jobs = []
+    with open(Path(path).expanduser(), encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise SeedanceError(f"Error: {path}:{lineno}: invalid JSON ({e})")
+            if isinstance(job, str):
+                job = {"prompt": job}
+            if not isinstance(job, dict):
+                raise SeedanceError(f"Error: {path}:{lineno}: expected an object or a prompt string")
+
+            opts = argparse.Namespace(**{k: getattr(defaults, k) for k in JOB_FIELDS})
+            name = str(job.pop("name", lineno))
+            for key, value in job.items():
+                field = key.replace("-", "_")
+                if field not in JOB_FIELDS:
+                    raise SeedanceError(f"Error: {path}:{lineno}: unknown field '{key}'")
+                if field in ("camera_fixed", "watermark", "generate_audio", "draft", "return_last_frame") \
+                        and value is not None:
+                    value = parse_bool(value if isinstance(value, bool) else str(value))
+                if field == "ref_images" and isinstance(value, str):
+                    value = [value]
+                setattr(opts, field, value)
+            if not (opts.prompt or opts.image or opts.ref_images or opts.draft_task_id):
+                raise SeedanceError(f"Error: {path}:{lineno}: job needs prompt, image, ref_images or draft_task_id")
+            jobs.append((name, opts))
+    return jobs
+
+
+class JsonlWriter:
+    """Thread-safe JSONL sink; each record is flushed as soon as it is written."""
+
+    def __init__(self, path=None, mode="w"):
+        self._file = open(Path(path).expanduser(), mode, encoding="utf-8") if path else sys.stdout
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+def task_error(result):
+    """One-line description of a failed task's error."""
+    error = (result or {}).get("error") or {}
+    return f"{error.get('code', 'unknown')} - {error.get('message', 'Unknown error')}"
+
+
+class TaskTracker:
+    """Tracks many tasks in one poll loop: each round fetches every pending status in parallel.
+
+    `poll()` returns (meta, result, error) for every task that reached a final
+    status in this round, or whose status could not be fetched
+    MAX_POLL_ERRORS rounds in a row (then result is None).
+    """
+
+    def __init__(self, executor, log=sys.stderr):
+        self.executor = executor
+        self.log = log
+        self.pending = {}
+
+    def add(self, task_id, meta):
+        self.pending[task_id] = {"meta": meta, "errors": 0}
+
+    def discard(self, task_id):
+        self.pending.pop(task_id, None)
+
+    def poll(self):
+        done = []
+        polls = {self.executor.submit(get_task, task_id): task_id
+                 for task_id in self.pending}
+        for fut in as_completed(polls):
+            task_id = polls[fut]
+            entry = self.pending.get(task_id)
+            if entry is None:
+                continue
+            try:
+                result = fut.result()
+                status = result.get("status")
+            except Exception as e:
+                # Anything unexpected counts as a failed poll of this task, never of the whole loop
+                entry["errors"] += 1
+                print(f"  [{entry['meta'].get('name', task_id)}] poll error "
+                      f"({entry['errors']}/{MAX_POLL_ERRORS}): {e}", file=self.log)
+                if entry["errors"] >= MAX_POLL_ERRORS:
+                    del self.pending[task_id]
+                    done.append((entry["meta"], None, e))
+                continue
+            entry["errors"] = 0
+            if status in FINAL_STATUSES:
+                del self.pending[task_id]
+                done.append((entry["meta"], result, None))
+        return done
+
+
+def cmd_batch(args):
+    """Create many tasks concurrently, track them in one poll loop and write results as JSONL."""
+    get_api_key()
+    jobs = load_jobs(args.jobs, args)
+    if not jobs:
+        raise SeedanceError(f"Error: no jobs in {args.jobs}")
+
+    # Progress goes to stderr so that stdout stays pure JSONL when --output is not given
+    log = sys.stderr
+    _pool.resize(args.concurrency)
+    _rate_limiter.configure(args.rps)
+    writer = JsonlWriter(args.output)
+    started = time.monotonic()
+    failures = 0
+
+    def create(name, opts):
+        return create_task(build_create_body(opts)).get("id", "")
+
+    def finish(job, result, status, error=None, file=None):
+        content = (result or {}).get("content", {})
+        record = {
+            "name": job["name"],
+            "task_id": job.get("task_id"),
+            "status": status,
+            "video_url": content.get("video_url"),
+            "last_frame_url": content.get("last_frame_url"),
+            "error": error,
+            "elapsed": round(time.monotonic() - started, 1),
+        }
+        if file:
+            record["file"] = str(file)
+        writer.write(record)
+
+    def download(job, result):
+        try:
+            path = download_video(result["content"]["video_url"], job["task_id"], args.download, log=log)
+            finish(job, result, "succeeded", file=path)
+        except DownloadError as e:
+            finish(job, result, "succeeded", error=str(e))
+        except Exception as e:
+            finish(job, result, "succeeded", error=f"Download failed: {e}")
+
+    print(f"Submitting {len(jobs)} jobs (concurrency {args.concurrency}, {args.rps} req/s)...", file=log)
+    downloads = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            tracker = TaskTracker(executor, log)
+            futures = {executor.submit(create, name, opts): name for name, opts in jobs}
+            for fut in as_completed(futures):
+                job = {"name": futures[fut]}
+                try:
+                    job["task_id"] = fut.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"  [{job['name']}] create failed: {e}", file=log)
+                    finish(job, None, "create_failed", error=str(e))
+                    continue
+                print(f"  [{job['name']}] created {job['task_id']}", file=log)
+                tracker.add(job["task_id"], job)
+
+            if args.no_wait:
+                for entry in tracker.pending.values():
+                    finish(entry["meta"], None, "created")
+                tracker.pending.clear()
+
+            while tracker.pending:
+                round_start = time.monotonic()
+                for job, result, error in tracker.poll():
+                    if error:
+                        failures += 1
+                        finish(job, None, "poll_failed", error=str(error))
+                        continue
+                    status = result["status"]
+                    print(f"  [{job['name']}] {status}", file=log)
+                    if status == "succeeded" and args.download and result.get("content", {}).get("video_url"):
+                        downloads.append(executor.submit(download, job, result))
+                    elif status == "succeeded":
+                        finish(job, result, status)
+                    else:
+                        failures += 1
+                        finish(job, result, status, error=task_error(result) if status == "failed" else None)
+
+                if tracker.pending:
+                    print(f"  {len(tracker.pending)} task(s) still running...", file=log, flush=True)
+                    time.sleep(max(0.0, args.interval - (time.monotonic() - round_start)))
+
+            for fut in downloads:
+                fut.result()
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    done = "created" if args.no_wait else "succeeded"
+    print(f"Batch finished in {elapsed:.0f}s: {len(jobs) - failures} {done}, {failures} failed.", file=log)
+    if failures:
+        sys.exit(1)
+
+
+def make_selector(spec):
+    """Build the draft selector for --select.
+
+    A selector is called with each succeeded draft task (dict, plus the
+    variant's "prompt") and returns True (promote), False (reject) or None
+    (undecided, ask again next round):
+      first[:N]           promote the first N drafts to finish (default 1)
+      all                 promote every succeeded draft
+      cmd:COMMAND         run COMMAND with the draft JSON on stdin; exit 0 promotes
+      file:PATH           promote draft task IDs once they are listed in PATH
+      py:MODULE:FUNCTION  call FUNCTION(draft) from an importable module
+    """
+    kind, _, value = spec.partition(":")
+    if kind == "first":
+        quota = {"left": int(value or 1)}
+
+        def select_first(draft):
+            if quota["left"] <= 0:
+                return False
+            quota["left"] -= 1
+            return True
+        select_first.quota = quota
+        return select_first
+    if kind == "all" and not value:
+        return lambda draft: True
+    if kind == "cmd" and value:
+        def select_cmd(draft):
+            env = dict(os.environ, SEEDANCE_TASK_ID=draft["id"],
+                       SEEDANCE_VIDEO_URL=(draft.get("content") or {}).get("video_url", ""))
+            proc = subprocess.run(value, shell=True, input=json.dumps(draft, ensure_ascii=False),
+                                  text=True, env=env, stdout=sys.stderr)
+            return proc.returncode == 0
+        return select_cmd
+    if kind == "file" and value:
+        path = Path(value).expanduser()
+
+        def select_file(draft):
+            try:
+                chosen = {line.strip() for line in path.read_text().splitlines()}
+            except FileNotFoundError:
+                return None
+            return True if draft["id"] in chosen else None
+        return select_file
+    if kind == "py" and value:
+        module, _, func = value.rpartition(":")
+        try:
+            return getattr(importlib.import_module(module), func)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise SeedanceError(f"Error: cannot load selector {value}: {e}")
+    raise SeedanceError(f"Error: invalid --select '{spec}' (use first[:N], all, cmd:..., file:... or py:module:func)")
+
+
+def cmd_pipeline(args):
+    """Fan out cheap draft variants, select winners as they finish and promote them to finals."""
+    get_api_key()
+    prompts = [args.prompt] if args.prompt else [None]
+    if args.prompt_variants:
+        lines = Path(args.prompt_variants).expanduser().read_text(encoding="utf-8").splitlines()
+        prompts = [line.strip() for line in lines if line.strip()] or prompts
+    seeds = list(args.seeds or ())
+    count = args.variants or (max(len(prompts), len(seeds)) if args.prompt_variants or seeds else 4)
+    if prompts == [None] and not (args.image or args.ref_images):
+        raise SeedanceError("Error: pipeline needs --prompt, --prompt-variants, --image or --ref-images.")
+    selector = make_selector(args.select)
+
+    log = sys.stderr
+    _pool.resize(args.concurrency)
+    _rate_limiter.configure(args.rps)
+    writer = JsonlWriter(args.output)
+    started = time.monotonic()
+
+    drafts = []
+    for i in range(count):
+        opts = argparse.Namespace(**{k: getattr(args, k) for k in JOB_FIELDS})
+        opts.prompt = prompts[i % len(prompts)]
+        opts.seed = seeds[i] if i < len(seeds) else random.randint(0, 2 ** 31 - 1)
+        opts.draft = True
+        opts.resolution = "480p"
+        drafts.append({"stage": "draft", "name": f"draft{i + 1}", "variant": i + 1,
+                       "prompt": opts.prompt, "seed": opts.seed, "opts": opts})
+
+    def emit(meta, result, status, **extra):
+        content = (result or {}).get("content", {})
+        record = {key: meta.get(key) for key in ("stage", "name", "variant", "prompt", "seed", "task_id", "draft_task_id")}
+        record.update(status=status, video_url=content.get("video_url"),
+                      elapsed=round(time.monotonic() - started, 1), **extra)
+        writer.write(record)
+
+    def promote(draft):
+        opts = argparse.Namespace(**{k: None for k in JOB_FIELDS})
+        opts.model = args.model
+        opts.draft_task_id = draft["task_id"]
+        opts.resolution = args.final_resolution
+        opts.watermark, opts.return_last_frame, opts.service_tier = \
+            args.watermark, args.return_last_frame, args.service_tier
+        return create_task(build_create_body(opts)).get("id", "")
+
+    def download(meta, result):
+        try:
+            emit(meta, result, "succeeded",
+                 file=str(download_video(result["content"]["video_url"], meta["task_id"], args.download, log=log)))
+        except SeedanceError as e:
+            emit(meta, result, "succeeded", error=str(e))
+
+    print(f"Pipeline: {count} draft variant(s) at 480p, select={args.select}, "
+          f"finals at {args.final_resolution}", file=log)
+    finals_ok = 0
+    undecided = []
+    downloads = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            tracker = TaskTracker(executor, log)
+            futures = {executor.submit(create_task, build_create_body(d["opts"])): d for d in drafts}
+            for fut in as_completed(futures):
+                draft = futures[fut]
+                try:
+                    draft["task_id"] = fut.result().get("id", "")
+                except Exception as e:
+                    print(f"  [{draft['name']}] create failed: {e}", file=log)
+                    emit(draft, None, "create_failed", error=str(e))
+                    continue
+                print(f"  [{draft['name']}] created {draft['task_id']} (seed {draft['seed']})", file=log)
+                tracker.add(draft["task_id"], draft)
+
+            promotions = {}
+            decide_deadline = None
+            while tracker.pending or undecided or promotions:
+                round_start = time.monotonic()
+                for meta, result, error in tracker.poll():
+                    if error:
+                        emit(meta, None, "poll_failed", error=str(error))
+                        continue
+                    status = result["status"]
+                    print(f"  [{meta['name']}] {status}", file=log)
+                    if meta["stage"] == "final":
+                        if status == "succeeded":
+                            finals_ok += 1
+                            if args.download and result.get("content", {}).get("video_url"):
+                                downloads.append(executor.submit(download, meta, result))
+                                continue
+                        emit(meta, result, status, error=task_error(result) if status == "failed" else None)
+                    elif status == "succeeded":
+                        emit(meta, result, status)
+                        undecided.append((meta, dict(result, prompt=meta["prompt"])))
+                    else:
+                        emit(meta, result, status, error=task_error(result) if status == "failed" else None)
+
+                # Ask the selector about every finished draft; winners are promoted right away
+                still_open = []
+                for meta, draft_task in undecided:
+                    try:
+                        decision = selector(draft_task)
+                    except Exception as e:
+                        # A broken selector rejects this draft; it must not take down finals in flight
+                        print(f"  [{meta['name']}] selector failed, not promoting: {e!r}", file=log)
+                        decision = False
+                    if decision is None:
+                        still_open.append((meta, draft_task))
+                    elif decision:
+                        print(f"  [{meta['name']}] selected, promoting to {args.final_resolution}", file=log)
+                        promotions[executor.submit(promote, meta)] = meta
+                    else:
+                        print(f"  [{meta['name']}] not selected", file=log)
+                undecided = still_open
+
+                for fut in [f for f in promotions if f.done()]:
+                    draft = promotions.pop(fut)
+                    final = {"stage": "final", "name": f"final{draft['variant']}", "variant": draft["variant"],
+                             "prompt": draft["prompt"], "seed": draft["seed"], "draft_task_id": draft["task_id"]}
+                    try:
+                        final["task_id"] = fut.result()
+                    except Exception as e:
+                        print(f"  [{final['name']}] create failed: {e}", file=log)
+                        emit(final, None, "create_failed", error=str(e))
+                        continue
+                    print(f"  [{final['name']}] created {final['task_id']} from {draft['task_id']}", file=log)
+                    tracker.add(final["task_id"], final)
+
+                # Once a first:N quota is filled, the remaining drafts cannot win: stop paying for them
+                quota = getattr(selector, "quota", None)
+                if quota and quota["left"] <= 0:
+                    for task_id, entry in list(tracker.pending.items()):
+                        if entry["meta"]["stage"] == "draft":
+                            tracker.discard(task_id)
+                            try:
+                                api_request("DELETE", f"{BASE_URL}/{task_id}")
+                                status = "cancelled"
+                            except ApiError:
+                                status = "abandoned"  # already running; it finishes unpromoted
+                            print(f"  [{entry['meta']['name']}] {status}", file=log)
+                            emit(entry["meta"], None, status)
+
+                if undecided and not any(e["meta"]["stage"] == "draft" for e in tracker.pending.values()):
+                    decide_deadline = decide_deadline or time.monotonic() + args.select_timeout
+                    if time.monotonic() >= decide_deadline:
+                        print(f"  selection timed out; {len(undecided)} draft(s) left unpromoted", file=log)
+                        undecided = []
+
+                if tracker.pending or undecided or promotions:
+                    time.sleep(max(0.0, args.interval - (time.monotonic() - round_start)))
+
+            for fut in downloads:
+                fut.result()
+    finally:
+        writer.close()
+
+    print(f"Pipeline finished in {time.monotonic() - started:.0f}s: {finals_ok} final video(s).", file=log)
+    if not finals_ok:
+        sys.exit(1)
+
+
 def parse_bool(v):
     if isinstance(v, bool):
         return v
@@ -292,28 +1728,33 @@ def parse_bool(v):
     raise argparse.ArgumentTypeError(f"Boolean expected, got '{v}'")
 
 
+def add_create_options(parser):
+    """Create options shared by `create` and `batch` (for batch they are per-job defaults)."""
+    parser.add_argument("--prompt", "-p", help="Text prompt describing the video")
+    parser.add_argument("--image", "-i", help="First frame image (URL or local file path)")
+    parser.add_argument("--last-frame", help="Last frame image (URL or local file path)")
+    parser.add_argument("--ref-images", nargs="+", help="Reference images for Lite I2V (1-4 URLs or paths)")
+    parser.add_argument("--draft-task-id", help="Draft task ID to generate final video from")
+    parser.add_argument("--model", "-m", default=DEFAULT_MODEL, help=f"Model ID (default: {DEFAULT_MODEL})")
+    parser.add_argument("--ratio", choices=["16:9", "4:3", "1:1", "3:4", "9:16", "21:9", "adaptive"], help="Aspect ratio")
+    parser.add_argument("--duration", "-d", type=int, help="Duration in seconds (4-12 for 1.5 Pro)")
+    parser.add_argument("--resolution", "-r", choices=["480p", "720p", "1080p"], help="Resolution")
+    parser.add_argument("--seed", type=int, help="Random seed (-1 for random)")
+    parser.add_argument("--camera-fixed", type=parse_bool, help="Fix camera position (true/false)")
+    parser.add_argument("--watermark", type=parse_bool, help="Add watermark (true/false)")
+    parser.add_argument("--generate-audio", type=parse_bool, help="Generate audio (true/false, 1.5 Pro only)")
+    parser.add_argument("--draft", type=parse_bool, help="Draft/preview mode (true/false, 1.5 Pro only)")
+    parser.add_argument("--return-last-frame", type=parse_bool, help="Return last frame URL (true/false)")
+    parser.add_argument("--service-tier", choices=["default", "flex"], help="Service tier")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Seedance Video Generation CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # create
     p_create = subparsers.add_parser("create", help="Create a video generation task")
-    p_create.add_argument("--prompt", "-p", help="Text prompt describing the video")
-    p_create.add_argument("--image", "-i", help="First frame image (URL or local file path)")
-    p_create.add_argument("--last-frame", help="Last frame image (URL or local file path)")
-    p_create.add_argument("--ref-images", nargs="+", help="Reference images for Lite I2V (1-4 URLs or paths)")
-    p_create.add_argument("--draft-task-id", help="Draft task ID to generate final video from")
-    p_create.add_argument("--model", "-m", default=DEFAULT_MODEL, help=f"Model ID (default: {DEFAULT_MODEL})")
-    p_create.add_argument("--ratio", choices=["16:9", "4:3", "1:1", "3:4", "9:16", "21:9", "adaptive"], help="Aspect ratio")
-    p_create.add_argument("--duration", "-d", type=int, help="Duration in seconds (4-12 for 1.5 Pro)")
-    p_create.add_argument("--resolution", "-r", choices=["480p", "720p", "1080p"], help="Resolution")
-    p_create.add_argument("--seed", type=int, help="Random seed (-1 for random)")
-    p_create.add_argument("--camera-fixed", type=parse_bool, help="Fix camera position (true/false)")
-    p_create.add_argument("--watermark", type=parse_bool, help="Add watermark (true/false)")
-    p_create.add_argument("--generate-audio", type=parse_bool, help="Generate audio (true/false, 1.5 Pro only)")
-    p_create.add_argument("--draft", type=parse_bool, help="Draft/preview mode (true/false, 1.5 Pro only)")
-    p_create.add_argument("--return-last-frame", type=parse_bool, help="Return last frame URL (true/false)")
-    p_create.add_argument("--service-tier", choices=["default", "flex"], help="Service tier")
+    add_create_options(p_create)
     p_create.add_argument("--wait", "-w", action="store_true", help="Wait for completion after creating")
     p_create.add_argument("--interval", type=int, default=15, help="Poll interval in seconds (default: 15)")
     p_create.add_argument("--download", help="Download directory (e.g. ~/Desktop)")
@@ -328,16 +1769,67 @@ def main():
     p_wait.add_argument("--interval", type=int, default=15, help="Poll interval in seconds (default: 15)")
     p_wait.add_argument("--download", help="Download directory (e.g. ~/Desktop)")
 
+    # download
+    p_download = subparsers.add_parser("download", help="Download the video of a finished task")
+    p_download.add_argument("task_id", help="Task ID to download")
+    p_download.add_argument("--output-dir", "-o", default=".", help="Directory to save into (default: current directory)")
+    p_download.add_argument("--parallel", type=int, default=DOWNLOAD_PARTS,
+                            help=f"Max parallel ranges for large files (default: {DOWNLOAD_PARTS})")
+
     # list
     p_list = subparsers.add_parser("list", help="List video generation tasks")
     p_list.add_argument("--status", choices=["queued", "running", "cancelled", "succeeded", "failed", "expired"])
     p_list.add_argument("--page", type=int, default=1)
     p_list.add_argument("--page-size", type=int, default=10)
+    p_list.add_argument("--local", action="store_true", help="Query the local task ledger instead of the API (offline)")
+
+    # stats
+    p_stats = subparsers.add_parser("stats", help="Queue/run latency and usage per model, tier and resolution")
+    p_stats.add_argument("--since", type=parse_age, help="Only tasks created within this window (e.g. 24h, 7d)")
+    p_stats.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    # watch
+    p_watch = subparsers.add_parser("watch", help="Follow all queued/running tasks until they finish")
+    p_watch.add_argument("--download", help="Download each video as soon as it succeeds")
+    p_watch.add_argument("--output", "-o", help="Append a JSONL record per finished task to this file")
+    p_watch.add_argument("--min-interval", type=float, default=5, help="Poll interval while tasks change state (default: 5)")
+    p_watch.add_argument("--max-interval", type=float, default=60, help="Longest poll interval when idle (default: 60)")
+    p_watch.add_argument("--page-size", type=int, default=100, help="Tasks per list page (default: 100)")
+    p_watch.add_argument("--forever", action="store_true", help="Keep watching for new tasks instead of exiting when idle")
 
     # delete
     p_delete = subparsers.add_parser("delete", help="Cancel or delete a task")
     p_delete.add_argument("task_id", help="Task ID to cancel/delete")
 
+    # batch
+    p_batch = subparsers.add_parser("batch", help="Create and track many tasks from a JSONL job file")
+    p_batch.add_argument("jobs", help="JSONL file: one object of create options per line (e.g. {\"prompt\": \"...\"})")
+    add_create_options(p_batch)
+    p_batch.add_argument("--concurrency", "-c", type=int, default=8, help="Parallel requests / pooled connections (default: 8)")
+    p_batch.add_argument("--rps", type=float, default=5, help="Max API requests per second, shared by all workers (default: 5)")
+    p_batch.add_argument("--interval", type=int, default=15, help="Poll interval in seconds (default: 15)")
+    p_batch.add_argument("--output", "-o", help="Write JSONL results to this file (default: stdout)")
+    p_batch.add_argument("--download", help="Download each video as soon as it succeeds")
+    p_batch.add_argument("--no-wait", action="store_true", help="Only create the tasks, do not wait for them")
+
+    # pipeline
+    p_pipe = subparsers.add_parser("pipeline", help="Draft variants in parallel, promote selected drafts to finals")
+    add_create_options(p_pipe)
+    p_pipe.add_argument("--variants", "-k", type=int, help="Number of draft variants (default: 4, or one per prompt/seed given)")
+    p_pipe.add_argument("--prompt-variants", help="File with one prompt per line; drafts cycle through them")
+    p_pipe.add_argument("--seeds", type=int, nargs="+", help="Seeds for the drafts (default: random)")
+    p_pipe.add_argument("--select", default="first:1",
+                        help="Draft selector: first[:N], all, cmd:COMMAND, file:PATH or py:MODULE:FUNC (default: first:1)")
+    p_pipe.add_argument("--select-timeout", type=int, default=3600,
+                        help="Seconds to wait for undecided drafts after all drafts finished (default: 3600)")
+    p_pipe.add_argument("--final-resolution", choices=["480p", "720p", "1080p"], default="720p",
+                        help="Resolution of promoted finals (default: 720p)")
+    p_pipe.add_argument("--concurrency", "-c", type=int, default=8, help="Parallel requests / pooled connections (default: 8)")
+    p_pipe.add_argument("--rps", type=float, default=5, help="Max API requests per second (default: 5)")
+    p_pipe.add_argument("--interval", type=int, default=10, help="Poll interval in seconds (default: 10)")
+    p_pipe.add_argument("--output", "-o", help="Write JSONL records for drafts and finals to this file (default: stdout)")
+    p_pipe.add_argument("--download", help="Download each final video as soon as it succeeds")
+
     args = parser.parse_args()
 
     if not args.command:
@@ -348,10 +1840,19 @@ def main():
         "create": cmd_create,
         "status": cmd_status,
         "wait": cmd_wait,
+        "download": cmd_download,
+        "watch": cmd_watch,
         "list": cmd_list,
+        "stats": cmd_stats,
         "delete": cmd_delete,
+        "batch": cmd_batch,
+        "pipeline": cmd_pipeline,
     }
-    commands[args.command](args)
+    try:
+        commands[args.command](args)
+    except SeedanceError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+"""scripts/multi_agent.py 中调度器与任务存储的测试"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import multi_agent  # noqa: E402
+from multi_agent import SchedulerFull, SpawnScheduler, SQLiteTaskStore, TaskStore  # noqa: E402
+
+
+def _agent(name, model="m1", priority=2):
+    return {"name": name, "model": model, "priority": priority}
+
+
+async def _run_jobs(scheduler, agents, hold=0.02):
+    """每个代理占用一个槽位 hold 秒，返回 (放行顺序, 全局最大并发, 每个模型最大并发)"""
+    order = []
+    peak = {"total": 0}
+    running = {}
+
+    async def job(agent):
+        async with scheduler.slot(agent):
+            order.append(agent["name"])
+            running[agent["model"]] = running.get(agent["model"], 0) + 1
+            peak["total"] = max(peak["total"], sum(running.values()))
+            peak[agent["model"]] = max(peak.get(agent["model"], 0), running[agent["model"]])
+            await asyncio.sleep(hold)
+            running[agent["model"]] -= 1
+
+    await asyncio.gather(*(job(agent) for agent in agents))
+    return order, peak
+
+
+def test_scheduler_respects_session_and_model_limits():
+    scheduler = SpawnScheduler(max_sessions=3, model_limits={"m1": 1}, max_pending=50)
+    agents = [_agent(f"a{i}", model="m1" if i % 2 else "m2") for i in range(10)]
+    _, peak = asyncio.run(_run_jobs(scheduler, agents))
+    assert peak["total"] <= 3
+    assert peak["m1"] == 1
+    assert scheduler._total == 0
+    assert scheduler.running == {"m1": 0, "m2": 0}
+
+
+def test_scheduler_admits_batch_by_priority():
+    scheduler = SpawnScheduler(max_sessions=1, model_limits={}, max_pending=50)
+    agents = [_agent("low", priority=3), _agent("high", priority=1), _agent("mid", priority=2)]
+    order, _ = asyncio.run(_run_jobs(scheduler, agents))
+    assert order == ["high", "mid", "low"]
+
+
+def test_scheduler_skips_saturated_model():
+    # m1 满载时，后提交的 m2 任务不被前面排队的 m1 任务挡住
+    scheduler = SpawnScheduler(max_sessions=2, model_limits={"m1": 1}, max_pending=50)
+    agents = [_agent("m1-a", "m1", 1), _agent("m1-b", "m1", 1), _agent("m2-a", "m2", 2)]
+    order, _ = asyncio.run(_run_jobs(scheduler, agents))
+    assert order == ["m1-a", "m2-a", "m1-b"]
+
+
+def test_scheduler_rejects_when_queue_full():
+    async def main():
+        scheduler = SpawnScheduler(max_sessions=1, model_limits={}, max_pending=2)
+        release = asyncio.Event()
+
+        async def hold(agent):
+            async with scheduler.slot(agent):
+                await release.wait()
+
+        # 第一个占住唯一的槽位，后两个排队
+        holders = []
+        for i in range(3):
+            holders.append(asyncio.ensure_future(hold(_agent(f"a{i}"))))
+            await asyncio.sleep(0.01)
+        assert scheduler._total == 1
+        assert scheduler.pending == 2
+        with pytest.raises(SchedulerFull):
+            await scheduler.acquire(_agent("overflow"))
+        release.set()
+        await asyncio.gather(*holders)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.pending == 0
+    assert scheduler._total == 0
+
+
+def test_scheduler_cancelled_waiter_frees_queue():
+    async def main():
+        scheduler = SpawnScheduler(max_sessions=1, model_limits={}, max_pending=50)
+        release = asyncio.Event()
+
+        async def hold(agent):
+            async with scheduler.slot(agent):
+                await release.wait()
+
+        first = asyncio.ensure_future(hold(_agent("first")))
+        waiter = asyncio.ensure_future(hold(_agent("waiter")))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await first
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler._total == 0
+    assert scheduler.pending == 0
+    assert not scheduler._announced
+
+
+def _sample_tasks():
+    return {
+        "ultrawork_1": {
+            "type": "ultrawork", "status": "completed", "description": "写周报",
+            "started_at": "2026-10-01T10:00:00", "completed_at": "2026-10-01T10:05:00",
+            "subtasks": {
+                "kaifa": {"status": "completed", "session": "s-1",
+                          "started_at": "2026-10-01T10:00:00", "completed_at": "2026-10-01T10:02:00"},
+                "shiyun": {"status": "failed", "error": "排队已满 (0)", "rejected": True},
+            },
+        },
+        "ralph_2": {
+            "type": "ralph_loop", "status": "running", "agent": "kaifa", "description": "修 bug",
+            "started_at": "2026-10-02T09:00:00",
+            "attempts": [
+                {"attempt": 1, "status": "completed", "duration": 30, "completed_at": "2026-10-02T09:01:00"},
+                {"attempt": 2, "status": "running", "session": "s-2"},
+            ],
+        },
+    }
+
+
+@pytest.fixture(params=["journal", "sqlite"])
+def store_factory(request, tmp_path):
+    def make():
+        if request.param == "sqlite":
+            return SQLiteTaskStore(tmp_path / "tasks.db")
+        return TaskStore(tmp_path / "tasks.json", tmp_path / "tasks.journal", tmp_path / "tasks.lock",
+                         compact_threshold=3)
+    return make
+
+
+def test_store_round_trip(store_factory):
+    store = store_factory()
+    tasks = _sample_tasks()
+    for task_id, task in tasks.items():
+        store.put(task_id, task)
+    # 更新已有任务
+    tasks["ralph_2"]["status"] = "completed"
+    store.put("ralph_2", tasks["ralph_2"])
+
+    # 新实例从磁盘重建
+    reopened = store_factory()
+    assert reopened.load() == tasks
+    assert reopened.get("ralph_2")["status"] == "completed"
+    assert reopened.get("missing") is None
+
+
+def test_store_query(store_factory):
+    store = store_factory()
+    for task_id, task in _sample_tasks().items():
+        store.put(task_id, task)
+
+    total, rows = store.query()
+    assert total == 2
+    assert [tid for tid, _ in rows] == ["ralph_2", "ultrawork_1"]
+    assert [tid for tid, _ in store.query(status="completed")[1]] == ["ultrawork_1"]
+    assert [tid for tid, _ in store.query(agent="shiyun")[1]] == ["ultrawork_1"]
+    assert {tid for tid, _ in store.query(agent="kaifa")[1]} == {"ralph_2", "ultrawork_1"}
+    assert [tid for tid, _ in store.query(since="2026-10-02")[1]] == ["ralph_2"]
+    assert store.query(limit=1, offset=1) == (2, [("ultrawork_1", _sample_tasks()["ultrawork_1"])])
+
+
+def test_store_durations_prefer_recent(store_factory):
+    store = store_factory()
+    for i in range(6):
+        store.put(f"ralph_{i}", {
+            "type": "ralph_loop", "status": "completed", "agent": "kaifa",
+            "started_at": f"2026-10-0{i + 1}T00:00:00",
+            "attempts": [{"attempt": 1, "status": "completed", "duration": i,
+                          "completed_at": f"2026-10-0{i + 1}T00:01:00"}],
+        })
+    assert sorted(store.durations("kaifa", limit=3)) == [3, 4, 5]
+    assert store.durations("nobody") == []
+
+
+def test_journal_store_compacts_into_snapshot(tmp_path):
+    store = TaskStore(tmp_path / "tasks.json", tmp_path / "tasks.journal", tmp_path / "tasks.lock",
+                      compact_threshold=3)
+    for i in range(4):
+        store.put(f"t{i}", {"status": "completed", "started_at": f"2026-10-0{i + 1}"})
+    assert (tmp_path / "tasks.json").exists()
+    assert len((tmp_path / "tasks.journal").read_text().splitlines()) == 1
+    assert set(TaskStore(tmp_path / "tasks.json", tmp_path / "tasks.journal",
+                         tmp_path / "tasks.lock").load()) == {"t0", "t1", "t2", "t3"}
+
+
+def test_new_task_id_is_unique_within_a_second(monkeypatch, tmp_path):
+    monkeypatch.setattr(multi_agent, "_task_store", SQLiteTaskStore(tmp_path / "tasks.db"))
+    monkeypatch.setattr(multi_agent.time, "time", lambda: 1700000000.5)
+    ids = [multi_agent.new_task_id("ultrawork") for _ in range(3)]
+    assert len(set(ids)) == 3
+    assert all(task_id.startswith("ultrawork_1700000000") for task_id in ids)
@@ -0,0 +1,108 @@
+"""scripts/multi_agent.py 中 openclaw 输出协议解析的表驱动测试"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import multi_agent  # noqa: E402
+from multi_agent import parse_spawn_output, parse_status_output, parse_status_text  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 单个状态词
+    ("completed", "completed"),
+    ("done", "completed"),
+    ("running", "running"),
+    ("in_progress", "running"),
+    ("failed", "error"),
+    ("cancelled", "error"),
+    ("not_found", "not_found"),
+    ("no such session", "not_found"),
+    # 显式字段优先于自由文本
+    ("status: running (previous run failed)", "running"),
+    ('"state": "completed", "note": "retry after error"', "completed"),
+    ("Session sess-a status=not found", "not_found"),
+    ("status: weird, error elsewhere", "unknown"),
+    # 否定
+    ("not completed", "unknown"),
+    ("the agent is not running", "unknown"),
+    ("no error, still running", "running"),
+    # 自由文本中多个状态词按优先级取舍
+    ("task completed with error", "error"),
+    ("was pending, now done", "completed"),
+    # 不再识别的宽松别名与无法识别的文本
+    ("missing", "unknown"),
+    ("", "unknown"),
+    (None, "unknown"),
+    ("hello world", "unknown"),
+])
+def test_parse_status_text(text, expected):
+    assert parse_status_text(text) == expected
+
+
+@pytest.mark.parametrize("stdout, stderr, key, status", [
+    # JSON
+    ('{"sessionKey": "agent:kaifa:subagent:1", "status": "running"}', "", "agent:kaifa:subagent:1", "running"),
+    ('{"session": {"key": "s-1"}, "status": "queued"}', "", "s-1", "running"),
+    ('{"sessionKey": "s-2", "status": "completed"}', "", "s-2", "completed"),
+    ('{"sessionKey": "s-3"}', "", "s-3", "running"),
+    ('spawning...\n{"session_key": "s-4", "status": "starting"}', "", "s-4", "running"),
+    # 文本
+    ("Spawned session\nsessionKey: agent:kaifa:subagent:abc", "", "agent:kaifa:subagent:abc", "running"),
+    ("ok", "session_key=s-5", "s-5", "running"),
+    # 解析不到 key
+    ('{"error": "quota exceeded"}', "", None, "error"),
+    ("spawn failed", "quota", None, "error"),
+    ("", "", None, "error"),
+])
+def test_parse_spawn_output(stdout, stderr, key, status):
+    result = parse_spawn_output(stdout, stderr)
+    assert result.session_key == key
+    assert result.ok is bool(key)
+    assert result.status == status
+
+
+def _statuses(output, keys):
+    return {key: state.status for key, state in parse_status_output(output, keys).items()}
+
+
+@pytest.mark.parametrize("output, keys, expected", [
+    # JSON：sessions 列表 / 裸列表 / key → 状态映射 / 单个对象
+    (json.dumps({"sessions": [{"sessionKey": "a", "status": "running"},
+                              {"sessionKey": "b", "status": "completed"}]}),
+     ["a", "b"], {"a": "running", "b": "completed"}),
+    (json.dumps([{"key": "a", "state": "failed"}]), ["a"], {"a": "error"}),
+    (json.dumps({"a": "done", "b": "not_found"}), ["a", "b"], {"a": "completed", "b": "not_found"}),
+    (json.dumps({"sessionKey": "a", "status": "pending"}), ["a"], {"a": "running"}),
+    (json.dumps({"sessions": [{"sessionKey": "a", "found": False}]}), ["a"], {"a": "not_found"}),
+    (json.dumps({"sessions": [{"sessionKey": "a", "status": "not completed"}]}), ["a"], {"a": "unknown"}),
+    # 文本：逐行 "key: status"
+    ("a: running\nb: completed\n", ["a", "b"], {"a": "running", "b": "completed"}),
+    ("a: not found\n", ["a"], {"a": "not_found"}),
+    # key 中的状态词不参与判定；长 key 优先，不被前缀截断
+    ("sess-error-1: running\n", ["sess-error-1"], {"sess-error-1": "running"}),
+    ("s-10: completed\ns-1: running\n", ["s-1", "s-10"], {"s-1": "running", "s-10": "completed"}),
+    # 带状态字段的自由文本
+    ("Session a (last attempt failed) status: running\n", ["a"], {"a": "running"}),
+    # 单个会话、输出里找不到 key 时整段当作状态文本
+    ("Status: completed", ["a"], {"a": "completed"}),
+    # 输出中缺席的会话不出现在结果里
+    ("a: running\n", ["a", "b"], {"a": "running"}),
+])
+def test_parse_status_output(output, keys, expected):
+    assert _statuses(output, keys) == expected
+
+
+@pytest.mark.parametrize("keys, stdout, stderr, expected", [
+    (["a"], "", "error: no such session: a", {"a": "not_found"}),
+    (["a"], "", "error: session not found", {"a": "not_found"}),
+    (["a"], "", "error: gateway unavailable", {}),
+    (["a", "b"], "", "error: no such session: a", {}),
+])
+def test_failed_status(keys, stdout, stderr, expected):
+    parsed = multi_agent._failed_status(keys, stdout, stderr)
+    assert {key: state.status for key, state in parsed.items()} == expected
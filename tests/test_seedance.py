@@ -0,0 +1,284 @@
+"""Stub-server tests for the Seedance client: retries, idempotent creates and batch failure handling."""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "skills" / "seedance-video-generation"))
+
+import seedance  # noqa: E402
+
+TASKS_PATH = "/api/v3/contents/generations/tasks"
+HTML = b"<html><body>502 gateway</body></html>"
+
+
+class StubArk:
+    """In-process stand-in for the Ark task API.
+
+    `post_faults` / `get_faults` are consumed one per request and decide how
+    that request is answered:
+      None      normal behaviour
+      429, 503  error before anything happens (the create is not applied)
+      "502"     apply the create, then answer 502
+      "html"    apply the create (POST), then answer 200 with an HTML page
+      "drop"    apply the create, then close the connection without a reply
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.requests = []
+        self.post_faults = []
+        self.get_faults = []
+        self.task_status = "succeeded"
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.requests.append(("POST", self.path, dict(self.headers), raw))
+                    fault = stub.post_faults.pop(0) if stub.post_faults else None
+                    if fault in (429, 503):
+                        return self.send(fault, {"error": {"message": "try later"}})
+                    body = json.loads(raw)
+                    task_id = f"cgt-{len(stub.tasks) + 1}"
+                    task = {"id": task_id, "model": body["model"], "seed": body.get("seed"),
+                            "status": "queued", "created_at": int(time.time())}
+                    draft = next((c["draft_task"] for c in body["content"] if c.get("type") == "draft_task"), None)
+                    if draft:
+                        task["draft_task"] = draft
+                    stub.tasks[task_id] = task
+                if fault == "502":
+                    return self.send(502, {"error": {"message": "bad gateway"}})
+                if fault == "html":
+                    return self.send(200, HTML, "text/html")
+                if fault == "drop":
+                    self.close_connection = True
+                    return
+                self.send(200, {"id": task_id})
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with stub.lock:
+                    stub.requests.append(("GET", self.path, dict(self.headers), b""))
+                    fault = stub.get_faults.pop(0) if stub.get_faults else None
+                if fault in (429, 503):
+                    return self.send(fault, {"error": {"message": "try later"}})
+                if fault == "html":
+                    return self.send(200, HTML, "text/html")
+                if parts.path == TASKS_PATH:
+                    query = parse_qs(parts.query)
+                    items = list(reversed(stub.tasks.values()))
+                    size = int(query.get("page_size", ["10"])[0])
+                    return self.send(200, {"items": items[:size], "total": len(items)})
+                task = stub.tasks.get(parts.path.rsplit("/", 1)[-1])
+                if task is None:
+                    return self.send(404, {"error": {"message": "not found"}})
+                result = dict(task, status=stub.task_status)
+                if stub.task_status == "succeeded":
+                    result["content"] = {"video_url": f"http://127.0.0.1/{task['id']}.mp4"}
+                self.send(200, result)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}{TASKS_PATH}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def posts(self):
+        return [r for r in self.requests if r[0] == "POST"]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def ark(monkeypatch):
+    stub = StubArk()
+    monkeypatch.setenv("ARK_API_KEY", "test-key")
+    monkeypatch.setattr(seedance, "BASE_URL", stub.url)
+    monkeypatch.setattr(seedance, "_pool", seedance.ConnectionPool(stub.url))
+    monkeypatch.setattr(seedance, "_rate_limiter", seedance.TokenBucket())
+    monkeypatch.setattr(seedance, "_ledger", seedance.Ledger("0"))
+    monkeypatch.setattr(seedance, "_claimed_task_ids", set())
+    monkeypatch.setattr(seedance, "_backoff", lambda attempt: 0)
+    monkeypatch.setattr(seedance, "API_RETRIES", 3)
+    yield stub
+    stub.close()
+
+
+def create_body(prompt="a cat", **extra):
+    return dict({"model": seedance.DEFAULT_MODEL, "content": [{"type": "text", "text": prompt}]}, **extra)
+
+
+# ---- api_request retries ----
+
+def test_get_retries_transient_errors(ark):
+    ark.tasks["cgt-1"] = {"id": "cgt-1", "model": "m", "status": "running", "created_at": 0}
+    ark.get_faults = [503, 429, "html"]
+    assert seedance.api_request("GET", f"{ark.url}/cgt-1")["id"] == "cgt-1"
+    assert len(ark.requests) == 4
+
+
+def test_get_gives_up_after_retries(ark):
+    ark.get_faults = [503] * 10
+    with pytest.raises(seedance.ApiError) as excinfo:
+        seedance.api_request("GET", f"{ark.url}/cgt-1")
+    assert excinfo.value.code == 503
+    assert len(ark.requests) == 1 + seedance.API_RETRIES
+
+
+def test_non_json_success_body_is_api_error(ark):
+    ark.get_faults = ["html"] * 10
+    with pytest.raises(seedance.ApiError, match="Invalid API response"):
+        seedance.api_request("GET", f"{ark.url}/cgt-1")
+
+
+def test_client_errors_are_not_retried(ark):
+    with pytest.raises(seedance.ApiError) as excinfo:
+        seedance.api_request("GET", f"{ark.url}/missing")
+    assert excinfo.value.code == 404
+    assert len(ark.requests) == 1
+
+
+# ---- idempotent creates ----
+
+def test_post_resent_after_429_with_same_idempotency_key(ark):
+    ark.post_faults = [429]
+    result = seedance.create_task(create_body())
+    assert result["id"] == "cgt-1"
+    posts = ark.posts()
+    assert len(posts) == 2
+    assert posts[0][2]["Idempotency-Key"] == posts[1][2]["Idempotency-Key"]
+
+
+@pytest.mark.parametrize("fault", ["502", "html", "drop"])
+def test_ambiguous_create_is_recovered_not_duplicated(ark, fault):
+    ark.post_faults = [fault]
+    result = seedance.create_task(create_body())
+    assert result == {"id": "cgt-1", "recovered": True}
+    assert len(ark.posts()) == 1
+    assert len(ark.tasks) == 1
+
+
+def test_ambiguous_create_without_lookup_is_not_resent(ark):
+    ark.post_faults = ["502"]
+    with pytest.raises(seedance.ApiError, match="may have been applied"):
+        seedance.api_request("POST", ark.url, create_body())
+    assert len(ark.posts()) == 1
+
+
+def test_post_on_dropped_keepalive_connection_is_not_resent(ark):
+    seedance.api_request("POST", ark.url, create_body())
+    ark.post_faults = ["drop"]
+    with pytest.raises(seedance.ApiError, match="may have been applied"):
+        seedance.api_request("POST", ark.url, create_body("a dog"))
+    assert len(ark.posts()) == 2
+    assert len(ark.tasks) == 2
+
+
+def test_ambiguous_draft_promotion_is_recovered_by_draft_id(ark):
+    draft = seedance.create_task(create_body(draft=True))["id"]
+    ark.post_faults = ["502"]
+    body = {"model": seedance.DEFAULT_MODEL, "content": [{"type": "draft_task", "draft_task": {"id": draft}}]}
+    result = seedance.create_task(body)
+    assert result == {"id": "cgt-2", "recovered": True}
+    assert len(ark.posts()) == 2
+
+
+def test_concurrent_identical_creates_get_distinct_tasks(ark):
+    ark.post_faults = ["502", "502"]
+    first = seedance.create_task(create_body())
+    second = seedance.create_task(create_body())
+    assert {first["id"], second["id"]} == {"cgt-1", "cgt-2"}
+    assert len(ark.posts()) == 2
+
+
+# ---- cmd_batch ----
+
+def run_batch(monkeypatch, tmp_path, jobs, *extra):
+    jobs_file = tmp_path / "jobs.jsonl"
+    jobs_file.write_text("".join(json.dumps(job) + "\n" for job in jobs))
+    out = tmp_path / "out.jsonl"
+    monkeypatch.setattr(sys, "argv", ["seedance.py", "batch", str(jobs_file), "--output", str(out),
+                                      "--concurrency", "1", "--rps", "0", "--interval", "1", *extra])
+    code = 0
+    try:
+        seedance.main()
+    except SystemExit as e:
+        code = e.code
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    return code, {record["name"]: record for record in records}
+
+
+def test_batch_records_every_created_task_despite_html_reply(ark, monkeypatch, tmp_path):
+    ark.post_faults = [None, "html", None]
+    jobs = [{"name": name, "prompt": name} for name in ("a", "b", "c")]
+    code, records = run_batch(monkeypatch, tmp_path, jobs, "--no-wait")
+    assert code == 0
+    assert {name: r["status"] for name, r in records.items()} == {"a": "created", "b": "created", "c": "created"}
+    assert sorted(r["task_id"] for r in records.values()) == ["cgt-1", "cgt-2", "cgt-3"]
+    assert len(ark.posts()) == 3
+
+
+def test_batch_records_create_failures_and_continues(ark, monkeypatch, tmp_path):
+    monkeypatch.setattr(seedance, "API_RETRIES", 0)
+    ark.post_faults = [None, 503, None]
+    jobs = [{"name": name, "prompt": name} for name in ("a", "b", "c")]
+    code, records = run_batch(monkeypatch, tmp_path, jobs, "--no-wait")
+    assert code == 1
+    assert records["b"]["status"] == "create_failed"
+    assert "503" in records["b"]["error"]
+    assert records["a"]["status"] == records["c"]["status"] == "created"
+
+
+def test_batch_contains_unexpected_create_errors(ark, monkeypatch, tmp_path):
+    real_create = seedance.create_task
+
+    def flaky_create(body):
+        if body["content"][0]["text"] == "boom":
+            raise ValueError("unexpected")
+        return real_create(body)
+
+    monkeypatch.setattr(seedance, "create_task", flaky_create)
+    jobs = [{"name": "ok", "prompt": "fine"}, {"name": "bad", "prompt": "boom"}]
+    code, records = run_batch(monkeypatch, tmp_path, jobs, "--no-wait")
+    assert code == 1
+    assert (records["bad"]["status"], records["bad"]["error"]) == ("create_failed", "unexpected")
+    assert records["ok"]["status"] == "created"
+
+
+def test_batch_waits_and_reports_final_status(ark, monkeypatch, tmp_path):
+    code, records = run_batch(monkeypatch, tmp_path, [{"name": "a", "prompt": "a"}])
+    assert code == 0
+    assert records["a"]["status"] == "succeeded"
+    assert records["a"]["video_url"].endswith("cgt-1.mp4")
+
+
+def test_batch_records_poll_failures(ark, monkeypatch, tmp_path):
+    monkeypatch.setattr(seedance, "API_RETRIES", 0)
+    monkeypatch.setattr(seedance, "MAX_POLL_ERRORS", 2)
+    ark.get_faults = ["html"] * 10
+    code, records = run_batch(monkeypatch, tmp_path, [{"name": "a", "prompt": "a"}])
+    assert code == 1
+    assert records["a"]["status"] == "poll_failed"
+    assert records["a"]["task_id"] == "cgt-1"